@@ -1,10 +1,13 @@
-from flask import Flask
+from flask import Flask, request, jsonify
 from app.routes import main
 import os
-from app.db import init_db
+import time
+from app.db import init_db, close_db, DatabaseUnavailable
+from app.config import Config
 
 
 def create_app():
+    started = time.monotonic()
     app = Flask(
         __name__,
         template_folder=os.path.join(os.path.dirname(__file__), "..", "templates"),
@@ -42,7 +45,16 @@ def create_app():
     @login_manager.user_loader
     def load_user(user_id):
         from app.user import User
-        return User.get(int(user_id))
+        return User.get_cached(int(user_id))
+
+    # Profile pictures: {{ avatar(...) }} in templates/_avatar.html
+    from app.avatars import avatar_sources
+    app.jinja_env.globals["avatar_sources"] = avatar_sources
+
+    # Fingerprinted CSS/JS: {{ asset_url('css/app.css') }} (scripts/build_assets.py)
+    from app.assets import asset_url, load_manifest
+    load_manifest()
+    app.jinja_env.globals["asset_url"] = asset_url
 
     app.register_blueprint(main)
     
@@ -51,9 +63,42 @@ def create_app():
 
     from app.api import api as api_blueprint
     app.register_blueprint(api_blueprint, url_prefix='/api')
-   
 
-    # Initialize the database
-    # Initialize the database
-    init_db()
+    # On-demand CPU sampling, tracemalloc snapshots and request cProfiles for admins
+    if Config.PROFILING_ENABLED:
+        from app.diagnostics import diagnostics as diagnostics_blueprint
+        app.register_blueprint(diagnostics_blueprint, url_prefix='/admin/profile')
+
+    # Prometheus metrics; registered first so its after_request hook runs last
+    from app.metrics import init_metrics
+    init_metrics(app)
+
+    # Per-request query profile and Server-Timing for admins (X-Profile: 1)
+    from app.profiler import init_profiler
+    init_profiler(app)
+
+    # gzip/br/zstd for HTML and JSON, including streamed responses
+    from app.compression import init_compression
+    init_compression(app)
+
+    # Return the request's pooled DB connection once the request is done
+    app.teardown_appcontext(close_db)
+
+    @app.errorhandler(DatabaseUnavailable)
+    def database_unavailable(err):
+        # Fail fast instead of tying up a gunicorn thread while MySQL is down
+        if request.path.startswith('/api/'):
+            response = jsonify({"error": "Database temporarily unavailable"})
+        else:
+            response = app.response_class("Service temporarily unavailable. Please retry shortly.", mimetype="text/plain")
+        response.status_code = 503
+        response.headers['Retry-After'] = str(err.retry_after)
+        return response
+
+    # Check (and if needed migrate) the schema: one query when it is current
+    db_started = time.monotonic()
+    schema_version = init_db()
+    db_ms = (time.monotonic() - db_started) * 1000
+    schema = "not checked" if schema_version is None else f"v{schema_version}, checked in {db_ms:.0f} ms"
+    print(f"App ready in {(time.monotonic() - started) * 1000:.0f} ms (schema {schema})")
     return app
@@ -1,8 +1,25 @@
-from flask import jsonify, request, abort, current_app
+from flask import jsonify, request, abort, current_app, url_for
 from app.api import api
 from app.user import User
 from app.db import get_db_connection
+from app.config import Config
+from app.batch import run_note_batch
+from app.notes import (fetch_note_page, parse_limit, NoteStream, touch_collection, collection_version,
+                       fetch_changes, parse_change_cursor, CursorExpired)
+from app.search import build_search_text
+from app.stats import apply_note_delta, get_note_stats
+from app.tags import set_note_tags
+from app.sanitize import render_note_html, SANITIZER_VERSION
 from functools import wraps
+from datetime import timezone
+import hashlib
+from collections import Counter
+from mysql.connector import Error
+
+# Columns returned by the API (search_text is an internal index column);
+# descriptions and examples are their stored sanitized HTML
+NOTE_FIELDS = ("id, command, description_html AS description, category, example_html AS example, tags, "
+               "user_id, is_public, public_id, created_at, updated_at")
 
 def require_api_key(f):
     @wraps(f)
@@ -21,40 +38,131 @@ def require_api_key(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def _validators(etag, modified_at):
+    """Answer a conditional GET with 304 before any note is read; returns the response or None"""
+    last_modified = modified_at.replace(tzinfo=timezone.utc) if modified_at else None
+    if request.if_none_match:
+        # Weak comparison: compressed responses carry W/ ETags
+        fresh = request.if_none_match.contains_weak(etag)
+    else:
+        since = request.if_modified_since
+        fresh = bool(since and last_modified and last_modified <= since)
+    if not fresh:
+        return None
+    response = current_app.response_class(status=304)
+    _set_validators(response, etag, modified_at)
+    return response
+
+def _set_validators(response, etag, modified_at):
+    response.set_etag(etag)
+    if modified_at:
+        response.last_modified = modified_at.replace(tzinfo=timezone.utc)
+    # Clients may keep the body but must revalidate it on every poll
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
 @api.route('/notes', methods=['GET'])
 @require_api_key
 def get_notes():
-    """Get all notes for the authenticated user"""
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
-    
+    """Get the authenticated user's notes, one page at a time (newest first)"""
     # Optional filtering
     category = request.args.get('category')
     search = request.args.get('search')
-    
-    query = "SELECT * FROM notes WHERE user_id = %s"
-    params = [request.user.id]
+    tag = request.args.get('tag')
 
-    if category:
-        query += " AND category = %s"
-        params.append(category)
-        
-    if search:
-        query += " AND (command LIKE %s OR description LIKE %s OR tags LIKE %s)"
-        search_term = f"%{search}%"
-        params.extend([search_term, search_term, search_term])
-        
-    query += " ORDER BY id DESC"
-    
-    cursor.execute(query, tuple(params))
-    notes = cursor.fetchall()
-    
-    cursor.close()
-    conn.close()
-    
-    return jsonify({
+    try:
+        limit = parse_limit(request.args.get('limit'))
+    except ValueError:
+        return jsonify({"error": "limit must be a positive integer"}), 400
+
+    # Every note write bumps the collection version, so the page is unchanged
+    # while it (and the query) is; check that before reading any note
+    version, modified_at = collection_version(request.user.id)
+    query = "&".join(f"{k}={v}" for k, v in sorted(request.args.items(multi=True)))
+    etag = f"{version}-" + hashlib.sha256(query.encode()).hexdigest()[:16]
+    not_modified = _validators(etag, modified_at)
+    if not_modified:
+        return not_modified
+
+    # Keyset pagination; searches are ranked by relevance (see app/search.py)
+    try:
+        notes, next_cursor = fetch_note_page(
+            request.user.id,
+            limit,
+            after=request.args.get('after'),
+            category=category,
+            search=search,
+            tag=tag,
+            fields=NOTE_FIELDS,
+        )
+    except ValueError:
+        return jsonify({"error": "Invalid cursor"}), 400
+
+    response = jsonify({
         "count": len(notes),
-        "notes": notes
+        "notes": notes,
+        "next_cursor": next_cursor
+    })
+    if next_cursor:
+        args = request.args.to_dict()
+        args.update(limit=limit, after=next_cursor)
+        response.headers['Link'] = f'<{url_for("api.get_notes", **args)}>; rel="next"'
+    return _set_validators(response, etag, modified_at)
+
+def _ndjson_chunks(batches, dumps):
+    for rows in batches:
+        yield "".join(dumps(row) + "\n" for row in rows).encode()
+
+def _json_array_chunks(batches, dumps):
+    yield b'{"notes": ['
+    first = True
+    for rows in batches:
+        chunk = ",\n".join(dumps(row) for row in rows)
+        yield (chunk if first else ",\n" + chunk).encode()
+        first = False
+    yield b"]}\n"
+
+@api.route('/notes/export', methods=['GET'])
+@require_api_key
+def export_notes():
+    """Stream all of the user's notes (oldest first) as NDJSON or a JSON array"""
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in ('ndjson', 'json'):
+        return jsonify({"error": "format must be 'ndjson' or 'json'"}), 400
+
+    stream = NoteStream(request.user.id, fields=NOTE_FIELDS)
+    dumps = current_app.json.dumps
+    if fmt == 'ndjson':
+        body, mimetype = _ndjson_chunks(stream, dumps), 'application/x-ndjson'
+    else:
+        body, mimetype = _json_array_chunks(stream, dumps), 'application/json'
+
+    # Compressed chunk by chunk as rows stream (app/compression.py)
+    response = current_app.response_class(body, mimetype=mimetype)
+    response.call_on_close(stream.close)
+    response.headers['Content-Disposition'] = f'attachment; filename=notes.{fmt}'
+    return response
+
+@api.route('/notes/changes', methods=['GET'])
+@require_api_key
+def get_note_changes():
+    """Delta sync: notes written and ids deleted since ``since`` (omit it for a full sync)"""
+    try:
+        limit = parse_limit(request.args.get('limit'))
+        since = parse_change_cursor(request.args.get('since'))
+    except ValueError:
+        return jsonify({"error": "Invalid limit or cursor"}), 400
+
+    try:
+        notes, deleted, next_cursor, has_more = fetch_changes(request.user.id, since, limit, fields=NOTE_FIELDS)
+    except CursorExpired:
+        return jsonify({"error": "Cursor expired; resync without 'since'"}), 410
+
+    return jsonify({
+        "notes": notes,
+        "deleted": deleted,
+        "next_cursor": next_cursor,
+        "has_more": has_more
     })
 
 @api.route('/notes/<int:id>', methods=['GET'])
@@ -63,8 +171,23 @@ def get_note(id):
     """Get a specific note"""
     conn = get_db_connection()
     cursor = conn.cursor(dictionary=True)
-    
-    cursor.execute("SELECT * FROM notes WHERE id = %s AND user_id = %s", (id, request.user.id))
+
+    # Cheap probe first: a client holding the current version gets a 304
+    cursor.execute("SELECT version, updated_at FROM notes WHERE id = %s AND user_id = %s", (id, request.user.id))
+    probe = cursor.fetchone()
+    if not probe:
+        cursor.close()
+        conn.close()
+        return jsonify({"error": "Note not found"}), 404
+
+    etag = f"{id}-{probe['version']}"
+    not_modified = _validators(etag, probe['updated_at'])
+    if not_modified:
+        cursor.close()
+        conn.close()
+        return not_modified
+
+    cursor.execute(f"SELECT {NOTE_FIELDS} FROM notes WHERE id = %s AND user_id = %s", (id, request.user.id))
     note = cursor.fetchone()
     
     cursor.close()
@@ -73,7 +196,7 @@ def get_note(id):
     if not note:
         return jsonify({"error": "Note not found"}), 404
         
-    return jsonify(note)
+    return _set_validators(jsonify(note), etag, probe['updated_at'])
 
 @api.route('/notes', methods=['POST'])
 @require_api_key
@@ -90,16 +213,26 @@ def create_note():
     example = data.get('example', '')
     tags = data.get('tags', '')
     
+    description_html, example_html = render_note_html(description, example)
+
     conn = get_db_connection()
     cursor = conn.cursor()
     
     try:
+        seq = touch_collection(cursor, request.user.id)
         cursor.execute(
-            "INSERT INTO notes (command, description, category, example, tags, user_id) VALUES (%s, %s, %s, %s, %s, %s)",
-            (command, description, category, example, tags, request.user.id)
+            """
+            INSERT INTO notes (command, description, description_html, category, example, example_html, tags,
+                               user_id, search_text, sanitizer_version, change_seq)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            """,
+            (command, description, description_html, category, example, example_html, tags, request.user.id,
+             build_search_text(command, description_html, example_html, tags), SANITIZER_VERSION, seq)
         )
-        conn.commit()
         note_id = cursor.lastrowid
+        set_note_tags(cursor, note_id, request.user.id, tags)
+        apply_note_delta(cursor, request.user.id, new=(category, tags))
+        conn.commit()
     except Exception as e:
         conn.rollback()
         return jsonify({"error": str(e)}), 500
@@ -113,6 +246,31 @@ def create_note():
         "location": f"/api/notes/{note_id}"
     }), 201
 
+@api.route('/notes/batch', methods=['POST'])
+@require_api_key
+def batch_notes():
+    """Create, update and delete many notes in one transaction"""
+    data = request.get_json(silent=True)
+    operations = data.get('operations') if isinstance(data, dict) else None
+    if not isinstance(operations, list) or not operations:
+        return jsonify({"error": "Body must be {\"operations\": [...]}"}), 400
+    if len(operations) > Config.API_BATCH_MAX:
+        return jsonify({"error": f"At most {Config.API_BATCH_MAX} operations per batch"}), 413
+
+    try:
+        results = run_note_batch(request.user.id, operations)
+    except Error as e:
+        return jsonify({"error": str(e)}), 500
+
+    counts = Counter(result["status"] for result in results)
+    return jsonify({
+        "created": counts["created"],
+        "updated": counts["updated"],
+        "deleted": counts["deleted"],
+        "errors": counts["error"],
+        "results": results
+    })
+
 @api.route('/categories', methods=['GET'])
 @require_api_key
 def get_categories():
@@ -128,6 +286,23 @@ def get_categories():
     
     return jsonify({"categories": categories})
 
+@api.route('/tags', methods=['GET'])
+@require_api_key
+def get_tags():
+    """Get the user's most used tags with their note counts (served from the dashboard counters)"""
+    try:
+        limit = parse_limit(request.args.get('limit'))
+    except ValueError:
+        return jsonify({"error": "limit must be a positive integer"}), 400
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    _, _, tags = get_note_stats(cursor, request.user.id, top_tags=limit)
+    cursor.close()
+    conn.close()
+
+    return jsonify({"tags": [{"name": name, "count": count} for name, count in tags]})
+
 @api.route('/health', methods=['GET'])
 def health_check():
     """Public health check endpoint"""
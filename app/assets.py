@@ -0,0 +1,34 @@
+import json
+import os
+from flask import url_for
+
+# Fingerprinted static assets (scripts/build_assets.py).
+#
+# ``asset_url("css/app.css")`` resolves a static file to its content-hashed
+# copy under static/dist, which nginx serves with an ``immutable``
+# Cache-Control. Without a build (local development) it falls back to the
+# plain ``url_for("static", ...)`` URL.
+
+MANIFEST_PATH = os.path.join(os.path.dirname(__file__), "..", "static", "dist", "manifest.json")
+
+_manifest = None
+
+
+def load_manifest():
+    global _manifest
+    try:
+        with open(MANIFEST_PATH) as f:
+            _manifest = json.load(f)
+    except FileNotFoundError:
+        _manifest = {}
+    return _manifest
+
+
+def asset_url(filename):
+    """url_for("static", filename=...) for the built copy of a static file"""
+    if _manifest is None:
+        load_manifest()
+    built = _manifest.get(filename)
+    if built is None:
+        return url_for("static", filename=filename)
+    return url_for("static", filename="dist/" + built)
@@ -0,0 +1,16 @@
+from functools import wraps
+from flask import request, abort
+from flask_login import current_user
+from app.user import User
+
+
+def admin_required(f):
+    """Admins only (users.role = 'admin'), by X-API-Token or session; everyone else gets a 404"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        token = request.headers.get('X-API-Token')
+        user = User.get_by_token(token) if token else (current_user if current_user.is_authenticated else None)
+        if user is None or user.role != 'admin':
+            abort(404)
+        return f(*args, **kwargs)
+    return decorated_function
@@ -5,15 +5,16 @@ from app.auth.forms import LoginForm, RegisterForm, ForgotPasswordForm, ResetPas
 from app.user import User
 import secrets
 import os
-from werkzeug.utils import secure_filename
 from app.db import get_db_connection
+from app.public import bump_author_versions
+from app.avatars import save_avatar, InvalidImage
 from werkzeug.security import generate_password_hash
 from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
-import smtplib
 from email.message import EmailMessage
+from app.mail import send_mail
 
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
-ALLOWED_MIME_TYPES = {'image/png', 'image/jpeg', 'image/gif'}
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
+ALLOWED_MIME_TYPES = {'image/png', 'image/jpeg', 'image/gif', 'image/webp'}
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -34,16 +35,6 @@ def is_valid_upload(file_obj):
     max_bytes = current_app.config.get('MAX_CONTENT_LENGTH', 2 * 1024 * 1024)
     return get_file_size(file_obj) <= max_bytes
 
-def _get_mail_config():
-    return {
-        "host": os.environ.get("SMTP_HOST", "smtp.gmail.com"),
-        "port": int(os.environ.get("SMTP_PORT", "587")),
-        "user": os.environ.get("SMTP_USER", ""),
-        "password": os.environ.get("SMTP_PASSWORD", ""),
-        "sender": os.environ.get("SMTP_SENDER", ""),
-        "use_tls": os.environ.get("SMTP_USE_TLS", "true").lower() in ("1", "true", "yes", "on"),
-    }
-
 def _get_reset_serializer():
     return URLSafeTimedSerializer(current_app.config["SECRET_KEY"])
 
@@ -59,13 +50,9 @@ def verify_reset_token(token, max_age_seconds):
         return None
 
 def send_reset_email(to_email, reset_url):
-    cfg = _get_mail_config()
-    if not cfg["sender"]:
-        cfg["sender"] = cfg["user"]
-
+    """Queue the reset link for background delivery (app/mail.py)"""
     msg = EmailMessage()
     msg["Subject"] = "Reset your DNotes password"
-    msg["From"] = cfg["sender"]
     msg["To"] = to_email
     msg.set_content(
         "You requested a password reset for DNotes.\n\n"
@@ -73,12 +60,7 @@ def send_reset_email(to_email, reset_url):
         "If you did not request this, you can ignore this email."
     )
 
-    with smtplib.SMTP(cfg["host"], cfg["port"]) as smtp:
-        if cfg["use_tls"]:
-            smtp.starttls()
-        if cfg["user"] and cfg["password"]:
-            smtp.login(cfg["user"], cfg["password"])
-        smtp.send_message(msg)
+    return send_mail(msg)
 
 @auth.route('/settings', methods=['GET', 'POST'])
 @login_required
@@ -100,30 +82,18 @@ def settings():
             conn.close()
             return render_template('settings.html', categories=categories)
         
-        # Handle profile picture upload
+        # Handle profile picture upload. The previous picture's files are
+        # left to scripts/avatars.py gc: another user may share them.
         new_profile_pic = current_user.profile_picture  # Keep existing if no new upload
         if profile_pic and profile_pic.filename:
             if is_valid_upload(profile_pic):
-                # Create uploads directory if it doesn't exist
-                upload_folder = os.path.join(current_app.static_folder, 'uploads')
-                os.makedirs(upload_folder, exist_ok=True)
-                
-                # Generate unique filename
-                ext = profile_pic.filename.rsplit('.', 1)[1].lower()
-                filename = secure_filename(f"user_{current_user.id}.{ext}")
-                filepath = os.path.join(upload_folder, filename)
-                
-                # Delete old profile picture if it exists and is different
-                if current_user.profile_picture:
-                    old_path = os.path.join(upload_folder, current_user.profile_picture)
-                    if os.path.exists(old_path) and current_user.profile_picture != filename:
-                        os.remove(old_path)
-                
-                # Save new picture
-                profile_pic.save(filepath)
-                new_profile_pic = filename
+                try:
+                    new_profile_pic = save_avatar(profile_pic.stream)
+                except InvalidImage as e:
+                    current_app.logger.info(f"Rejected profile picture of user {current_user.id}: {e}")
+                    flash('Could not read that image. Use a PNG/JPG/GIF/WebP file.', 'danger')
             else:
-                flash('Invalid file. Use PNG/JPG/GIF under the upload size limit.', 'danger')
+                flash('Invalid file. Use PNG/JPG/GIF/WebP under the upload size limit.', 'danger')
         
         # Update database
         cursor.execute("""
@@ -131,7 +101,10 @@ def settings():
             SET username = %s, bio = %s, profile_picture = %s 
             WHERE id = %s
         """, (display_name, bio, new_profile_pic, current_user.id))
+        # Shared pages show the author's name and picture
+        bump_author_versions(cursor, current_user.id)
         conn.commit()
+        User.invalidate(current_user.id)
         
         flash('Profile updated successfully!', 'success')
         cursor.close()
@@ -154,14 +127,19 @@ def profile():
 @login_required
 def regenerate_token():
     token = secrets.token_hex(16)
+    User.set_api_token(current_user.id, current_user.api_token_hash, token)
+    # Only the digest is stored, so the plaintext is shown exactly once, in
+    # this response (never in the session cookie)
     conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("UPDATE users SET api_token = %s WHERE id = %s", (token, current_user.id))
-    conn.commit()
+    cursor = conn.cursor(dictionary=True)
+    cursor.execute("SELECT * FROM categories ORDER BY is_system DESC, name ASC")
+    categories = cursor.fetchall()
     cursor.close()
     conn.close()
-    flash('New API Token generated!', 'success')
-    return redirect(url_for('auth.settings'))
+    flash('New API Token generated! Copy it now, it will not be shown again.', 'success')
+    response = current_app.make_response(render_template('settings.html', categories=categories, new_api_token=token))
+    response.headers['Cache-Control'] = 'no-store'
+    return response
 
 @auth.route('/login', methods=['GET', 'POST'])
 def login():
@@ -207,14 +185,12 @@ def forgot_password():
     form = ForgotPasswordForm()
     if form.validate_on_submit():
         user = User.get_by_email(form.email.data)
-        # Always show success to avoid account enumeration
+        # Always show success to avoid account enumeration. The email is only
+        # queued, so known and unknown addresses take the same time to answer.
         if user:
             token = generate_reset_token(user.email)
             reset_url = url_for('auth.reset_password', token=token, _external=True)
-            try:
-                send_reset_email(user.email, reset_url)
-            except Exception as e:
-                current_app.logger.error(f"Password reset email failed: {e}")
+            send_reset_email(user.email, reset_url)
 
         flash('If that email is registered, a reset link has been sent.', 'info')
         return redirect(url_for('auth.login'))
@@ -239,6 +215,9 @@ def reset_password(token):
         password_hash = generate_password_hash(form.password.data)
         cursor.execute("UPDATE users SET password_hash = %s WHERE email = %s", (password_hash, email))
         conn.commit()
+        user = User.get_by_email(email)
+        if user:
+            User.invalidate(user.id)
         cursor.close()
         conn.close()
         flash('Your password has been updated. You can now log in.', 'success')
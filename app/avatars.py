@@ -0,0 +1,165 @@
+import hashlib
+import io
+import os
+import time
+from flask import url_for
+from PIL import Image, ImageOps
+
+# Profile pictures.
+#
+# Uploads are decoded, validated, cropped to a square and re-encoded as a few
+# fixed-size WebP and JPEG renditions under static/uploads/avatars, named
+# ``<hash>-<size>.<ext>`` after the hash of all renditions. A user's
+# ``profile_picture`` stores the key ``avatars/<hash>``; since a name never
+# changes content, /avatars/<file> is served with a year-long ``immutable``
+# Cache-Control. Files no user references any more are deleted by
+# ``collect_garbage`` (scripts/avatars.py gc), not when a picture is replaced,
+# so an upload is never raced by a delete of identical content.
+#
+# Values without the prefix are pictures uploaded before this pipeline
+# (``user_<id>.<ext>`` originals); they are served as before until
+# ``scripts/avatars.py convert`` re-encodes them.
+
+UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), "..", "static", "uploads")
+AVATAR_FOLDER = os.path.join(UPLOAD_FOLDER, "avatars")
+AVATAR_PREFIX = "avatars/"
+
+# Rendered at 36-80 CSS px; covers 1x and 2x screens
+AVATAR_SIZES = (48, 96, 192)
+AVATAR_FORMATS = (("webp", "WEBP", {"quality": 82, "method": 4}),
+                  ("jpg", "JPEG", {"quality": 85, "optimize": True, "progressive": True}))
+AVATAR_MAX_AGE = 365 * 24 * 3600
+
+UPLOAD_FORMATS = {"PNG", "JPEG", "GIF", "WEBP"}
+# Refuse decompression bombs before decoding any pixel
+MAX_PIXELS = 40_000_000
+# Transparent areas are flattened onto the avatar placeholder colour (zinc-800)
+BACKGROUND = (39, 39, 42)
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+def is_avatar_key(picture):
+    return bool(picture) and picture.startswith(AVATAR_PREFIX)
+
+
+def avatar_file(key, size, ext):
+    return f"{key[len(AVATAR_PREFIX):]}-{size}.{ext}"
+
+
+def _decode(data):
+    try:
+        img = Image.open(io.BytesIO(data))
+        if img.format not in UPLOAD_FORMATS:
+            raise InvalidImage(f"unsupported image format {img.format}")
+        if img.width * img.height > MAX_PIXELS:
+            raise InvalidImage(f"image too large ({img.width}x{img.height})")
+        # JPEGs can decode at a reduced scale, which is most of the work saved
+        img.draft("RGB", (AVATAR_SIZES[-1], AVATAR_SIZES[-1]))
+        img.load()
+    except InvalidImage:
+        raise
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError) as err:
+        raise InvalidImage(f"unreadable image: {err}") from err
+
+    img = ImageOps.exif_transpose(img)
+    # Cheap integer downscale first, leaving LANCZOS at least 2x to work from
+    factor = min(img.size) // (2 * AVATAR_SIZES[-1])
+    if factor > 1:
+        img = img.reduce(factor)
+    if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+        rgba = img.convert("RGBA")
+        img = Image.new("RGB", rgba.size, BACKGROUND)
+        img.paste(rgba, mask=rgba.getchannel("A"))
+    return img.convert("RGB")
+
+
+def render_avatar(data):
+    """``(key, {filename: bytes})`` for an uploaded image. Raises InvalidImage."""
+    img = _decode(data)
+    largest = ImageOps.fit(img, (AVATAR_SIZES[-1], AVATAR_SIZES[-1]), Image.Resampling.LANCZOS)
+    renditions = []
+    for size in AVATAR_SIZES:
+        square = largest if size == largest.width else largest.resize((size, size), Image.Resampling.LANCZOS)
+        for ext, fmt, options in AVATAR_FORMATS:
+            out = io.BytesIO()
+            square.save(out, fmt, **options)
+            renditions.append((size, ext, out.getvalue()))
+
+    digest = hashlib.sha256()
+    for _, _, body in renditions:
+        digest.update(body)
+    key = AVATAR_PREFIX + digest.hexdigest()[:20]
+    return key, {avatar_file(key, size, ext): body for size, ext, body in renditions}
+
+
+def save_avatar(stream):
+    """Process an upload into its renditions on disk. Returns the avatar key."""
+    key, files = render_avatar(stream.read())
+    os.makedirs(AVATAR_FOLDER, exist_ok=True)
+    for name, body in files.items():
+        path = os.path.join(AVATAR_FOLDER, name)
+        if os.path.exists(path):
+            # Same content already stored: keep it clear of the GC grace period
+            os.utime(path)
+            continue
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(body)
+        os.replace(tmp, path)
+    return key
+
+
+def avatar_sources(picture, px):
+    """``src``/``srcset`` for an <img> of ``px`` CSS pixels (see templates/_avatar.html)"""
+    if not is_avatar_key(picture):
+        return {"src": url_for("static", filename="uploads/" + picture), "srcset": None, "webp": None}
+    one_x = next((s for s in AVATAR_SIZES if s >= px), AVATAR_SIZES[-1])
+    two_x = next((s for s in AVATAR_SIZES if s >= 2 * px), AVATAR_SIZES[-1])
+
+    def url(size, ext):
+        return url_for("main.avatar", filename=avatar_file(picture, size, ext))
+
+    def srcset(ext):
+        return f"{url(one_x, ext)} 1x, {url(two_x, ext)} 2x"
+
+    return {"src": url(one_x, "jpg"), "srcset": srcset("jpg"), "webp": srcset("webp")}
+
+
+def collect_garbage(conn, grace=3600, dry_run=False, log=print):
+    """Delete avatar files and legacy uploads no user references.
+
+    Files modified within ``grace`` seconds are kept: their upload may not
+    have committed yet. Returns the number of files (to be) removed.
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT DISTINCT profile_picture FROM users WHERE profile_picture IS NOT NULL")
+    referenced = {row[0] for row in cursor.fetchall()}
+    cursor.close()
+
+    candidates = []
+    if os.path.isdir(AVATAR_FOLDER):
+        for name in os.listdir(AVATAR_FOLDER):
+            if AVATAR_PREFIX + name.split("-", 1)[0] not in referenced:
+                candidates.append(os.path.join(AVATAR_FOLDER, name))
+    if os.path.isdir(UPLOAD_FOLDER):
+        for name in os.listdir(UPLOAD_FOLDER):
+            path = os.path.join(UPLOAD_FOLDER, name)
+            if os.path.isfile(path) and not name.startswith(".") and name not in referenced:
+                candidates.append(path)
+
+    cutoff = time.time() - grace
+    removed = 0
+    for path in candidates:
+        try:
+            if os.path.getmtime(path) > cutoff:
+                continue
+            if not dry_run:
+                os.remove(path)
+        except FileNotFoundError:
+            continue
+        removed += 1
+        log(f"{'Would remove' if dry_run else 'Removed'} {os.path.relpath(path, UPLOAD_FOLDER)}")
+    return removed
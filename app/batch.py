@@ -0,0 +1,185 @@
+from collections import Counter
+from app.db import get_db_connection
+from app.notes import touch_collection, record_tombstones, inserted_note_ids
+from app.sanitize import sanitize_html, SANITIZER_VERSION
+from app.search import build_search_text
+from app.stats import note_delta, apply_stats_delta
+from app.tags import set_notes_tags
+
+# Mixed create/update/delete of many notes (POST /api/notes/batch).
+#
+# Operations are validated and their HTML sanitized before the database is
+# touched; the writes then run in one transaction with a fixed number of
+# statements per kind (one multi-row INSERT, one executemany UPDATE, one
+# DELETE, one tag rewrite and one counter update). Invalid operations and
+# unknown ids are reported per item and do not abort the rest of the batch.
+
+OPERATIONS = ("create", "update", "delete")
+NOTE_COLUMNS = ("command", "description", "category", "example", "tags")
+HTML_FIELDS = ("description", "example")
+
+
+def _parse_operation(item, seen_ids):
+    """Return ``(op, note_id, fields)`` for one batch item. Raises ValueError."""
+    if not isinstance(item, dict):
+        raise ValueError("operation must be an object")
+    op = item.get("op")
+    if op not in OPERATIONS:
+        raise ValueError("op must be one of: create, update, delete")
+
+    fields = {key: item[key] for key in NOTE_COLUMNS if key in item}
+    for key, value in fields.items():
+        if value is not None and not isinstance(value, str):
+            raise ValueError(f"{key} must be a string")
+
+    if op == "create":
+        if not fields.get("command") or not fields.get("description"):
+            raise ValueError("Missing required fields: command, description")
+        fields.setdefault("category", "Uncategorized")
+        fields.setdefault("example", "")
+        fields.setdefault("tags", "")
+        return op, None, fields
+
+    note_id = item.get("id")
+    if not isinstance(note_id, int) or isinstance(note_id, bool):
+        raise ValueError("id must be an integer")
+    if note_id in seen_ids:
+        raise ValueError("note id appears more than once in the batch")
+    seen_ids.add(note_id)
+
+    if op == "update":
+        if not fields:
+            raise ValueError("nothing to update")
+        if any(key in fields and not fields[key] for key in ("command", "description")):
+            raise ValueError("command and description cannot be empty")
+    return op, note_id, fields
+
+
+def run_note_batch(user_id, operations):
+    """Apply ``operations`` for a user in one transaction.
+
+    Returns one result per operation, in order:
+    ``{"index", "status": "created"|"updated"|"deleted"|"error", "id"|"error"}``.
+    """
+    results = [None] * len(operations)
+    pending = {"create": [], "update": [], "delete": []}
+    seen_ids = set()
+    for index, item in enumerate(operations):
+        try:
+            op, note_id, fields = _parse_operation(item, seen_ids)
+        except ValueError as e:
+            results[index] = {"index": index, "status": "error", "error": str(e)}
+            continue
+        pending[op].append((index, note_id, fields))
+
+    # Sanitize all HTML in one pass, before any row lock is taken
+    for _, _, fields in pending["create"] + pending["update"]:
+        for key in HTML_FIELDS:
+            if key in fields:
+                fields[key + "_html"] = sanitize_html(fields[key])
+
+    if not any(pending.values()):
+        return results
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        # One change sequence for the whole batch; locks the user's row first
+        seq = touch_collection(cursor, user_id)
+
+        existing = {}
+        ids = [note_id for _, note_id, _ in pending["update"] + pending["delete"]]
+        if ids:
+            cursor.execute(
+                f"""
+                SELECT id, {', '.join(NOTE_COLUMNS)}, description_html, example_html, sanitizer_version FROM notes
+                WHERE user_id = %s AND id IN ({', '.join(['%s'] * len(ids))})
+                FOR UPDATE
+                """,
+                (user_id, *ids)
+            )
+            columns = NOTE_COLUMNS + ("description_html", "example_html", "sanitizer_version")
+            existing = {row[0]: dict(zip(columns, row[1:])) for row in cursor.fetchall()}
+
+        delta = Counter()
+        tag_writes = []
+
+        creates = pending["create"]
+        if creates:
+            cursor.executemany(
+                """
+                INSERT INTO notes (command, description, description_html, category, example, example_html, tags,
+                                   user_id, search_text, sanitizer_version, change_seq)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                """,
+                [(f["command"], f["description"], f["description_html"], f["category"], f["example"], f["example_html"],
+                  f["tags"], user_id, build_search_text(f["command"], f["description_html"], f["example_html"], f["tags"]),
+                  SANITIZER_VERSION, seq)
+                 for _, _, f in creates]
+            )
+            # Before any update below stamps seq on an existing note
+            new_ids = inserted_note_ids(cursor, user_id, seq, len(creates))
+            for note_id, (index, _, f) in zip(new_ids, creates):
+                results[index] = {"index": index, "status": "created", "id": note_id}
+                tag_writes.append((note_id, user_id, f["tags"]))
+                delta.update(note_delta(new=(f["category"], f["tags"])))
+
+        update_rows = []
+        for index, note_id, fields in pending["update"]:
+            old = existing.get(note_id)
+            if old is None:
+                results[index] = {"index": index, "status": "error", "id": note_id, "error": "Note not found"}
+                continue
+            new = {**old, **fields}
+            if old["sanitizer_version"] != SANITIZER_VERSION:
+                # Kept fields were rendered by an older allowlist; bring the whole row up to date
+                for key in HTML_FIELDS:
+                    if key not in fields:
+                        new[key + "_html"] = sanitize_html(old[key])
+            update_rows.append((new["command"], new["description"], new["description_html"], new["category"],
+                                new["example"], new["example_html"], new["tags"],
+                                build_search_text(new["command"], new["description_html"], new["example_html"], new["tags"]),
+                                SANITIZER_VERSION, seq, note_id))
+            if new["tags"] != old["tags"]:
+                tag_writes.append((note_id, user_id, new["tags"]))
+            delta.update(note_delta(old=(old["category"], old["tags"]), new=(new["category"], new["tags"])))
+            results[index] = {"index": index, "status": "updated", "id": note_id}
+        if update_rows:
+            cursor.executemany(
+                """
+                UPDATE notes SET command = %s, description = %s, description_html = %s, category = %s,
+                    example = %s, example_html = %s, tags = %s, search_text = %s, sanitizer_version = %s,
+                    version = version + 1, change_seq = %s
+                WHERE id = %s
+                """,
+                update_rows
+            )
+
+        delete_ids = []
+        for index, note_id, _ in pending["delete"]:
+            old = existing.get(note_id)
+            if old is None:
+                results[index] = {"index": index, "status": "error", "id": note_id, "error": "Note not found"}
+                continue
+            delete_ids.append(note_id)
+            delta.update(note_delta(old=(old["category"], old["tags"])))
+            results[index] = {"index": index, "status": "deleted", "id": note_id}
+        if delete_ids:
+            # note_tags rows go with them (ON DELETE CASCADE)
+            cursor.execute(
+                f"DELETE FROM notes WHERE user_id = %s AND id IN ({', '.join(['%s'] * len(delete_ids))})",
+                (user_id, *delete_ids)
+            )
+            record_tombstones(cursor, user_id, delete_ids, seq)
+
+        set_notes_tags(cursor, tag_writes)
+        apply_stats_delta(cursor, user_id, delta)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+    return results
@@ -0,0 +1,199 @@
+import threading
+import zlib
+from flask import request
+from app.config import Config
+
+try:
+    import brotli
+except ImportError:  # optional
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # optional
+    zstandard = None
+
+# Response compression (HTML, JSON and other text).
+#
+# An after_request hook picks the best encoding the client accepts (zstd,
+# br, gzip, in that order of preference when equally acceptable), compresses
+# bodies of at least COMPRESS_MIN_SIZE bytes and adds ``Vary:
+# Accept-Encoding`` to every compressible response, compressed or not.
+# Streamed responses are compressed chunk by chunk with a flush after each,
+# so rows keep reaching the client as they are produced. Strong ETags become
+# weak when an encoding is negotiated: the bytes differ per encoding, while
+# If-None-Match (weak comparison) keeps answering 304s.
+#
+# Bytes in/out are counted per endpoint and process, see /health/compression.
+
+COMPRESSIBLE_TYPES = {
+    "text/html", "text/plain", "text/css", "text/csv", "text/javascript",
+    "application/json", "application/x-ndjson", "application/javascript", "image/svg+xml",
+}
+
+
+class _Gzip:
+    name = "gzip"
+
+    def __init__(self):
+        self._c = zlib.compressobj(Config.COMPRESS_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self._c.compress(data)
+
+    def flush(self):
+        return self._c.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._c.flush()
+
+
+class _Brotli:
+    name = "br"
+
+    def __init__(self):
+        self._c = brotli.Compressor(quality=Config.COMPRESS_BROTLI_QUALITY)
+
+    def compress(self, data):
+        return self._c.process(data)
+
+    def flush(self):
+        return self._c.flush()
+
+    def finish(self):
+        return self._c.finish()
+
+
+class _Zstd:
+    name = "zstd"
+
+    def __init__(self):
+        self._c = zstandard.ZstdCompressor(level=Config.COMPRESS_ZSTD_LEVEL).compressobj()
+
+    def compress(self, data):
+        return self._c.compress(data)
+
+    def flush(self):
+        return self._c.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        return self._c.flush()
+
+
+# In order of preference
+ENCODERS = [cls for cls, available in ((_Zstd, zstandard), (_Brotli, brotli), (_Gzip, True)) if available]
+
+
+class CompressionStats:
+    """Per-endpoint counters of one process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+
+    def record(self, endpoint, encoding, bytes_in, bytes_out):
+        with self._lock:
+            route = self._routes.setdefault(endpoint, {"responses": 0, "compressed": 0, "bytes_in": 0, "bytes_out": 0})
+            route["responses"] += 1
+            route["bytes_in"] += bytes_in
+            route["bytes_out"] += bytes_out
+            if encoding:
+                route["compressed"] += 1
+                route[encoding] = route.get(encoding, 0) + 1
+
+    def snapshot(self):
+        with self._lock:
+            routes = {name: dict(route, bytes_saved=route["bytes_in"] - route["bytes_out"])
+                      for name, route in self._routes.items()}
+        return {
+            "encodings": [cls.name for cls in ENCODERS],
+            "bytes_saved": sum(route["bytes_saved"] for route in routes.values()),
+            "routes": routes,
+        }
+
+
+stats = CompressionStats()
+
+
+def negotiate(accept_encodings):
+    """The encoder class to use for an Accept-Encoding header, or None"""
+    best, best_q = None, 0
+    for cls in ENCODERS:
+        q = accept_encodings[cls.name]
+        if q > best_q:
+            best, best_q = cls, q
+    return best
+
+
+def _compress_stream(chunks, encoder, endpoint):
+    bytes_in = bytes_out = 0
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            if not chunk:
+                continue
+            bytes_in += len(chunk)
+            out = encoder.compress(chunk) + encoder.flush()
+            bytes_out += len(out)
+            yield out
+        out = encoder.finish()
+        bytes_out += len(out)
+        yield out
+    finally:
+        stats.record(endpoint, encoder.name, bytes_in, bytes_out)
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
+
+
+def compress_response(response):
+    if response.direct_passthrough or "Content-Encoding" in response.headers:
+        return response
+    encoder_cls = negotiate(request.accept_encodings)
+
+    if response.status_code == 304:
+        # Must carry the ETag the 200 would have had
+        if encoder_cls is not None:
+            _weaken_etag(response)
+        return response
+    if response.mimetype not in COMPRESSIBLE_TYPES or response.status_code < 200 or response.status_code == 204:
+        return response
+
+    response.vary.add("Accept-Encoding")
+    endpoint = request.endpoint or "unknown"
+    if encoder_cls is None or request.method == "HEAD" or "no-transform" in response.headers.get("Cache-Control", ""):
+        if not response.is_streamed:
+            stats.record(endpoint, None, response.content_length or 0, response.content_length or 0)
+        return response
+
+    if response.is_streamed:
+        response.response = _compress_stream(response.response, encoder_cls(), endpoint)
+        response.headers.pop("Content-Length", None)
+    else:
+        data = response.get_data()
+        if len(data) < Config.COMPRESS_MIN_SIZE:
+            stats.record(endpoint, None, len(data), len(data))
+            return response
+        encoder = encoder_cls()
+        body = encoder.compress(data) + encoder.finish()
+        if len(body) >= len(data):
+            stats.record(endpoint, None, len(data), len(data))
+            return response
+        response.set_data(body)
+        stats.record(endpoint, encoder.name, len(data), len(body))
+
+    response.headers["Content-Encoding"] = encoder_cls.name
+    _weaken_etag(response)
+    return response
+
+
+def _weaken_etag(response):
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+
+
+def init_compression(app):
+    if Config.COMPRESS_ENABLED:
+        app.after_request(compress_response)
@@ -3,9 +3,101 @@ from dotenv import load_dotenv
 
 load_dotenv(dotenv_path=".env")
 
+
+def _env_bool(name, default):
+    val = os.getenv(name)
+    if val is None:
+        return default
+    return val.strip().lower() in ("1", "true", "yes", "on")
+
+
 class Config:
     DB_HOST = os.getenv("DB_HOST")
     DB_USER = os.getenv("DB_USER")
     DB_PASSWORD = os.getenv("DB_PASSWORD")
     DB_NAME = os.getenv("DB_NAME")
     DB_PORT = int(os.getenv("DB_PORT", "3306"))
+    DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "3"))
+
+    # Connection pool (per gunicorn worker process)
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "4"))
+    DB_POOL_MAX_OVERFLOW = int(os.getenv("DB_POOL_MAX_OVERFLOW", "4"))
+    DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "5"))
+    DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+    DB_POOL_PRE_PING = _env_bool("DB_POOL_PRE_PING", True)
+
+    # Schema migrations at app boot: check (default, log when behind), apply or off.
+    # Deploys run scripts/migrate.py before the app starts.
+    DB_MIGRATE_ON_BOOT = os.getenv("DB_MIGRATE_ON_BOOT", "check").strip().lower()
+    # Data backfills run this many primary keys per transaction, pausing in between
+    MIGRATION_BATCH_SIZE = int(os.getenv("MIGRATION_BATCH_SIZE", "1000"))
+    MIGRATION_BATCH_SLEEP = float(os.getenv("MIGRATION_BATCH_SLEEP", "0.05"))
+
+    # Request-time circuit breaker around DB connects
+    DB_BREAKER_THRESHOLD = int(os.getenv("DB_BREAKER_THRESHOLD", "3"))
+    DB_BREAKER_RESET_TIMEOUT = float(os.getenv("DB_BREAKER_RESET_TIMEOUT", "10"))
+
+    # Per-process cache of User rows for the Flask-Login user_loader
+    USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "1024"))
+    USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", "60"))
+    # Per-user change stamps shared by the workers of a host (app/user.py)
+    USER_STAMP_DIR = os.getenv("USER_STAMP_DIR", "/tmp/dnotes-user-stamps")
+
+    # Per-process cache of API token digests (positive and negative lookups)
+    API_TOKEN_CACHE_SIZE = int(os.getenv("API_TOKEN_CACHE_SIZE", "4096"))
+    API_TOKEN_CACHE_TTL = int(os.getenv("API_TOKEN_CACHE_TTL", "30"))
+    API_TOKEN_NEGATIVE_TTL = int(os.getenv("API_TOKEN_NEGATIVE_TTL", "10"))
+
+    # Keyset pagination of note listings
+    NOTES_PAGE_SIZE = int(os.getenv("NOTES_PAGE_SIZE", "50"))
+    NOTES_PAGE_MAX = int(os.getenv("NOTES_PAGE_MAX", "200"))
+    DASHBOARD_PAGE_SIZE = int(os.getenv("DASHBOARD_PAGE_SIZE", "30"))
+
+    # Rows fetched per round trip by the streaming note export
+    EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "500"))
+
+    # Max operations accepted by one POST /api/notes/batch
+    API_BATCH_MAX = int(os.getenv("API_BATCH_MAX", "500"))
+
+    # Per-process cache of rendered public note pages (/s/<public_id>)
+    PUBLIC_NOTE_CACHE_SIZE = int(os.getenv("PUBLIC_NOTE_CACHE_SIZE", "512"))
+    PUBLIC_NOTE_CACHE_TTL = int(os.getenv("PUBLIC_NOTE_CACHE_TTL", "300"))
+    PUBLIC_NOTE_MAX_AGE = int(os.getenv("PUBLIC_NOTE_MAX_AGE", "0"))
+
+    # Outbound email (password reset), delivered by background threads (app/mail.py)
+    SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+    SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+    SMTP_USER = os.getenv("SMTP_USER", "")
+    SMTP_PASSWORD = os.getenv("SMTP_PASSWORD", "")
+    SMTP_SENDER = os.getenv("SMTP_SENDER", "")
+    SMTP_USE_TLS = _env_bool("SMTP_USE_TLS", True)
+    SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", "10"))
+    MAIL_QUEUE_SIZE = int(os.getenv("MAIL_QUEUE_SIZE", "100"))
+    MAIL_WORKERS = int(os.getenv("MAIL_WORKERS", "1"))
+    MAIL_MAX_ATTEMPTS = int(os.getenv("MAIL_MAX_ATTEMPTS", "4"))
+    MAIL_RETRY_BACKOFF = float(os.getenv("MAIL_RETRY_BACKOFF", "2"))
+    MAIL_IDLE_TIMEOUT = float(os.getenv("MAIL_IDLE_TIMEOUT", "30"))
+
+    # Prometheus metrics at /metrics (app/metrics.py)
+    METRICS_ENABLED = _env_bool("METRICS_ENABLED", True)
+
+    # Query profiler (app/profiler.py): header (admins send X-Profile: 1), all or off
+    QUERY_PROFILER = os.getenv("QUERY_PROFILER", "header").strip().lower()
+    SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "500"))  # 0 disables the slow-query log
+    N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "5"))
+
+    # On-demand CPU/memory/request profiling for admins at /admin/profile (app/diagnostics)
+    PROFILING_ENABLED = _env_bool("PROFILING_ENABLED", True)
+    PROFILE_DIR = os.getenv("PROFILE_DIR", "/tmp/dnotes-profiles")
+    PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "30"))
+    PROFILE_MAX_REQUESTS = int(os.getenv("PROFILE_MAX_REQUESTS", "50"))
+
+    # Response compression (app/compression.py); br needs Brotli, zstd needs zstandard
+    COMPRESS_ENABLED = _env_bool("COMPRESS_ENABLED", True)
+    COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+    COMPRESS_LEVEL = int(os.getenv("COMPRESS_LEVEL", "6"))
+    COMPRESS_BROTLI_QUALITY = int(os.getenv("COMPRESS_BROTLI_QUALITY", "4"))
+    COMPRESS_ZSTD_LEVEL = int(os.getenv("COMPRESS_ZSTD_LEVEL", "3"))
+
+    # Delta sync (/api/notes/changes): how long deletes are remembered
+    TOMBSTONE_RETENTION_DAYS = int(os.getenv("TOMBSTONE_RETENTION_DAYS", "30"))
@@ -1,165 +1,624 @@
+import os
+import math
 import time
+import threading
+from collections import deque
 import mysql.connector
 from mysql.connector import Error
+from flask import g, has_app_context
 from app.config import Config
+from app.profiler import current_profile, log_slow_query
 
 
-def get_db_connection(retries=10, delay=2):
-    for attempt in range(retries):
+class DatabaseUnavailable(Exception):
+    """The database cannot serve this request; answered with a 503."""
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class PoolTimeout(DatabaseUnavailable):
+    """Raised when no pooled connection became available in time."""
+
+
+class PooledConnection:
+    """Thin proxy around a MySQL connection checked out from a ConnectionPool.
+
+    ``close()`` hands the connection back to the pool instead of tearing down
+    the socket. Connections bound to a request (see ``get_db_connection``)
+    ignore ``close()`` and are released once by the teardown handler.
+    """
+
+    def __init__(self, pool, raw, scoped=False):
+        self._pool = pool
+        self._raw = raw
+        self._scoped = scoped
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def cursor(self, *args, **kwargs):
+        raw = self._raw.cursor(*args, **kwargs)
+        profile = current_profile() if has_app_context() else None
+        if profile is not None:
+            return ProfiledCursor(raw, profile)
+        return TimedCursor(raw)
+
+    def close(self):
+        if not self._scoped:
+            self.release()
+
+    def release(self, discard=False):
+        raw, self._raw = self._raw, None
+        if raw is not None:
+            self._pool.release(raw, discard=discard)
+
+
+class TimedCursor:
+    """Cursor proxy timing every statement.
+
+    Adds each statement's count and time to the request's totals (read by
+    ``request_db_stats()``, app/metrics.py), logs statements slower than
+    SLOW_QUERY_MS and feeds the request's query profile when one is active
+    (app/profiler.py).
+    """
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def execute(self, operation, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return self._cursor.execute(operation, *args, **kwargs)
+        finally:
+            self._record(operation, time.perf_counter() - started)
+
+    def executemany(self, operation, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return self._cursor.executemany(operation, *args, **kwargs)
+        finally:
+            self._record(operation, time.perf_counter() - started)
+
+    def _record(self, operation, elapsed):
+        if elapsed >= _slow_query_seconds:
+            log_slow_query(operation, elapsed, self._cursor.rowcount)
+        if has_app_context():
+            stats = _request_stats()
+            stats["queries"] += 1
+            stats["query_time"] += elapsed
+            return stats
+        return None
+
+
+class ProfiledCursor(TimedCursor):
+    """TimedCursor that also records each statement and the rows it fetched"""
+
+    def __init__(self, cursor, profile):
+        super().__init__(cursor)
+        self._profile = profile
+        self._entry = None
+
+    def _record(self, operation, elapsed):
+        super()._record(operation, elapsed)
+        # Rows of a SELECT are counted as they are fetched; writes report rowcount
+        rowcount = 0 if self._cursor.description is not None else self._cursor.rowcount
+        self._entry = self._profile.add(operation, elapsed, rowcount)
+
+    def _fetched(self, rows):
+        if self._entry is not None:
+            self._entry[2] += rows
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        self._fetched(1 if row is not None else 0)
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        rows = self._cursor.fetchmany(*args, **kwargs)
+        self._fetched(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        self._fetched(len(rows))
+        return rows
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+
+_slow_query_seconds = Config.SLOW_QUERY_MS / 1000 if Config.SLOW_QUERY_MS > 0 else float("inf")
+
+
+def _request_stats():
+    stats = g.get("_db_stats")
+    if stats is None:
+        stats = g._db_stats = {"connect": 0.0, "queries": 0, "query_time": 0.0}
+    return stats
+
+
+def request_db_stats():
+    """``{"connect", "queries", "query_time"}`` (seconds) of the current request, or None without DB use"""
+    return g.get("_db_stats")
+
+
+class ConnectionPool:
+    """Thread-safe MySQL connection pool with overflow, recycling and pre-ping.
+
+    Up to ``size`` connections are kept idle; another ``max_overflow`` may be
+    opened under load and are closed again when returned. Idle connections
+    older than ``recycle`` seconds are replaced, and with ``pre_ping`` every
+    checkout is validated with a ping before being handed out.
+    """
+
+    def __init__(self, creator, size=4, max_overflow=4, timeout=5.0, recycle=1800, pre_ping=True):
+        self._creator = creator
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.recycle = recycle
+        self.pre_ping = pre_ping
+        self.pid = os.getpid()
+
+        self._cond = threading.Condition()
+        self._idle = deque()  # (raw, last_used)
+        self._opened = 0
+        self._in_use = 0
+
+        self._checkouts = 0
+        self._checkout_failures = 0
+        self._timeouts = 0
+        self._recycled = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def checkout(self, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        entry = None
+
+        with self._cond:
+            while True:
+                if self._idle:
+                    entry = self._idle.pop()
+                    break
+                if self._opened < self.size + self.max_overflow:
+                    self._opened += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    self._checkout_failures += 1
+                    raise PoolTimeout(
+                        f"No database connection available after {timeout:.1f}s "
+                        f"(size={self.size}, overflow={self.max_overflow})"
+                    )
+                self._cond.wait(remaining)
+            self._in_use += 1
+
         try:
-            conn = mysql.connector.connect(
-                host=Config.DB_HOST,
-                port=Config.DB_PORT,
-                user=Config.DB_USER,
-                password=Config.DB_PASSWORD,
-                database=Config.DB_NAME,
+            raw = self._validate(entry) if entry else None
+            if raw is None:
+                raw = self._creator()
+        except Exception:
+            with self._cond:
+                self._opened -= 1
+                self._in_use -= 1
+                self._checkout_failures += 1
+                self._cond.notify()
+            raise
+
+        waited = time.monotonic() - start
+        with self._cond:
+            self._checkouts += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+        return raw
+
+    def _validate(self, entry):
+        raw, last_used = entry
+        stale = self.recycle and time.monotonic() - last_used > self.recycle
+        if not stale and (not self.pre_ping or raw.is_connected()):
+            return raw
+        with self._cond:
+            self._recycled += 1
+        _close_quietly(raw)
+        return None
+
+    def release(self, raw, discard=False):
+        """Return a connection; ``discard`` closes it instead (e.g. unread results pending)"""
+        try:
+            if not discard and raw.in_transaction:
+                raw.rollback()
+        except Error:
+            discard = True
+
+        with self._cond:
+            self._in_use -= 1
+            if discard or len(self._idle) >= self.size:
+                self._opened -= 1
+            else:
+                self._idle.append((raw, time.monotonic()))
+                raw = None
+            self._cond.notify()
+
+        if raw is not None:
+            _close_quietly(raw)
+
+    def dispose(self):
+        with self._cond:
+            idle, self._idle = list(self._idle), deque()
+            self._opened -= len(idle)
+        for raw, _ in idle:
+            _close_quietly(raw)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "pid": self.pid,
+                "size": self.size,
+                "max_overflow": self.max_overflow,
+                "opened": self._opened,
+                "idle": len(self._idle),
+                "in_use": self._in_use,
+                "checkouts": self._checkouts,
+                "checkout_failures": self._checkout_failures,
+                "timeouts": self._timeouts,
+                "recycled": self._recycled,
+                "wait_time_total_ms": round(self._wait_total * 1000, 3),
+                "wait_time_max_ms": round(self._wait_max * 1000, 3),
+            }
+
+
+def _close_quietly(raw):
+    try:
+        raw.close()
+    except Exception:
+        pass
+
+
+def _connect():
+    return mysql.connector.connect(
+        host=Config.DB_HOST,
+        port=Config.DB_PORT,
+        user=Config.DB_USER,
+        password=Config.DB_PASSWORD,
+        database=Config.DB_NAME,
+        connection_timeout=Config.DB_CONNECT_TIMEOUT,
+    )
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return this process' pool, building a fresh one after a fork."""
+    global _pool
+    pool = _pool
+    if pool is not None and pool.pid == os.getpid():
+        return pool
+    with _pool_lock:
+        if _pool is None or _pool.pid != os.getpid():
+            _pool = ConnectionPool(
+                _connect,
+                size=Config.DB_POOL_SIZE,
+                max_overflow=Config.DB_POOL_MAX_OVERFLOW,
+                timeout=Config.DB_POOL_TIMEOUT,
+                recycle=Config.DB_POOL_RECYCLE,
+                pre_ping=Config.DB_POOL_PRE_PING,
             )
+        return _pool
+
+
+def _reset_pool_after_fork():
+    # The child shares the parent's sockets; drop them without sending
+    # COM_QUIT so the parent's connections stay usable.
+    global _pool, _pool_lock
+    _pool = None
+    _pool_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_pool_after_fork)
+
+
+class CircuitBreaker:
+    """Closed/open/half-open breaker guarding request-time DB connects.
+
+    After ``failure_threshold`` consecutive connect failures the breaker opens
+    and callers are rejected immediately with ``DatabaseUnavailable`` until
+    ``reset_timeout`` has passed. A single probe is then let through
+    (half-open): success closes the breaker, failure re-opens it.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=10.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._rejected = 0
+        self._transitions = deque(maxlen=20)
+
+    def before_call(self):
+        with self._lock:
+            if self.state == self.OPEN:
+                remaining = self.reset_timeout - (time.monotonic() - self._opened_at)
+                if remaining > 0:
+                    self._rejected += 1
+                    raise DatabaseUnavailable("Database circuit open", retry_after=math.ceil(remaining))
+                self._transition(self.HALF_OPEN)
+            if self.state == self.HALF_OPEN:
+                if self._probe_in_flight:
+                    self._rejected += 1
+                    raise DatabaseUnavailable("Database circuit half-open, probe in flight", retry_after=1)
+                self._probe_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._probe_in_flight = False
+            if self.state != self.CLOSED:
+                self._transition(self.CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probe_in_flight = False
+            if self.state == self.HALF_OPEN or (
+                self.state == self.CLOSED and self._failures >= self.failure_threshold
+            ):
+                self._opened_at = time.monotonic()
+                self._transition(self.OPEN)
+
+    def release_probe(self):
+        """Give up a half-open probe slot without a verdict (e.g. pool timeout)."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def _transition(self, new_state):
+        print(f"DB circuit breaker: {self.state} -> {new_state} (failures={self._failures})")
+        self._transitions.append({"from": self.state, "to": new_state, "at": time.time()})
+        self.state = new_state
+
+    def stats(self):
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self._failures,
+                "failure_threshold": self.failure_threshold,
+                "reset_timeout": self.reset_timeout,
+                "rejected": self._rejected,
+                "transitions": list(self._transitions),
+            }
+
+
+breaker = CircuitBreaker(
+    failure_threshold=Config.DB_BREAKER_THRESHOLD,
+    reset_timeout=Config.DB_BREAKER_RESET_TIMEOUT,
+)
+
+
+def pool_stats():
+    stats = get_pool().stats()
+    stats["breaker"] = breaker.stats()
+    return stats
+
+
+def wait_for_db(retries=10, delay=2):
+    """Startup-only connect loop: keep retrying while MySQL comes up.
+
+    Never used on the request path, where a down database must fail fast.
+    """
+    pool = get_pool()
+    for attempt in range(retries):
+        try:
+            conn = PooledConnection(pool, pool.checkout())
+            breaker.record_success()
             return conn
-        except Error as e:
+        except (Error, PoolTimeout) as e:
             print(f"DB not ready ({attempt + 1}/{retries}): {e}")
             time.sleep(delay)
 
     raise Exception("Database connection failed after retries")
 
 
-def init_db():
-    conn = get_db_connection()
-    cursor = conn.cursor()
+def checkout_connection():
+    """A pooled connection owned by the caller rather than the request.
 
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            username VARCHAR(80) NOT NULL,
-            email VARCHAR(120) NOT NULL,
-            password_hash VARCHAR(255) NOT NULL,
-            role VARCHAR(20) DEFAULT 'user',
-            api_token VARCHAR(64),
-            bio VARCHAR(300),
-            profile_picture VARCHAR(255),
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
+    Used directly for work that outlives the request, such as streamed
+    responses; ``close()`` returns it to the pool.
+    """
+    breaker.before_call()
+    pool = get_pool()
+    try:
+        raw = pool.checkout()
+    except PoolTimeout:
+        breaker.release_probe()
+        raise
+    except Error as e:
+        breaker.record_failure()
+        raise DatabaseUnavailable(f"Database connection failed: {e}") from e
+    breaker.record_success()
+    return PooledConnection(pool, raw)
 
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS categories (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            name VARCHAR(80) NOT NULL,
-            color VARCHAR(20) DEFAULT '#3b82f6',
-            is_system BOOLEAN DEFAULT FALSE
-        )
-    """)
 
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS notes (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            command VARCHAR(255) NOT NULL,
-            description TEXT NOT NULL,
-            category VARCHAR(50),
-            example TEXT,
-            tags VARCHAR(500),
-            user_id INT,
-            is_public BOOLEAN DEFAULT FALSE,
-            public_id VARCHAR(36),
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
+def get_db_connection():
+    """Check out a pooled connection, failing fast when the DB is down.
+
+    Inside an app context the connection is checked out once and shared by
+    every caller for the rest of the request; ``close()`` is then a no-op and
+    ``close_db`` returns it to the pool at teardown. Connect failures and an
+    open circuit raise ``DatabaseUnavailable`` instead of retrying.
+    """
+    if not has_app_context():
+        return checkout_connection()
+
+    conn = g.get("_db_conn")
+    if conn is None:
+        started = time.perf_counter()
+        conn = checkout_connection()
+        # Pool wait plus, on a cold pool, the TCP/TLS/auth handshake
+        _request_stats()["connect"] += time.perf_counter() - started
+        conn._scoped = True
+        g._db_conn = conn
+    return conn
 
-    # Ensure expected columns exist for existing tables (non-destructive)
-    cursor.execute("""
-        SELECT COLUMN_NAME
-        FROM INFORMATION_SCHEMA.COLUMNS
-        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'notes'
-    """)
-    existing_notes_cols = {row[0] for row in cursor.fetchall()}
-    if "user_id" not in existing_notes_cols:
-        cursor.execute("ALTER TABLE notes ADD COLUMN IF NOT EXISTS user_id INT")
-    if "is_public" not in existing_notes_cols:
-        cursor.execute("ALTER TABLE notes ADD COLUMN IF NOT EXISTS is_public BOOLEAN DEFAULT FALSE")
-    if "public_id" not in existing_notes_cols:
-        cursor.execute("ALTER TABLE notes ADD COLUMN IF NOT EXISTS public_id VARCHAR(36)")
-    if "created_at" not in existing_notes_cols:
-        cursor.execute("ALTER TABLE notes ADD COLUMN IF NOT EXISTS created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP")
 
+def close_db(exc=None):
+    conn = g.pop("_db_conn", None)
+    if conn is not None:
+        conn.release()
+
+
+# Secondary indexes backing the hot note queries: (name, table, columns, kind)
+MANAGED_INDEXES = [
+    ("ix_notes_user_id_id", "notes", "user_id, id", "INDEX"),          # dashboard / /api/notes listing
+    ("ix_notes_user_category", "notes", "user_id, category", "INDEX"),  # /api/categories, category filter
+    ("ux_notes_public_id", "notes", "public_id", "UNIQUE"),             # /s/<public_id>
+    ("ft_notes_search_text", "notes", "search_text", "FULLTEXT"),       # search (app/search.py)
+    ("ix_notes_user_change_seq", "notes", "user_id, change_seq", "INDEX"),  # /api/notes/changes
+]
+
+# Hot queries whose plans must stay on an index, as the app runs them (one
+# keyset page, see app/notes.py fetch_note_page): (label, sql, sample params)
+HOT_QUERIES = [
+    ("dashboard notes", "SELECT * FROM notes WHERE user_id = %s AND id < %s ORDER BY id DESC LIMIT %s", (1, 1000, 21)),
+    ("api notes by category", """
+        SELECT * FROM notes WHERE user_id = %s AND category = %s AND id < %s ORDER BY id DESC LIMIT %s
+    """, (1, "Docker", 1000, 21)),
+    ("api notes by tag", """
+        SELECT * FROM notes
+        WHERE user_id = %s AND id IN (
+            SELECT nt.note_id FROM note_tags nt JOIN tags t ON t.id = nt.tag_id
+            WHERE nt.user_id = %s AND t.name = %s
+        ) AND id < %s
+        ORDER BY id DESC LIMIT %s
+    """, (1, 1, "docker", 1000, 21)),
+    ("note changes", """
+        SELECT * FROM notes
+        WHERE user_id = %s AND change_seq >= %s AND (change_seq > %s OR id > %s)
+        ORDER BY change_seq, id
+    """, (1, 10, 10, 100)),
+    # Relevance order sorts the matched rows; only the FULLTEXT access is checked
+    ("note search", """
+        SELECT * FROM notes
+        WHERE user_id = %s AND MATCH(search_text) AGAINST (%s IN BOOLEAN MODE)
+        ORDER BY MATCH(search_text) AGAINST (%s IN BOOLEAN MODE) DESC, id DESC LIMIT %s OFFSET %s
+    """, (1, "+docker*", "+docker*", 21, 0)),
+    ("api categories", "SELECT DISTINCT category FROM notes WHERE user_id = %s", (1,)),
+    ("category counters", """
+        SELECT name, count FROM user_note_stats
+        WHERE user_id = %s AND kind = %s AND count > 0 ORDER BY name
+    """, (1, "category")),
+    ("popular tags", """
+        SELECT name, count FROM user_note_stats
+        WHERE user_id = %s AND kind = %s AND count > 0
+        ORDER BY count DESC LIMIT %s
+    """, (1, "tag", 10)),
+    ("public note version", "SELECT version FROM notes WHERE public_id = %s AND is_public = TRUE",
+     ("00000000-0000-0000-0000-000000000000",)),
+    ("public note", """
+        SELECT n.*, u.username, u.profile_picture
+        FROM notes n
+        JOIN users u ON n.user_id = u.id
+        WHERE n.public_id = %s AND n.is_public = TRUE
+    """, ("00000000-0000-0000-0000-000000000000",)),
+]
+
+# Queries allowed to sort their (index-selected) rows
+FILESORT_OK = {"note search"}
+
+
+def ensure_indexes(cursor):
+    """Create any missing MANAGED_INDEXES (online, idempotent). Returns the names created."""
     cursor.execute("""
-        SELECT COLUMN_NAME
-        FROM INFORMATION_SCHEMA.COLUMNS
-        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'users'
+        SELECT DISTINCT TABLE_NAME, INDEX_NAME FROM INFORMATION_SCHEMA.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE()
     """)
-    existing_user_cols = {row[0] for row in cursor.fetchall()}
-    if "role" not in existing_user_cols:
-        cursor.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS role VARCHAR(20) DEFAULT 'user'")
-    if "api_token" not in existing_user_cols:
-        cursor.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS api_token VARCHAR(64)")
-    if "bio" not in existing_user_cols:
-        cursor.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS bio VARCHAR(300)")
-    if "profile_picture" not in existing_user_cols:
-        cursor.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS profile_picture VARCHAR(255)")
-    if "created_at" not in existing_user_cols:
-        cursor.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP")
-
-    # Ensure unique constraints for users
-    try:
-        cursor.execute("""
-            SELECT COUNT(*) FROM INFORMATION_SCHEMA.STATISTICS
-            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'users' AND COLUMN_NAME = 'email' AND NON_UNIQUE = 0
-        """)
-        if cursor.fetchone()[0] == 0:
-            cursor.execute("CREATE UNIQUE INDEX ux_users_email ON users (email)")
-    except mysql.connector.Error as err:
-        if err.errno == 1061:  # Duplicate key name
-            pass
-        else:
-            raise
+    existing = {(row[0], row[1]) for row in cursor.fetchall()}
 
-    try:
-        cursor.execute("""
-            SELECT COUNT(*) FROM INFORMATION_SCHEMA.STATISTICS
-            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'users' AND COLUMN_NAME = 'username' AND NON_UNIQUE = 0
-        """)
-        if cursor.fetchone()[0] == 0:
-            cursor.execute("CREATE UNIQUE INDEX ux_users_username ON users (username)")
-    except mysql.connector.Error as err:
-        if err.errno == 1061:  # Duplicate key name
-            pass
+    created = []
+    for name, table, columns, kind in MANAGED_INDEXES:
+        if (table, name) in existing:
+            continue
+        if kind == "FULLTEXT":
+            # InnoDB cannot build a FULLTEXT index with LOCK=NONE
+            statement = f"CREATE FULLTEXT INDEX {name} ON {table} ({columns})"
         else:
-            raise
+            prefix = "UNIQUE INDEX" if kind == "UNIQUE" else "INDEX"
+            statement = f"CREATE {prefix} {name} ON {table} ({columns}) ALGORITHM=INPLACE LOCK=NONE"
+        try:
+            cursor.execute(statement)
+            created.append(name)
+        except mysql.connector.Error as err:
+            if err.errno == 1061:  # Duplicate key name (another worker won the race)
+                pass
+            else:
+                raise
+    return created
 
-    cursor.execute("""
-        SELECT COLUMN_NAME
-        FROM INFORMATION_SCHEMA.COLUMNS
-        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'categories'
-    """)
-    existing_category_cols = {row[0] for row in cursor.fetchall()}
-    if "color" not in existing_category_cols:
-        cursor.execute("ALTER TABLE categories ADD COLUMN IF NOT EXISTS color VARCHAR(20) DEFAULT '#3b82f6'")
-    if "is_system" not in existing_category_cols:
-        cursor.execute("ALTER TABLE categories ADD COLUMN IF NOT EXISTS is_system BOOLEAN DEFAULT FALSE")
-
-    cursor.execute("SELECT name FROM categories")
-    existing_category_names = {row[0].strip().lower() for row in cursor.fetchall() if row[0]}
-
-    default_categories = [
-        ("Docker", "#3b82f6"),
-        ("Kubernetes", "#6366f1"),
-        ("Linux", "#22c55e"),
-        ("CI/CD", "#f59e0b"),
-        ("AWS", "#f97316"),
-        ("Monitoring", "#a855f7"),
-        ("Other", "#64748b"),
-    ]
-
-    for name, color in default_categories:
-        if name.lower() not in existing_category_names:
-            try:
-                cursor.execute("INSERT INTO categories (name, color, is_system) VALUES (%s, %s, TRUE)", (name, color))
-            except mysql.connector.Error as err:
-                 if err.errno == 1062: # Duplicate entry
-                     pass
-                 else:
-                     raise
-
-    conn.commit()
-    cursor.close()
-    conn.close()
-
-    print("Database initialized successfully")
+
+def check_query_plans(cursor):
+    """EXPLAIN every HOT_QUERIES entry and return the plans that regressed.
+
+    A regression is a full table scan (``type = ALL``) or a filesort (outside
+    FILESORT_OK) on the notes or counter tables. Returns a list of
+    ``(label, plan_row_dict)``.
+    """
+    problems = []
+    for label, sql, params in HOT_QUERIES:
+        cursor.execute("EXPLAIN " + sql, params)
+        columns = [d[0] for d in cursor.description]
+        for row in cursor.fetchall():
+            plan = dict(zip(columns, row))
+            if plan.get("table") not in ("notes", "n", "user_note_stats"):
+                continue
+            extra = plan.get("Extra") or ""
+            if plan.get("type") == "ALL" or ("Using filesort" in extra and label not in FILESORT_OK):
+                problems.append((label, plan))
+    return problems
+
+
+def init_db():
+    """Boot-time schema check (DB_MIGRATE_ON_BOOT). Returns the schema version, None when skipped.
+
+    An up-to-date database costs one query; pending migrations are only
+    reported (``check``, the default: deploys run scripts/migrate.py first) or
+    applied (``apply``).
+    """
+    from app.migrations import LATEST_VERSION, schema_version, apply_migrations
+
+    mode = Config.DB_MIGRATE_ON_BOOT
+    if mode == "off":
+        return None
+
+    conn = wait_for_db()
+    try:
+        cursor = conn.cursor()
+        version = schema_version(cursor)
+        cursor.close()
+        if version < LATEST_VERSION:
+            if mode == "check":
+                print(f"Database schema is at version {version}, expected {LATEST_VERSION}; run scripts/migrate.py")
+            else:
+                apply_migrations(conn)
+                version = LATEST_VERSION
+    finally:
+        conn.close()
+    return version
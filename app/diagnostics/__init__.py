@@ -0,0 +1,5 @@
+from flask import Blueprint
+
+diagnostics = Blueprint('diagnostics', __name__)
+
+from app.diagnostics import routes
@@ -0,0 +1,207 @@
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from app.config import Config
+
+# On-demand profiling of a live worker (routes in app/diagnostics/routes.py).
+#
+# Nothing here runs until an admin asks for it: the CPU sampler is a loop in
+# the requesting thread, tracemalloc is only started on request, and armed
+# request captures cost one dict check per request. Results are written to
+# PROFILE_DIR, shared by the gunicorn workers, so they can be fetched through
+# whichever worker answers. Starting something acts on the worker that
+# receives the call; every response names its pid.
+
+
+class Busy(Exception):
+    """Another profiling run of the same kind is in progress in this worker"""
+
+
+def profile_dir():
+    os.makedirs(Config.PROFILE_DIR, exist_ok=True)
+    return Config.PROFILE_DIR
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    module = frame.f_globals.get("__name__", os.path.basename(code.co_filename))
+    return f"{module}:{code.co_name}"
+
+
+# -- CPU sampling -------------------------------------------------------------
+
+_sampling = threading.Lock()
+
+
+def sample_stacks(seconds, interval):
+    """Sample every other thread's stack for ``seconds``.
+
+    Returns the collapsed-stack text (``thread;outer;...;inner count`` per
+    line) that flamegraph.pl, speedscope and inferno read, and the number of
+    samples taken.
+    """
+    if not _sampling.acquire(blocking=False):
+        raise Busy("a CPU sample is already running in this worker")
+    try:
+        me = threading.get_ident()
+        names = {}
+        stacks = Counter()
+        samples = 0
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            frames = sys._current_frames()
+            for ident, frame in frames.items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_name(frame))
+                    frame = frame.f_back
+                if ident not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                stack.append(names.get(ident, f"thread-{ident}"))
+                stacks[";".join(reversed(stack))] += 1
+            del frames
+            samples += 1
+            time.sleep(interval)
+    finally:
+        _sampling.release()
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common()), samples
+
+
+# -- tracemalloc snapshots ------------------------------------------------------
+
+def start_tracing(frames):
+    if tracemalloc.is_tracing():
+        return False
+    tracemalloc.start(frames)
+    return True
+
+
+def stop_tracing():
+    if not tracemalloc.is_tracing():
+        return False
+    tracemalloc.stop()
+    return True
+
+
+def _snapshot_path(name):
+    return os.path.join(profile_dir(), f"{name}.snapshot")
+
+
+def take_snapshot():
+    """Dump a tracemalloc snapshot of this worker. Returns its name."""
+    if not tracemalloc.is_tracing():
+        raise RuntimeError("tracemalloc is not running in this worker; start it first")
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ))
+    name = f"mem-{os.getpid()}-{time.strftime('%Y%m%d-%H%M%S')}-{time.monotonic_ns() % 1000000:06d}"
+    snapshot.dump(_snapshot_path(name))
+    return name
+
+
+def list_snapshots():
+    return sorted(n[:-len(".snapshot")] for n in os.listdir(profile_dir()) if n.endswith(".snapshot"))
+
+
+def _stat_row(stat):
+    frame = stat.traceback[0]
+    return {"where": f"{frame.filename}:{frame.lineno}", "size_kb": round(stat.size / 1024, 1), "count": stat.count}
+
+
+def snapshot_top(name, limit=25, key_type="lineno"):
+    snapshot = tracemalloc.Snapshot.load(_snapshot_path(name))
+    stats = snapshot.statistics(key_type)
+    return {
+        "snapshot": name,
+        "total_kb": round(sum(s.size for s in stats) / 1024, 1),
+        "top": [_stat_row(s) for s in stats[:limit]],
+    }
+
+
+def snapshot_diff(older, newer, limit=25, key_type="lineno"):
+    """Largest allocation changes between two snapshots (of the same worker to be meaningful)"""
+    before = tracemalloc.Snapshot.load(_snapshot_path(older))
+    after = tracemalloc.Snapshot.load(_snapshot_path(newer))
+    diff = after.compare_to(before, key_type)
+    return {
+        "from": older,
+        "to": newer,
+        "size_diff_kb": round(sum(d.size_diff for d in diff) / 1024, 1),
+        "top": [
+            dict(_stat_row(d), size_diff_kb=round(d.size_diff / 1024, 1), count_diff=d.count_diff)
+            for d in diff[:limit]
+        ],
+    }
+
+
+# -- cProfile of the next K requests ------------------------------------------------
+
+_armed = {}  # endpoint -> requests left to capture in this worker
+_armed_lock = threading.Lock()
+_capturing = threading.local()
+
+
+def arm_capture(endpoint, count):
+    with _armed_lock:
+        if count > 0:
+            _armed[endpoint] = count
+        else:
+            _armed.pop(endpoint, None)
+
+
+def armed_captures():
+    with _armed_lock:
+        return dict(_armed)
+
+
+def start_capture(endpoint):
+    """Start profiling this request if its endpoint is armed. Called for every request."""
+    if not _armed or endpoint not in _armed:
+        return
+    with _armed_lock:
+        left = _armed.get(endpoint, 0)
+        if left <= 0:
+            return
+        if left == 1:
+            del _armed[endpoint]
+        else:
+            _armed[endpoint] = left - 1
+    profiler = cProfile.Profile()
+    _capturing.profile = (endpoint, profiler)
+    profiler.enable()
+
+
+def finish_capture():
+    """Stop this request's profile and save it as ``<endpoint>-<pid>-<time>.prof``"""
+    capture = getattr(_capturing, "profile", None)
+    if capture is None:
+        return
+    _capturing.profile = None
+    endpoint, profiler = capture
+    profiler.disable()
+    name = f"req-{endpoint}-{os.getpid()}-{time.strftime('%Y%m%d-%H%M%S')}-{time.monotonic_ns() % 1000000:06d}"
+    profiler.dump_stats(os.path.join(profile_dir(), f"{name}.prof"))
+
+
+def list_captures():
+    return sorted(n[:-len(".prof")] for n in os.listdir(profile_dir()) if n.endswith(".prof"))
+
+
+def capture_path(name):
+    return os.path.join(profile_dir(), f"{name}.prof")
+
+
+def capture_text(name, limit=40, sort="cumulative"):
+    out = io.StringIO()
+    stats = pstats.Stats(capture_path(name), stream=out)
+    stats.strip_dirs().sort_stats(sort).print_stats(limit)
+    return out.getvalue()
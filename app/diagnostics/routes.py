@@ -0,0 +1,165 @@
+import os
+import re
+import tracemalloc
+from functools import wraps
+from flask import jsonify, request, abort, current_app, send_file
+from app.config import Config
+from app.diagnostics import diagnostics
+from app.diagnostics import profiling
+from app.auth.decorators import admin_required
+
+# Profiles, snapshots and captures are files in PROFILE_DIR; names are
+# generated by app/diagnostics/profiling.py and never contain a path
+_NAME = re.compile(r"^[\w.-]+$")
+
+
+def worker_pinned(f):
+    """``?pid=`` pins the call to one gunicorn worker: any other worker answers
+    503 with ``Retry-After: 0`` so the client can simply retry.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        pid = request.args.get('pid', type=int)
+        if pid is not None and pid != os.getpid():
+            response = jsonify({"error": f"Answered by worker {os.getpid()}, not {pid}", "pid": os.getpid()})
+            response.status_code = 503
+            response.headers['Retry-After'] = '0'
+            return response
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+def _checked_name(name, existing):
+    if not _NAME.match(name or "") or name not in existing:
+        abort(404)
+    return name
+
+
+@diagnostics.before_app_request
+def _start_capture():
+    profiling.start_capture(request.endpoint)
+
+
+@diagnostics.teardown_app_request
+def _finish_capture(exc=None):
+    profiling.finish_capture()
+
+
+@diagnostics.route('/')
+@admin_required
+@worker_pinned
+def index():
+    return jsonify({
+        "pid": os.getpid(),
+        "tracemalloc": tracemalloc.is_tracing(),
+        "armed": profiling.armed_captures(),
+        "snapshots": profiling.list_snapshots(),
+        "captures": profiling.list_captures(),
+    })
+
+
+@diagnostics.route('/cpu', methods=['POST'])
+@admin_required
+@worker_pinned
+def cpu():
+    """Sample the stacks of this worker's other threads and return collapsed stacks"""
+    seconds = min(request.args.get('seconds', 10, type=float), Config.PROFILE_MAX_SECONDS)
+    interval = max(request.args.get('interval_ms', 10, type=float), 1) / 1000
+    if seconds <= 0:
+        return jsonify({"error": "seconds must be positive"}), 400
+    try:
+        stacks, samples = profiling.sample_stacks(seconds, interval)
+    except profiling.Busy as e:
+        return jsonify({"error": str(e), "pid": os.getpid()}), 409
+    response = current_app.response_class(stacks, mimetype='text/plain')
+    response.headers['X-Profile-Pid'] = str(os.getpid())
+    response.headers['X-Profile-Samples'] = str(samples)
+    return response
+
+
+@diagnostics.route('/memory/start', methods=['POST'])
+@admin_required
+@worker_pinned
+def memory_start():
+    frames = min(max(request.args.get('frames', 1, type=int), 1), 25)
+    started = profiling.start_tracing(frames)
+    return jsonify({"pid": os.getpid(), "tracing": True, "started": started})
+
+
+@diagnostics.route('/memory/stop', methods=['POST'])
+@admin_required
+@worker_pinned
+def memory_stop():
+    stopped = profiling.stop_tracing()
+    return jsonify({"pid": os.getpid(), "tracing": False, "stopped": stopped})
+
+
+@diagnostics.route('/memory/snapshot', methods=['POST'])
+@admin_required
+@worker_pinned
+def memory_snapshot():
+    try:
+        name = profiling.take_snapshot()
+    except RuntimeError as e:
+        return jsonify({"error": str(e), "pid": os.getpid()}), 409
+    return jsonify({"pid": os.getpid(), "snapshot": name}), 201
+
+
+@diagnostics.route('/memory/snapshots/<name>')
+@admin_required
+@worker_pinned
+def memory_top(name):
+    name = _checked_name(name, profiling.list_snapshots())
+    limit = min(request.args.get('limit', 25, type=int), 200)
+    key_type = 'traceback' if request.args.get('group') == 'traceback' else 'lineno'
+    return jsonify(profiling.snapshot_top(name, limit, key_type))
+
+
+@diagnostics.route('/memory/diff')
+@admin_required
+@worker_pinned
+def memory_diff():
+    existing = profiling.list_snapshots()
+    older = _checked_name(request.args.get('from'), existing)
+    newer = _checked_name(request.args.get('to'), existing)
+    limit = min(request.args.get('limit', 25, type=int), 200)
+    key_type = 'traceback' if request.args.get('group') == 'traceback' else 'lineno'
+    return jsonify(profiling.snapshot_diff(older, newer, limit, key_type))
+
+
+@diagnostics.route('/requests', methods=['POST'])
+@admin_required
+@worker_pinned
+def arm_requests():
+    """cProfile the next ``count`` requests to ``endpoint`` handled by this worker"""
+    endpoint = request.args.get('endpoint', '')
+    count = request.args.get('count', 1, type=int)
+    if endpoint not in current_app.view_functions or endpoint.startswith('diagnostics.'):
+        return jsonify({"error": f"Unknown endpoint: {endpoint!r}"}), 400
+    if not 0 <= count <= Config.PROFILE_MAX_REQUESTS:
+        return jsonify({"error": f"count must be between 0 and {Config.PROFILE_MAX_REQUESTS}"}), 400
+    profiling.arm_capture(endpoint, count)
+    return jsonify({"pid": os.getpid(), "armed": profiling.armed_captures()})
+
+
+@diagnostics.route('/requests')
+@admin_required
+@worker_pinned
+def list_requests():
+    return jsonify({"pid": os.getpid(), "armed": profiling.armed_captures(), "captures": profiling.list_captures()})
+
+
+@diagnostics.route('/requests/<name>')
+@admin_required
+@worker_pinned
+def get_request_profile(name):
+    """The capture as a .prof file (snakeviz, pstats), or ?format=text for the top functions"""
+    name = _checked_name(name, profiling.list_captures())
+    if request.args.get('format') == 'text':
+        limit = min(request.args.get('limit', 40, type=int), 500)
+        sort = request.args.get('sort', 'cumulative')
+        if sort not in ('cumulative', 'tottime', 'calls'):
+            sort = 'cumulative'
+        return current_app.response_class(profiling.capture_text(name, limit, sort), mimetype='text/plain')
+    return send_file(profiling.capture_path(name), mimetype='application/octet-stream',
+                     as_attachment=True, download_name=f"{name}.prof")
@@ -0,0 +1,187 @@
+import os
+import queue
+import random
+import smtplib
+import ssl
+import threading
+import time
+from app.config import Config
+
+# Outbound email, delivered in the background.
+#
+# Requests only enqueue a message (``send_mail``) and return; a few daemon
+# worker threads per gunicorn process deliver it. Each worker keeps its SMTP
+# session (connect, STARTTLS, login) open across messages and closes it after
+# MAIL_IDLE_TIMEOUT seconds without mail. Temporary failures (connection
+# errors, 4xx replies) are retried with exponential back-off; permanent ones
+# (5xx replies) are logged and dropped. The queue is bounded: when it is full
+# the new message is dropped and counted, so a flood of reset requests cannot
+# grow memory or hold up the request threads.
+
+
+def _smtp_settings():
+    return {
+        "host": Config.SMTP_HOST,
+        "port": Config.SMTP_PORT,
+        "user": Config.SMTP_USER,
+        "password": Config.SMTP_PASSWORD,
+        "sender": Config.SMTP_SENDER or Config.SMTP_USER,
+        "use_tls": Config.SMTP_USE_TLS,
+    }
+
+
+def _is_temporary(err):
+    """Whether a delivery error is worth retrying.
+
+    smtplib.SMTPException subclasses OSError, so SMTP errors are classified
+    first: replies by their code (4xx temporary, 5xx permanent), a dropped
+    session as temporary, and the rest (unsupported STARTTLS or AUTH, no
+    usable auth method) as permanent configuration errors. Only then do
+    plain OSErrors (refused connects, timeouts, resets) count as temporary,
+    except certificate failures.
+    """
+    if isinstance(err, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, _ in err.recipients.values())
+    if isinstance(err, smtplib.SMTPResponseException):
+        # Includes SMTPAuthenticationError, SMTPSenderRefused, SMTPDataError, SMTPConnectError
+        return 400 <= err.smtp_code < 500
+    if isinstance(err, smtplib.SMTPServerDisconnected):
+        return True
+    if isinstance(err, smtplib.SMTPException):
+        return False
+    if isinstance(err, ssl.SSLCertVerificationError):
+        return False
+    return isinstance(err, OSError)
+
+
+class MailQueue:
+    """Bounded queue of EmailMessages delivered by background worker threads"""
+
+    def __init__(self, maxsize=100, workers=1, max_attempts=4, backoff=2.0,
+                 idle_timeout=30.0, timeout=10.0, settings=_smtp_settings):
+        self.maxsize = maxsize
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.settings = settings
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self._pid = None
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.retried = 0
+
+    def _ensure_workers(self):
+        # Threads do not survive a fork: start them in the process that sends
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(maxsize=self.maxsize)
+            for i in range(self.workers):
+                threading.Thread(target=self._run, name=f"mail-{i}", daemon=True).start()
+            self._pid = os.getpid()
+
+    def send(self, msg):
+        """Enqueue a message for delivery. Returns False if the queue was full and it was dropped."""
+        self._ensure_workers()
+        try:
+            self._queue.put_nowait(msg)
+            return True
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            print(f"Mail queue full ({self.maxsize}); dropped message to {msg['To']}")
+            return False
+
+    def join(self):
+        """Block until every queued message was delivered or given up on"""
+        if self._pid == os.getpid():
+            self._queue.join()
+
+    def stats(self):
+        with self._lock:
+            return {"queued": self._queue.qsize(), "maxsize": self.maxsize, "sent": self.sent,
+                    "failed": self.failed, "dropped": self.dropped, "retried": self.retried}
+
+    def _connect(self):
+        cfg = self.settings()
+        smtp = smtplib.SMTP(cfg["host"], cfg["port"], timeout=self.timeout)
+        try:
+            if cfg["use_tls"]:
+                smtp.starttls()
+            if cfg["user"] and cfg["password"]:
+                smtp.login(cfg["user"], cfg["password"])
+        except Exception:
+            smtp.close()
+            raise
+        return smtp
+
+    @staticmethod
+    def _close(smtp):
+        try:
+            smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            smtp.close()
+
+    def _deliver(self, smtp, msg):
+        """Send one message, retrying temporary failures. Returns the (possibly new) session."""
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                if smtp is None:
+                    smtp = self._connect()
+                if "From" not in msg:
+                    msg["From"] = self.settings()["sender"]
+                smtp.send_message(msg)
+                with self._lock:
+                    self.sent += 1
+                return smtp
+            except Exception as err:
+                if smtp is not None:
+                    # The session state is unknown after an error: start over
+                    self._close(smtp)
+                    smtp = None
+                if not _is_temporary(err) or attempt == self.max_attempts:
+                    with self._lock:
+                        self.failed += 1
+                    print(f"Mail to {msg['To']} failed after {attempt} attempt(s): {err}")
+                    return None
+                delay = self.backoff * 2 ** (attempt - 1)
+                with self._lock:
+                    self.retried += 1
+                print(f"Mail to {msg['To']} failed ({err}); retrying in {delay:.0f}s")
+                time.sleep(delay * random.uniform(0.8, 1.2))
+        return smtp
+
+    def _run(self):
+        smtp = None
+        while True:
+            try:
+                msg = self._queue.get(timeout=self.idle_timeout if smtp is not None else None)
+            except queue.Empty:
+                self._close(smtp)
+                smtp = None
+                continue
+            try:
+                smtp = self._deliver(smtp, msg)
+            finally:
+                self._queue.task_done()
+
+
+mail_queue = MailQueue(
+    maxsize=Config.MAIL_QUEUE_SIZE,
+    workers=Config.MAIL_WORKERS,
+    max_attempts=Config.MAIL_MAX_ATTEMPTS,
+    backoff=Config.MAIL_RETRY_BACKOFF,
+    idle_timeout=Config.MAIL_IDLE_TIMEOUT,
+    timeout=Config.SMTP_TIMEOUT,
+)
+
+
+def send_mail(msg):
+    """Queue an EmailMessage for background delivery (never blocks on SMTP)"""
+    return mail_queue.send(msg)
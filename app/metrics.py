@@ -0,0 +1,109 @@
+import os
+import time
+from flask import g, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Gauge, Histogram, generate_latest, multiprocess,
+)
+from app.config import Config
+from app.db import request_db_stats
+
+# Prometheus metrics (/metrics).
+#
+# Every request of every blueprint is recorded from before/after_request
+# hooks: latency by endpoint, method and status, response size, in-flight
+# requests, and the DB connect time, query count and query time the request
+# spent (app/db.py). Under gunicorn each worker writes its samples to
+# memory-mapped files in PROMETHEUS_MULTIPROC_DIR (see gunicorn.conf.py) and
+# /metrics merges them, so any worker answers for all. Without that variable
+# (flask run) the metrics are those of the single process.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+REQUEST_LATENCY = Histogram(
+    "dnotes_http_request_duration_seconds", "Time to produce a response (streamed bodies excluded)",
+    ["endpoint", "method", "status"], buckets=LATENCY_BUCKETS,
+)
+RESPONSE_SIZE = Histogram(
+    "dnotes_http_response_size_bytes", "Response body size as sent (after compression; streamed bodies excluded)",
+    ["endpoint"], buckets=SIZE_BUCKETS,
+)
+IN_FLIGHT = Gauge(
+    "dnotes_http_requests_in_flight", "Requests being handled", multiprocess_mode="livesum",
+)
+DB_CONNECT = Histogram(
+    "dnotes_db_connect_seconds", "Time to check out a pooled connection (including any connect) per request",
+    buckets=DB_BUCKETS,
+)
+DB_QUERIES = Histogram(
+    "dnotes_db_queries_per_request", "SQL statements executed per request",
+    ["endpoint"], buckets=QUERY_COUNT_BUCKETS,
+)
+DB_QUERY_TIME = Histogram(
+    "dnotes_db_query_seconds_per_request", "Time spent in SQL statements per request",
+    ["endpoint"], buckets=DB_BUCKETS + (2.5, 5.0),
+)
+
+
+_children = {}
+
+
+def _child(metric, *labels):
+    # labels() validates and locks on every call; reuse the child instead
+    key = (metric, labels)
+    child = _children.get(key)
+    if child is None:
+        child = _children[key] = metric.labels(*labels)
+    return child
+
+
+def _before_request():
+    g._metrics_started = time.perf_counter()
+    IN_FLIGHT.inc()
+
+
+def _after_request(response):
+    started = g.pop("_metrics_started", None)
+    if started is None:
+        return response
+    IN_FLIGHT.dec()
+    # Unmatched URLs share one label, so probes cannot blow up the series count
+    endpoint = request.endpoint or "unmatched"
+    _child(REQUEST_LATENCY, endpoint, request.method, str(response.status_code)).observe(time.perf_counter() - started)
+    if not response.is_streamed and response.content_length is not None:
+        _child(RESPONSE_SIZE, endpoint).observe(response.content_length)
+
+    db = request_db_stats()
+    if db is not None:
+        if db["connect"]:
+            DB_CONNECT.observe(db["connect"])
+        _child(DB_QUERIES, endpoint).observe(db["queries"])
+        _child(DB_QUERY_TIME, endpoint).observe(db["query_time"])
+    return response
+
+
+def _teardown_request(exc=None):
+    # A request that failed before after_request still leaves the gauge
+    if g.pop("_metrics_started", None) is not None:
+        IN_FLIGHT.dec()
+
+
+def metrics():
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), 200, {"Content-Type": CONTENT_TYPE_LATEST}
+
+
+def init_metrics(app):
+    """Register the hooks and /metrics. Call before other after_request hooks (it then runs last)."""
+    if not Config.METRICS_ENABLED:
+        return
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    app.add_url_rule("/metrics", "metrics", metrics)
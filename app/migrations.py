@@ -0,0 +1,568 @@
+import time
+import mysql.connector
+from app.config import Config
+from app.db import ensure_indexes
+from app.search import backfill_search_text
+from app.stats import rebuild_note_stats
+from app.tags import backfill_note_tags
+
+# Versioned schema migrations.
+#
+# MIGRATIONS is the ordered list of schema changes, shared by init_db() (app
+# boot) and scripts/migrate.py. ``schema_migrations`` records the versions
+# applied, so booting against an up-to-date database costs one query.
+#
+# MySQL commits DDL implicitly, so a step is not atomic: every step must be
+# safe to re-run after being interrupted half-way. Add changes as a new step
+# with the next version number; never edit or reorder applied ones. Data
+# fixes over big tables go through MigrationRun.backfill (or a Backfill
+# step) so they never hold row locks on more than one batch at a time.
+
+MIGRATION_LOCK = "dnotes_schema_migrations"
+MIGRATION_LOCK_TIMEOUT = 600
+PROGRESS_INTERVAL = 5  # seconds between backfill progress lines
+
+DEFAULT_CATEGORIES = [
+    ("Docker", "#3b82f6"),
+    ("Kubernetes", "#6366f1"),
+    ("Linux", "#22c55e"),
+    ("CI/CD", "#f59e0b"),
+    ("AWS", "#f97316"),
+    ("Monitoring", "#a855f7"),
+    ("Other", "#64748b"),
+]
+
+# Columns added after their table was first released: table -> [(column, definition)]
+ADDED_COLUMNS = {
+    "users": [
+        ("role", "VARCHAR(20) DEFAULT 'user'"),
+        ("api_token", "VARCHAR(64)"),
+        ("api_token_hash", "CHAR(64)"),
+        ("bio", "VARCHAR(300)"),
+        ("profile_picture", "VARCHAR(255)"),
+        ("created_at", "TIMESTAMP DEFAULT CURRENT_TIMESTAMP"),
+        ("notes_version", "BIGINT NOT NULL DEFAULT 0"),
+        ("notes_modified_at", "TIMESTAMP NULL"),
+        ("tombstone_horizon", "BIGINT NOT NULL DEFAULT 0"),
+    ],
+    "categories": [
+        ("color", "VARCHAR(20) DEFAULT '#3b82f6'"),
+        ("is_system", "BOOLEAN DEFAULT FALSE"),
+    ],
+    "notes": [
+        ("user_id", "INT"),
+        ("is_public", "BOOLEAN DEFAULT FALSE"),
+        ("public_id", "VARCHAR(36)"),
+        ("created_at", "TIMESTAMP DEFAULT CURRENT_TIMESTAMP"),
+        ("example", "TEXT"),
+        ("tags", "VARCHAR(500)"),
+        ("category", "VARCHAR(50)"),
+        ("search_text", "MEDIUMTEXT"),
+        ("version", "INT NOT NULL DEFAULT 1"),
+        # Added without a default so existing rows stay NULL until the
+        # backfill gives them created_at; updated_at_default sets it after
+        ("updated_at", "TIMESTAMP NULL DEFAULT NULL ON UPDATE CURRENT_TIMESTAMP"),
+        ("change_seq", "BIGINT NOT NULL DEFAULT 0"),
+        ("description_html", "MEDIUMTEXT"),
+        ("example_html", "MEDIUMTEXT"),
+        ("sanitizer_version", "SMALLINT NOT NULL DEFAULT 0"),
+    ],
+}
+
+
+def _columns(cursor, table):
+    cursor.execute("""
+        SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+    """, (table,))
+    return {row[0] for row in cursor.fetchall()}
+
+
+def _has_unique_index(cursor, table, column):
+    cursor.execute("""
+        SELECT COUNT(*) FROM INFORMATION_SCHEMA.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s AND NON_UNIQUE = 0
+    """, (table, column))
+    return cursor.fetchone()[0] > 0
+
+
+def create_tables(run):
+    cursor = run.cursor
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            username VARCHAR(80) NOT NULL,
+            email VARCHAR(120) NOT NULL,
+            password_hash VARCHAR(255) NOT NULL,
+            role VARCHAR(20) DEFAULT 'user',
+            api_token VARCHAR(64),
+            api_token_hash CHAR(64),
+            bio VARCHAR(300),
+            profile_picture VARCHAR(255),
+            notes_version BIGINT NOT NULL DEFAULT 0,
+            notes_modified_at TIMESTAMP NULL,
+            tombstone_horizon BIGINT NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS categories (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            name VARCHAR(80) NOT NULL,
+            color VARCHAR(20) DEFAULT '#3b82f6',
+            is_system BOOLEAN DEFAULT FALSE
+        )
+    """)
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS notes (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            command VARCHAR(255) NOT NULL,
+            description TEXT NOT NULL,
+            description_html MEDIUMTEXT,
+            category VARCHAR(50),
+            example TEXT,
+            example_html MEDIUMTEXT,
+            tags VARCHAR(500),
+            user_id INT,
+            is_public BOOLEAN DEFAULT FALSE,
+            public_id VARCHAR(36),
+            search_text MEDIUMTEXT,
+            sanitizer_version SMALLINT NOT NULL DEFAULT 0,
+            version INT NOT NULL DEFAULT 1,
+            change_seq BIGINT NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        )
+    """)
+
+    # Normalized tags (app/tags.py); note_tags rows go away with their note
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS tags (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            name VARCHAR(100) COLLATE utf8mb4_bin NOT NULL,
+            UNIQUE KEY ux_tags_name (name)
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS note_tags (
+            note_id INT NOT NULL,
+            tag_id INT NOT NULL,
+            user_id INT NOT NULL,
+            PRIMARY KEY (note_id, tag_id),
+            KEY ix_note_tags_user_tag (user_id, tag_id, note_id),
+            CONSTRAINT fk_note_tags_notes FOREIGN KEY (note_id) REFERENCES notes(id) ON DELETE CASCADE,
+            CONSTRAINT fk_note_tags_tags FOREIGN KEY (tag_id) REFERENCES tags(id)
+        )
+    """)
+
+    # Deleted notes, remembered for delta sync (/api/notes/changes)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS note_tombstones (
+            user_id INT NOT NULL,
+            note_id INT NOT NULL,
+            change_seq BIGINT NOT NULL,
+            deleted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, change_seq, note_id),
+            KEY ix_note_tombstones_user_deleted (user_id, deleted_at)
+        )
+    """)
+
+    # Per-user dashboard counters (app/stats.py)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS user_note_stats (
+            user_id INT NOT NULL,
+            kind VARCHAR(10) NOT NULL,
+            name VARCHAR(500) COLLATE utf8mb4_bin NOT NULL,
+            count INT NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, kind, name),
+            KEY ix_user_note_stats_top (user_id, kind, count)
+        )
+    """)
+
+
+def add_missing_columns(run):
+    """Bring tables created by older releases up to the current columns (non-destructive)"""
+    cursor = run.cursor
+    for table, columns in ADDED_COLUMNS.items():
+        existing = _columns(cursor, table)
+        for name, definition in columns:
+            if name in existing:
+                continue
+            if (table, name) == ("notes", "updated_at"):
+                # Registered before the ALTER so an interrupted copy resumes
+                run.start_backfill("notes.updated_at")
+            run.log(f"Adding {name} column to {table}...")
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+
+
+def updated_at_default(run):
+    """Give notes.updated_at its CURRENT_TIMESTAMP default once the backfill is done.
+
+    Notes inserted while the backfill ran (above its last id) are still NULL;
+    they get their created_at too, by primary key range.
+    """
+    cursor = run.cursor
+    cursor.execute("SELECT last_id FROM schema_backfills WHERE name = %s", ("notes.updated_at",))
+    row = cursor.fetchone()
+    if row is None:
+        return
+    cursor.execute("""
+        SELECT COLUMN_DEFAULT FROM INFORMATION_SCHEMA.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'notes' AND COLUMN_NAME = 'updated_at'
+    """)
+    if cursor.fetchone()[0] is None:
+        run.log("Setting the default of notes.updated_at...")
+        cursor.execute(
+            "ALTER TABLE notes MODIFY COLUMN updated_at "
+            "TIMESTAMP NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP"
+        )
+    cursor.execute(
+        "UPDATE notes SET updated_at = created_at WHERE id > %s AND updated_at IS NULL", (row[0],)
+    )
+    run.conn.commit()
+
+
+def hash_api_tokens(run):
+    # Replace plaintext API tokens with their SHA-256 digest. Existing
+    # tokens keep working: the app hashes the presented token the same way.
+    run.cursor.execute("""
+        UPDATE users SET api_token_hash = SHA2(api_token, 256), api_token = NULL
+        WHERE api_token IS NOT NULL AND api_token_hash IS NULL
+    """)
+    if run.cursor.rowcount:
+        run.log(f"Hashed {run.cursor.rowcount} plaintext API token(s)")
+    run.conn.commit()
+
+
+def unique_constraints(run):
+    cursor = run.cursor
+    for column in ("email", "username", "api_token_hash"):
+        if not _has_unique_index(cursor, "users", column):
+            run.log(f"Adding UNIQUE index on users({column})...")
+            cursor.execute(f"CREATE UNIQUE INDEX ux_users_{column} ON users ({column})")
+
+    # Notes refer to categories by name, so dropping a duplicate row is safe
+    cursor.execute("SELECT id, name FROM categories ORDER BY id")
+    seen = {}
+    duplicates = []
+    for category_id, name in cursor.fetchall():
+        key = name.strip().lower()
+        if key in seen:
+            duplicates.append(category_id)
+            run.log(f"Removing duplicate category '{name}' (id {category_id}, keeping {seen[key]})")
+        else:
+            seen[key] = category_id
+    if duplicates:
+        cursor.execute(
+            f"DELETE FROM categories WHERE id IN ({', '.join(['%s'] * len(duplicates))})",
+            tuple(duplicates)
+        )
+        run.conn.commit()
+
+    if not _has_unique_index(cursor, "categories", "name"):
+        run.log("Adding UNIQUE index on categories(name)...")
+        cursor.execute("CREATE UNIQUE INDEX ux_categories_name ON categories (name)")
+
+
+def default_categories(run):
+    cursor = run.cursor
+    cursor.execute("SELECT name FROM categories")
+    existing = {row[0].strip().lower() for row in cursor.fetchall() if row[0]}
+    for name, color in DEFAULT_CATEGORIES:
+        if name.lower() in existing:
+            continue
+        try:
+            cursor.execute("INSERT INTO categories (name, color, is_system) VALUES (%s, %s, TRUE)", (name, color))
+        except mysql.connector.Error as err:
+            if err.errno != 1062:  # Duplicate entry
+                raise
+    run.conn.commit()
+
+
+def notes_foreign_key(run):
+    cursor = run.cursor
+    cursor.execute("""
+        SELECT CONSTRAINT_NAME FROM INFORMATION_SCHEMA.KEY_COLUMN_USAGE
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'notes'
+          AND COLUMN_NAME = 'user_id' AND REFERENCED_TABLE_NAME = 'users'
+    """)
+    if cursor.fetchone() is None:
+        try:
+            cursor.execute("ALTER TABLE notes ADD CONSTRAINT fk_notes_users FOREIGN KEY (user_id) REFERENCES users(id)")
+        except mysql.connector.Error as err:
+            # Best-effort: orphaned notes from old releases block the constraint
+            run.log(f"Warning: could not add notes.user_id foreign key: {err}")
+
+
+def note_indexes(run):
+    for name in ensure_indexes(run.cursor):
+        run.log(f"Created index {name}")
+
+
+def build_note_stats(run):
+    rebuilt = rebuild_note_stats(run.conn)
+    if rebuilt:
+        run.log(f"Built dashboard stats for {len(rebuilt)} user(s)")
+
+
+class Backfill:
+    """A step that only updates rows, run in primary-key ranges (MigrationRun.backfill):
+    ``UPDATE table SET assignments WHERE where``, or ``batch(conn, after_id, upto_id)``
+    for values computed in Python. ``where`` selects the rows still to do, which
+    keeps the step idempotent and lets --dry-run estimate it (a ``batch`` applies
+    the same filter itself).
+
+    A ``guarded`` backfill only runs after an earlier step registered it with
+    run.start_backfill, e.g. right before the ALTER that added the column it
+    fills; until then --dry-run counts every row of the table.
+    """
+
+    def __init__(self, name, table, assignments=None, where=None, batch=None, guarded=False):
+        self.name = name
+        self.table = table
+        self.assignments = assignments
+        self.where = where
+        self.batch = batch
+        self.guarded = guarded
+
+    def __call__(self, run):
+        if self.guarded and not run.backfill_pending(self.name):
+            return
+        run.backfill(self.name, self.table, self.assignments, self.where, batch=self.batch)
+
+    def estimate(self, run):
+        """Rows still to update, from the optimizer's estimate (no scan)"""
+        where = "" if self.guarded or not self.where else f" WHERE {self.where}"
+        run.cursor.execute(f"EXPLAIN SELECT id FROM {self.table}{where}")
+        columns = [d[0] for d in run.cursor.description]
+        plans = [dict(zip(columns, row)) for row in run.cursor.fetchall()]
+        return sum(plan.get("rows") or 0 for plan in plans if plan.get("table") == self.table)
+
+
+class Steps:
+    """Several steps applied in order as one migration"""
+
+    def __init__(self, *steps):
+        self.steps = steps
+
+    def __call__(self, run):
+        for step in self.steps:
+            step(run)
+
+
+# (version, name, step(run)), in the order they apply
+MIGRATIONS = [
+    (1, "create tables", create_tables),
+    # Existing notes start at their created_at (registered by the ALTER).
+    # Only rows still NULL are filled: a note edited meanwhile keeps the
+    # time ON UPDATE gave it.
+    (2, "add missing columns", Steps(
+        add_missing_columns,
+        Backfill("notes.updated_at", "notes", "updated_at = created_at", "updated_at IS NULL", guarded=True),
+        updated_at_default,
+    )),
+    (3, "hash plaintext API tokens", hash_api_tokens),
+    (4, "unique users and categories", unique_constraints),
+    (5, "default categories", default_categories),
+    (6, "notes foreign key", notes_foreign_key),
+    (7, "note indexes", note_indexes),
+    (8, "backfill search text and note tags", Steps(
+        Backfill("notes.search_text", "notes", where="search_text IS NULL", batch=backfill_search_text),
+        Backfill("note_tags", "notes", batch=backfill_note_tags, where=(
+            "tags IS NOT NULL AND tags <> '' "
+            "AND NOT EXISTS (SELECT 1 FROM note_tags nt WHERE nt.note_id = notes.id)"
+        )),
+    )),
+    (9, "build dashboard stats", build_note_stats),
+    # Descriptions stored before description_html existed were sanitized on
+    # write; serve them until scripts/resanitize_notes.py re-renders them
+    (10, "copy stored note HTML", Backfill(
+        "notes.html", "notes",
+        "description_html = COALESCE(description_html, description), "
+        "example_html = COALESCE(example_html, example), updated_at = updated_at",
+        "description_html IS NULL OR (example_html IS NULL AND example IS NOT NULL)"
+    )),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+class MigrationRun:
+    """What a step gets: the connection, a cursor, ``log`` and the backfill pacing.
+
+    ``backfill`` updates a table ``batch_size`` primary keys at a time, one
+    transaction per batch, sleeping ``sleep`` seconds in between so
+    replication and the app's own writes keep up. Progress is checkpointed in
+    ``schema_backfills`` with every batch, so an interrupted run resumes at
+    the next batch.
+    """
+
+    def __init__(self, conn, log=print, batch_size=None, sleep=None):
+        self.conn = conn
+        self.cursor = conn.cursor()
+        self.log = log
+        self.batch_size = batch_size or Config.MIGRATION_BATCH_SIZE
+        self.sleep = Config.MIGRATION_BATCH_SLEEP if sleep is None else sleep
+
+    def start_backfill(self, name):
+        self.cursor.execute("INSERT IGNORE INTO schema_backfills (name) VALUES (%s)", (name,))
+        self.conn.commit()
+
+    def backfill_pending(self, name):
+        """Whether a started backfill has not finished yet"""
+        self.cursor.execute("SELECT finished_at FROM schema_backfills WHERE name = %s", (name,))
+        row = self.cursor.fetchone()
+        return row is not None and row[0] is None
+
+    def backfill(self, name, table, assignments=None, where=None, batch=None):
+        """``UPDATE table SET assignments [WHERE where]`` in primary-key ranges, or
+        ``batch(conn, after_id, upto_id)`` (returning rows changed) for each range
+        when the values are computed in Python. Returns rows changed."""
+        cursor = self.cursor
+        self.start_backfill(name)
+        cursor.execute("SELECT last_id, rows_done, finished_at FROM schema_backfills WHERE name = %s", (name,))
+        last_id, rows_done, finished_at = cursor.fetchone()
+        if finished_at is not None:
+            return rows_done
+
+        # Rows inserted from now on are written complete by the app
+        cursor.execute(f"SELECT MAX(id) FROM {table}")
+        max_id = cursor.fetchone()[0] or 0
+        statement = f"UPDATE {table} SET {assignments} WHERE id > %s AND id <= %s"
+        if where:
+            statement += f" AND ({where})"
+
+        start_id = last_id
+        started = last_report = time.monotonic()
+        while last_id < max_id:
+            upper = min(last_id + self.batch_size, max_id)
+            if batch is None:
+                cursor.execute(statement, (last_id, upper))
+                rows_done += cursor.rowcount
+            else:
+                rows_done += batch(self.conn, last_id, upper)
+            cursor.execute(
+                "UPDATE schema_backfills SET last_id = %s, rows_done = %s WHERE name = %s",
+                (upper, rows_done, name)
+            )
+            self.conn.commit()
+            last_id = upper
+
+            now = time.monotonic()
+            if now - last_report >= PROGRESS_INTERVAL or last_id >= max_id:
+                last_report = now
+                rate = (last_id - start_id) / max(now - started, 1e-6)
+                eta = (max_id - last_id) / rate if rate else 0
+                self.log(f"{name}: {last_id * 100 // max_id}% (id {last_id}/{max_id}), "
+                         f"{rows_done} row(s) updated, {rate:.0f} ids/s, eta {eta:.0f}s")
+            if self.sleep and last_id < max_id:
+                time.sleep(self.sleep)
+
+        cursor.execute("UPDATE schema_backfills SET finished_at = CURRENT_TIMESTAMP WHERE name = %s", (name,))
+        self.conn.commit()
+        return rows_done
+
+    def close(self):
+        self.cursor.close()
+
+
+def schema_version(cursor):
+    """Highest applied migration version, 0 for a database that predates them"""
+    try:
+        cursor.execute("SELECT MAX(version) FROM schema_migrations")
+    except mysql.connector.Error as err:
+        if err.errno == 1146:  # Table doesn't exist
+            return 0
+        raise
+    return cursor.fetchone()[0] or 0
+
+
+def applied_versions(cursor):
+    if not schema_version(cursor):
+        return set()
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def estimate_migrations(conn, log=print, batch_size=None, sleep=None):
+    """Dry run: list the pending MIGRATIONS with row estimates for backfills. Writes nothing."""
+    run = MigrationRun(conn, log, batch_size, sleep)
+    try:
+        applied = applied_versions(run.cursor)
+        pending = [m for m in MIGRATIONS if m[0] not in applied]
+        for version, name, step in pending:
+            parts = step.steps if isinstance(step, Steps) else (step,)
+            backfills = [part for part in parts if isinstance(part, Backfill)]
+            if not backfills:
+                log(f"{version:>4}  {name}")
+            for backfill in backfills:
+                try:
+                    rows = backfill.estimate(run)
+                except mysql.connector.Error:
+                    # The table or column is created by an earlier pending step
+                    log(f"{version:>4}  {name}: backfill {backfill.name}, rows unknown until it exists")
+                    continue
+                batches = -(-rows // run.batch_size)
+                log(f"{version:>4}  {name}: backfill {backfill.name} of ~{rows} {backfill.table} row(s), "
+                    f"{run.batch_size} ids per batch, >= {batches * run.sleep:.0f}s of pauses")
+        return [m[0] for m in pending]
+    finally:
+        run.close()
+
+
+def apply_migrations(conn, log=print, batch_size=None, sleep=None):
+    """Apply the pending MIGRATIONS in order. Returns the versions applied.
+
+    Holds a MySQL named lock throughout, so concurrently booting workers
+    wait for one of them to migrate instead of all running the steps.
+    """
+    run = MigrationRun(conn, log, batch_size, sleep)
+    cursor = run.cursor
+    try:
+        cursor.execute("SELECT GET_LOCK(%s, %s)", (MIGRATION_LOCK, MIGRATION_LOCK_TIMEOUT))
+        if cursor.fetchone()[0] != 1:
+            raise RuntimeError("Timed out waiting for another process to finish migrating")
+        try:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version INT PRIMARY KEY,
+                    name VARCHAR(100) NOT NULL,
+                    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    duration_ms INT NOT NULL DEFAULT 0
+                )
+            """)
+            # Checkpoints of MigrationRun.backfill
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS schema_backfills (
+                    name VARCHAR(100) PRIMARY KEY,
+                    last_id BIGINT NOT NULL DEFAULT 0,
+                    rows_done BIGINT NOT NULL DEFAULT 0,
+                    started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    finished_at TIMESTAMP NULL
+                )
+            """)
+            applied = applied_versions(cursor)
+
+            done = []
+            for version, name, step in MIGRATIONS:
+                if version in applied:
+                    continue
+                log(f"Applying migration {version}: {name}...")
+                started = time.monotonic()
+                step(run)
+                duration_ms = int((time.monotonic() - started) * 1000)
+                cursor.execute(
+                    "INSERT INTO schema_migrations (version, name, duration_ms) VALUES (%s, %s, %s)",
+                    (version, name, duration_ms)
+                )
+                conn.commit()
+                log(f"Applied migration {version} in {duration_ms} ms")
+                done.append(version)
+            return done
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (MIGRATION_LOCK,))
+            cursor.fetchone()
+    finally:
+        run.close()
@@ -0,0 +1,282 @@
+from app.config import Config
+from app.db import get_db_connection, checkout_connection
+from app.search import search_clause
+
+# Prefix of cursors for relevance-ranked (search) pages, which cannot be
+# keyset-paginated on id
+RANK_CURSOR_PREFIX = "rank:"
+
+
+class CursorExpired(Exception):
+    """The delta-sync cursor predates the tombstone retention window; resync from scratch."""
+
+
+def touch_collection(cursor, user_id):
+    """Bump a user's notes collection version and return it.
+
+    The new version is the change sequence to stamp on the notes (``change_seq``)
+    and tombstones the write touches. Call it first in every note write's
+    transaction: the user's row stays locked until commit, so a user's writes
+    commit in sequence order and delta sync cannot skip one.
+    """
+    cursor.execute(
+        """
+        UPDATE users SET notes_version = LAST_INSERT_ID(notes_version + 1), notes_modified_at = CURRENT_TIMESTAMP
+        WHERE id = %s
+        """,
+        (user_id,)
+    )
+    return cursor.lastrowid
+
+
+def inserted_note_ids(cursor, user_id, seq, count):
+    """Ids of the ``count`` notes a multi-row INSERT just stamped with ``seq``, in row order.
+
+    Read back rather than counted up from LAST_INSERT_ID(): ids need not be
+    consecutive (``auto_increment_increment``, interleaved lock mode). Call it
+    right after the INSERT, before the transaction stamps ``seq`` on any
+    other note; the user's row lock keeps other writers out.
+    """
+    cursor.execute(
+        "SELECT id FROM notes WHERE user_id = %s AND change_seq = %s ORDER BY id", (user_id, seq)
+    )
+    ids = [row[0] for row in cursor.fetchall()]
+    if len(ids) != count:
+        raise RuntimeError(f"Expected {count} new note(s) at change_seq {seq}, found {len(ids)}")
+    return ids
+
+
+def record_tombstones(cursor, user_id, note_ids, seq):
+    """Remember deleted notes for delta sync, dropping the user's expired tombstones"""
+    cursor.executemany(
+        "INSERT INTO note_tombstones (user_id, note_id, change_seq) VALUES (%s, %s, %s)",
+        [(user_id, note_id, seq) for note_id in note_ids]
+    )
+    cursor.execute(
+        """
+        SELECT MAX(change_seq) FROM note_tombstones
+        WHERE user_id = %s AND deleted_at < NOW() - INTERVAL %s DAY
+        """,
+        (user_id, Config.TOMBSTONE_RETENTION_DAYS)
+    )
+    horizon = cursor.fetchone()[0]
+    if horizon:
+        # Cursors older than this can no longer see every delete
+        cursor.execute(
+            "UPDATE users SET tombstone_horizon = GREATEST(tombstone_horizon, %s) WHERE id = %s",
+            (horizon, user_id)
+        )
+        cursor.execute(
+            "DELETE FROM note_tombstones WHERE user_id = %s AND change_seq <= %s",
+            (user_id, horizon)
+        )
+
+
+def collection_version(user_id):
+    """``(notes_version, notes_modified_at)`` of a user's notes, read fresh (not from the user cache)"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT notes_version, notes_modified_at FROM users WHERE id = %s", (user_id,))
+    row = cursor.fetchone()
+    cursor.close()
+    conn.close()
+    return row if row else (0, None)
+
+
+def parse_limit(value, default=None):
+    """Page size from a query-string value, clamped to NOTES_PAGE_MAX. Raises ValueError."""
+    if value in (None, ""):
+        return default or Config.NOTES_PAGE_SIZE
+    limit = int(value)
+    if limit < 1:
+        raise ValueError("limit must be positive")
+    return min(limit, Config.NOTES_PAGE_MAX)
+
+
+def fetch_note_page(user_id, limit, after=None, category=None, search=None,
+                    tag=None, fields="*", blank_as_other=False):
+    """One page of a user's notes.
+
+    Listings are newest first and keyset-paginated on ``id`` (the cursor is
+    the last id seen), so every page is an index range scan on
+    ``(user_id, id)`` no matter how deep. ``tag`` filters through
+    ``note_tags (user_id, tag_id, note_id)``. Searches are ordered by relevance;
+    their cursor is an offset prefixed with ``rank:``.
+
+    Returns ``(notes, next_cursor)``; ``next_cursor`` is None on the last
+    page. Raises ValueError for a malformed cursor.
+    """
+    query = f"SELECT {fields} FROM notes WHERE user_id = %s"
+    params = [user_id]
+
+    if category:
+        if blank_as_other and category.lower() == "other":
+            # The dashboard lists uncategorized notes under "other"
+            query += " AND (category = %s OR category IS NULL OR category = '')"
+        else:
+            query += " AND category = %s"
+        params.append(category)
+
+    if tag:
+        query += """ AND id IN (
+            SELECT nt.note_id FROM note_tags nt JOIN tags t ON t.id = nt.tag_id
+            WHERE nt.user_id = %s AND t.name = %s
+        )"""
+        params.extend([user_id, tag.strip()])
+
+    clause = search_clause(search) if search else None
+    ranked = bool(clause and clause[2])
+    if clause:
+        where_sql, where_params, _, _ = clause
+        query += " AND " + where_sql
+        params.extend(where_params)
+
+    if ranked:
+        offset = 0
+        if after:
+            if not after.startswith(RANK_CURSOR_PREFIX):
+                raise ValueError("cursor does not belong to this search")
+            offset = int(after[len(RANK_CURSOR_PREFIX):])
+            if offset < 0:
+                raise ValueError("negative cursor offset")
+        query += f" ORDER BY {clause[2]}, id DESC LIMIT %s OFFSET %s"
+        params.extend(clause[3])
+        params.extend([limit + 1, offset])
+    else:
+        if after:
+            query += " AND id < %s"
+            params.append(int(after))
+        query += " ORDER BY id DESC LIMIT %s"
+        params.append(limit + 1)
+
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    cursor.execute(query, tuple(params))
+    notes = cursor.fetchall()
+    cursor.close()
+    conn.close()
+
+    next_cursor = None
+    if len(notes) > limit:
+        notes = notes[:limit]
+        next_cursor = f"{RANK_CURSOR_PREFIX}{offset + limit}" if ranked else str(notes[-1]["id"])
+    return notes, next_cursor
+
+
+
+class NoteStream:
+    """Every note of a user, oldest first, as lists of ``batch_size`` rows.
+
+    Rows come from an unbuffered cursor on a connection of its own (the
+    request's connection is released before a streamed body is sent), so
+    memory stays flat however many notes there are. The connection is
+    checked out up front, so an unavailable database still gets its 503.
+    ``close()`` must be called (e.g. ``response.call_on_close``); a stream
+    abandoned midway discards its connection since unread rows are pending.
+    """
+
+    def __init__(self, user_id, fields="*", batch_size=None):
+        self._batch_size = batch_size or Config.EXPORT_BATCH_SIZE
+        self._conn = checkout_connection()
+        try:
+            self._cursor = self._conn.cursor(dictionary=True, buffered=False)
+            self._cursor.execute(f"SELECT {fields} FROM notes WHERE user_id = %s ORDER BY id", (user_id,))
+        except Exception:
+            self.close()
+            raise
+
+    def __iter__(self):
+        while self._conn is not None:
+            rows = self._cursor.fetchmany(self._batch_size)
+            if not rows:
+                conn, self._conn = self._conn, None
+                self._cursor.close()
+                conn.close()
+                return
+            yield rows
+
+    def close(self):
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            conn.release(discard=True)
+
+
+def parse_change_cursor(value):
+    """Delta-sync cursor: None (full sync), ``"S"`` (after change S) or
+    ``"S:I"`` (within change S, after note I). Raises ValueError."""
+    if not value:
+        return None
+    seq, _, note_id = value.partition(":")
+    seq, note_id = int(seq), int(note_id) if note_id else None
+    if seq < 0 or (note_id is not None and note_id < 0):
+        raise ValueError("negative cursor")
+    return seq, note_id
+
+
+def _after_cursor(cursor_pos, id_column):
+    if cursor_pos is None:
+        return "", []
+    seq, note_id = cursor_pos
+    if note_id is None:
+        return " AND change_seq > %s", [seq]
+    return f" AND change_seq >= %s AND (change_seq > %s OR {id_column} > %s)", [seq, seq, note_id]
+
+
+def fetch_changes(user_id, since, limit, fields="*"):
+    """Notes written and notes deleted after a delta-sync cursor, oldest change first.
+
+    Both come off ``(user_id, change_seq)`` indexes, so a sync costs in
+    proportion to what changed. All reads share one snapshot, so the
+    returned cursor never skips a change. Returns ``(notes, deleted_ids,
+    next_cursor, has_more)``; raises ``CursorExpired`` when deletes the
+    cursor has not seen were already purged.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute("SELECT notes_version, tombstone_horizon FROM users WHERE id = %s", (user_id,))
+        user = cursor.fetchone() or {"notes_version": 0, "tombstone_horizon": 0}
+        # A cursor inside change S has not seen all of S yet
+        if since is not None and since[0] - (since[1] is not None) < user["tombstone_horizon"]:
+            raise CursorExpired()
+
+        where, params = _after_cursor(since, "id")
+        cursor.execute(
+            f"SELECT {fields}, change_seq FROM notes WHERE user_id = %s{where} ORDER BY change_seq, id LIMIT %s",
+            (user_id, *params, limit + 1)
+        )
+        changes = [(row["change_seq"], row["id"], row) for row in cursor.fetchall()]
+
+        # A full sync starts from nothing, so it needs no deletes
+        if since is not None:
+            where, params = _after_cursor(since, "note_id")
+            cursor.execute(
+                f"""
+                SELECT change_seq, note_id FROM note_tombstones
+                WHERE user_id = %s{where} ORDER BY change_seq, note_id LIMIT %s
+                """,
+                (user_id, *params, limit + 1)
+            )
+            changes.extend((row["change_seq"], row["note_id"], None) for row in cursor.fetchall())
+    finally:
+        cursor.close()
+        conn.close()
+
+    changes.sort(key=lambda change: change[:2])
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+
+    notes = []
+    deleted = []
+    for _, note_id, row in changes:
+        if row is None:
+            deleted.append(note_id)
+        else:
+            row.pop("change_seq")
+            notes.append(row)
+
+    if has_more:
+        next_cursor = f"{changes[-1][0]}:{changes[-1][1]}"
+    else:
+        next_cursor = str(user["notes_version"])
+    return notes, deleted, next_cursor, has_more
@@ -0,0 +1,161 @@
+import hashlib
+import json
+import re
+import time
+from flask import g, request, has_request_context, before_render_template, template_rendered
+from flask_login import current_user
+from app.config import Config
+
+# Query profiler and slow-query log.
+#
+# Every statement run through a pooled connection's cursor is timed
+# (app/db.py). Statements slower than SLOW_QUERY_MS are always written to the
+# log as one JSON line with a normalized fingerprint of the SQL (literals and
+# parameters replaced by ``?``), never the parameters themselves.
+#
+# Sending ``X-Profile: 1`` turns on the full profile for that request: each
+# statement with its duration and rows, repeated fingerprints flagged as N+1
+# patterns, and a ``Server-Timing`` header splitting the time into db, render
+# (Jinja) and app (the rest). Only admins (users.role = 'admin', by session
+# or API token) get the profile; for anyone else it is discarded.
+# QUERY_PROFILER=all profiles every request (development), off ignores the
+# header.
+
+PROFILE_HEADER = "X-Profile"
+
+_LITERALS = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.)*\"|\b\d+(?:\.\d+)?\b|%s|%\(\w+\)s")
+_IN_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_VALUE_ROWS = re.compile(r"(\(\?(?:,\s*\?)*\))(?:\s*,\s*\(\?(?:,\s*\?)*\))+")
+_SPACES = re.compile(r"\s+")
+
+
+def fingerprint(sql):
+    """SQL with literals, parameters, IN lists and multi-row VALUES collapsed"""
+    if isinstance(sql, bytes):
+        sql = sql.decode(errors="replace")
+    sql = _LITERALS.sub("?", sql)
+    sql = _SPACES.sub(" ", sql).strip()
+    sql = _VALUE_ROWS.sub(r"\1, ...", sql)
+    return _IN_LISTS.sub("(?, ...)", sql)
+
+
+def fingerprint_id(normalized):
+    return hashlib.sha1(normalized.encode()).hexdigest()[:12]
+
+
+class QueryProfile:
+    """Statements of one profiled request"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.statements = []  # [fingerprint, seconds, rows]
+        self.render = 0.0
+        self._render_started = []
+
+    def add(self, sql, elapsed, rowcount):
+        entry = [fingerprint(sql), elapsed, rowcount if rowcount >= 0 else 0]
+        self.statements.append(entry)
+        return entry
+
+    def repeated(self):
+        """Fingerprints run at least N_PLUS_ONE_THRESHOLD times: likely a query per row"""
+        counts = {}
+        for sql, _, _ in self.statements:
+            counts[sql] = counts.get(sql, 0) + 1
+        return {sql: n for sql, n in counts.items() if n >= Config.N_PLUS_ONE_THRESHOLD}
+
+    def summary(self):
+        total = time.perf_counter() - self.started
+        db = sum(entry[1] for entry in self.statements)
+        return {
+            "total_ms": round(total * 1000, 2),
+            "db_ms": round(db * 1000, 2),
+            "render_ms": round(self.render * 1000, 2),
+            "app_ms": round(max(total - db - self.render, 0) * 1000, 2),
+            "queries": len(self.statements),
+        }
+
+
+def current_profile():
+    return g.get("_query_profile")
+
+
+def log_slow_query(sql, elapsed, rowcount):
+    normalized = fingerprint(sql)
+    record = {
+        "event": "slow_query",
+        "ms": round(elapsed * 1000, 2),
+        "rows": rowcount if rowcount >= 0 else None,
+        "fingerprint_id": fingerprint_id(normalized),
+        "fingerprint": normalized,
+    }
+    if has_request_context():
+        record["endpoint"] = request.endpoint
+        record["method"] = request.method
+    print(json.dumps(record))
+
+
+def _is_admin():
+    user = getattr(request, "user", None)  # API token requests
+    if user is None and current_user.is_authenticated:
+        user = current_user
+    return user is not None and getattr(user, "role", None) == "admin"
+
+
+def _before_request():
+    if Config.QUERY_PROFILER == "all" or (
+        Config.QUERY_PROFILER == "header" and request.headers.get(PROFILE_HEADER) == "1"
+    ):
+        g._query_profile = QueryProfile()
+
+
+def _render_started(sender, template, context, **extra):
+    profile = current_profile()
+    if profile is not None:
+        profile._render_started.append(time.perf_counter())
+
+
+def _render_finished(sender, template, context, **extra):
+    profile = current_profile()
+    if profile is not None and profile._render_started:
+        started = profile._render_started.pop()
+        if not profile._render_started:  # outermost template only
+            profile.render += time.perf_counter() - started
+
+
+def _after_request(response):
+    profile = g.pop("_query_profile", None)
+    if profile is None or (Config.QUERY_PROFILER != "all" and not _is_admin()):
+        return response
+
+    summary = profile.summary()
+    response.headers["Server-Timing"] = (
+        f"db;dur={summary['db_ms']};desc=\"{summary['queries']} queries\", "
+        f"render;dur={summary['render_ms']}, app;dur={summary['app_ms']}, total;dur={summary['total_ms']}"
+    )
+    repeated = profile.repeated()
+    print(json.dumps({
+        "event": "request_profile",
+        "endpoint": request.endpoint,
+        "method": request.method,
+        "path": request.path,
+        "status": response.status_code,
+        **summary,
+        "statements": [
+            {"ms": round(seconds * 1000, 3), "rows": rows, "fingerprint": sql}
+            for sql, seconds, rows in profile.statements
+        ],
+        "n_plus_one": [{"count": n, "fingerprint": sql} for sql, n in repeated.items()],
+    }))
+    if repeated:
+        response.headers["X-Profile-N-Plus-One"] = str(len(repeated))
+    return response
+
+
+def init_profiler(app):
+    if Config.QUERY_PROFILER not in ("header", "all"):
+        return
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    before_render_template.connect(_render_started, app)
+    template_rendered.connect(_render_finished, app)
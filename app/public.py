@@ -0,0 +1,75 @@
+import hashlib
+from flask import render_template
+from flask_login import AnonymousUserMixin
+from app.cache import LRUCache, SingleFlight
+from app.config import Config
+from app.db import get_db_connection
+
+# Rendered public note pages (/s/<public_id>).
+#
+# Each page is cached per process with the note's ``version``, which every
+# edit, publish/unpublish and author profile change bumps. A hit costs one
+# lookup on the unique public_id index to read the current version; the
+# JOIN and the template render only run when the version moved, and
+# concurrent misses for the same version share one render.
+#
+# The cached body is served to every visitor and to shared caches, so it is
+# always rendered as an anonymous visitor: ``current_user`` in the template
+# (or anything it includes) can never bake the first viewer into the page.
+
+page_cache = LRUCache(maxsize=Config.PUBLIC_NOTE_CACHE_SIZE, ttl=Config.PUBLIC_NOTE_CACHE_TTL)
+_renders = SingleFlight()
+
+
+def bump_author_versions(cursor, user_id):
+    """Invalidate the cached pages of all of a user's shared notes (profile changes).
+
+    Note writes bump ``version`` in their own UPDATE.
+    """
+    cursor.execute(
+        "UPDATE notes SET version = version + 1, updated_at = updated_at WHERE user_id = %s AND public_id IS NOT NULL",
+        (user_id,)
+    )
+
+
+def _render(public_id):
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    cursor.execute("""
+        SELECT n.*, u.username, u.profile_picture
+        FROM notes n
+        JOIN users u ON n.user_id = u.id
+        WHERE n.public_id = %s AND n.is_public = TRUE
+    """, (public_id,))
+    note = cursor.fetchone()
+    cursor.close()
+    conn.close()
+
+    if not note:
+        return None
+    body = render_template("public_note.html", note=note, current_user=AnonymousUserMixin())
+    etag = hashlib.sha256(body.encode()).hexdigest()[:32]
+    page = (note["version"], body, etag)
+    page_cache.put(public_id, page)
+    return page
+
+
+def get_public_page(public_id):
+    """``(body, etag)`` of a public note page, or None if it is not public"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT version FROM notes WHERE public_id = %s AND is_public = TRUE", (public_id,))
+    row = cursor.fetchone()
+    cursor.close()
+    conn.close()
+
+    if row is None:
+        page_cache.invalidate(public_id)
+        return None
+
+    page = page_cache.get(public_id)
+    if page is None or page[0] != row[0]:
+        page = _renders.do((public_id, row[0]), lambda: _render(public_id))
+        if page is None:
+            return None
+    return page[1], page[2]
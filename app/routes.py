@@ -1,33 +1,20 @@
-from flask import Blueprint, render_template, request, url_for, redirect, flash, abort
+from flask import Blueprint, render_template, request, url_for, redirect, flash, abort, jsonify, make_response, send_from_directory
 from flask_login import login_required, current_user
-from app.db import get_db_connection
-import bleach
+from app.config import Config
+from app.db import get_db_connection, pool_stats
+from app.notes import fetch_note_page, touch_collection, record_tombstones
+from app.search import build_search_text
+from app.stats import apply_note_delta, get_note_stats
+from app.tags import set_note_tags
+from app.public import get_public_page
+from app.sanitize import render_note_html, SANITIZER_VERSION
+from app.avatars import AVATAR_FOLDER, AVATAR_MAX_AGE
+from app.compression import stats as compression_stats
+from app.auth.decorators import admin_required
 import uuid
 
 main = Blueprint("main", __name__)
 
-# Allowed HTML tags and attributes for rich text content
-ALLOWED_TAGS = [
-    "p", "br", "strong", "em", "u", "ul", "ol", "li", 
-    "code", "pre", "a", "h1", "h2", "h3", "h4", "h5", "h6"
-]
-ALLOWED_ATTRIBUTES = {
-    "a": ["href", "title", "target"],
-    "code": ["class"],
-    "pre": ["class"]
-}
-
-def sanitize_html(html_content):
-    """Sanitize HTML content to prevent XSS attacks"""
-    if not html_content:
-        return ""
-    return bleach.clean(
-        html_content,
-        tags=ALLOWED_TAGS,
-        attributes=ALLOWED_ATTRIBUTES,
-        strip=True
-    )
-
 
 @main.route("/")
 def index():
@@ -49,17 +36,25 @@ def home():
         example = request.form.get("example")
         tags = request.form.get("tags")
 
-        # Sanitize HTML content
-        description = sanitize_html(description)
-        example = sanitize_html(example) if example else ""
+        # Sanitize HTML content once; pages serve the stored result
+        example = example or ""
+        description_html, example_html = render_note_html(description, example)
 
         conn = get_db_connection()
         cursor = conn.cursor()
 
+        seq = touch_collection(cursor, current_user.id)
         cursor.execute(
-            "INSERT INTO notes (command, description, category, example, tags, user_id) VALUES (%s, %s, %s, %s, %s, %s)",
-            (command, description, category, example, tags, current_user.id)
+            """
+            INSERT INTO notes (command, description, description_html, category, example, example_html, tags,
+                               user_id, search_text, sanitizer_version, change_seq)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            """,
+            (command, description, description_html, category, example, example_html, tags, current_user.id,
+             build_search_text(command, description_html, example_html, tags), SANITIZER_VERSION, seq)
         )
+        set_note_tags(cursor, cursor.lastrowid, current_user.id, tags)
+        apply_note_delta(cursor, current_user.id, new=(category, tags))
 
         conn.commit()
         cursor.close()
@@ -71,43 +66,27 @@ def home():
     conn = get_db_connection()
     cursor = conn.cursor(dictionary=True)
 
-    cursor.execute("SELECT * FROM notes WHERE user_id = %s ORDER BY id DESC", (current_user.id,))
-    notes = cursor.fetchall()
+    # Stats come from the per-user counters, not a scan of every note
+    total_notes, category_counts, popular_tags = get_note_stats(cursor, current_user.id)
 
     # Fetch categories for filters/dropdowns
     cursor.execute("SELECT * FROM categories ORDER BY is_system DESC, name ASC")
     categories = cursor.fetchall()
 
-    # Calculate statistics
-    total_notes = len(notes)
-    
-    # Category distribution
-    category_counts = {}
-    all_tags = []
-    recent_notes = notes[:5] if notes else []
-    
-    for note in notes:
-        category = note.get('category') or 'other'
-        category_counts[category] = category_counts.get(category, 0) + 1
-        
-        if note.get('tags'):
-            tags = [tag.strip() for tag in note['tags'].split(',') if tag.strip()]
-            all_tags.extend(tags)
-    
-    # Tag frequency
-    tag_counts = {}
-    for tag in all_tags:
-        tag_counts[tag] = tag_counts.get(tag, 0) + 1
-    
-    # Sort tags by frequency
-    popular_tags = sorted(tag_counts.items(), key=lambda x: x[1], reverse=True)[:10]
-
     cursor.close()
     conn.close()
 
+    # First page of cards, searched server-side when arriving from global search;
+    # further pages are fetched on demand from main.search_notes
+    search = request.args.get("search") or request.args.get("q")
+    notes, next_cursor = fetch_note_page(current_user.id, Config.DASHBOARD_PAGE_SIZE, search=search)
+    recent_notes = notes[:5] if not search else fetch_note_page(current_user.id, 5)[0]
+
     return render_template(
         "index.html", 
         notes=notes,
+        next_cursor=next_cursor,
+        search=search,
         total_notes=total_notes,
         category_counts=category_counts,
         popular_tags=popular_tags,
@@ -116,6 +95,31 @@ def home():
     )
 
 
+@main.route("/dashboard/search")
+@login_required
+def search_notes():
+    """A page of note cards for the dashboard (?q=, ?category=, ?tag=, ?after=), rendered server-side"""
+    query = request.args.get("q", "").strip()
+    category = request.args.get("category")
+    try:
+        notes, next_cursor = fetch_note_page(
+            current_user.id,
+            Config.DASHBOARD_PAGE_SIZE,
+            after=request.args.get("after"),
+            category=category if category and category != "all" else None,
+            search=query,
+            tag=request.args.get("tag"),
+            blank_as_other=True,
+        )
+    except ValueError:
+        abort(400)
+
+    response = make_response(render_template("_note_cards.html", notes=notes, search=query,
+                                             appending=bool(request.args.get("after"))))
+    response.headers["X-Next-Cursor"] = next_cursor or ""
+    return response
+
+
 @main.route("/about")
 def about():
     return render_template("about.html")
@@ -146,9 +150,10 @@ def toggle_public(note_id):
     if new_status and not public_id:
         public_id = str(uuid.uuid4())
         
+    seq = touch_collection(cursor, current_user.id)
     cursor.execute(
-        "UPDATE notes SET is_public = %s, public_id = %s WHERE id = %s",
-        (new_status, public_id, note_id)
+        "UPDATE notes SET is_public = %s, public_id = %s, version = version + 1, change_seq = %s WHERE id = %s",
+        (new_status, public_id, seq, note_id)
     )
     conn.commit()
     cursor.close()
@@ -161,24 +166,25 @@ def toggle_public(note_id):
 
 @main.route("/s/<public_id>")
 def public_note(public_id):
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
-    
-    cursor.execute("""
-        SELECT n.*, u.username, u.profile_picture 
-        FROM notes n 
-        JOIN users u ON n.user_id = u.id 
-        WHERE n.public_id = %s AND n.is_public = TRUE
-    """, (public_id,))
-    
-    note = cursor.fetchone()
-    cursor.close()
-    conn.close()
-    
-    if not note:
+    page = get_public_page(public_id)
+    if page is None:
         abort(404)
-        
-    return render_template("public_note.html", note=note)
+
+    body, etag = page
+    response = make_response(body)
+    response.set_etag(etag)
+    # Shared caches may store the page but must revalidate (it can be unpublished)
+    response.headers["Cache-Control"] = f"public, max-age={Config.PUBLIC_NOTE_MAX_AGE}, must-revalidate"
+    return response.make_conditional(request)
+
+
+@main.route("/avatars/<filename>")
+def avatar(filename):
+    # Names are content hashes: a file never changes, so caches keep it for good
+    response = send_from_directory(AVATAR_FOLDER, filename, max_age=AVATAR_MAX_AGE)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
 
 
 @main.route("/delete/<int:id>")
@@ -187,8 +193,10 @@ def delete_note(id):
     conn = get_db_connection()
     cursor = conn.cursor()
 
-    # Check ownership
-    cursor.execute("SELECT user_id FROM notes WHERE id = %s", (id,))
+    # Lock order for note writes: the user's row, then the note (whose
+    # category and tags feed the counters, so they are read under the lock)
+    seq = touch_collection(cursor, current_user.id)
+    cursor.execute("SELECT user_id, category, tags FROM notes WHERE id = %s FOR UPDATE", (id,))
     note = cursor.fetchone()
     
     if not note:
@@ -202,6 +210,9 @@ def delete_note(id):
         abort(403)
 
     cursor.execute("DELETE FROM notes WHERE id = %s", (id,))
+    if cursor.rowcount:
+        apply_note_delta(cursor, current_user.id, old=(note[1], note[2]))
+        record_tombstones(cursor, current_user.id, [id], seq)
     conn.commit()
 
     cursor.close()
@@ -246,8 +257,10 @@ def edit_note(id):
         # Check ownership again before update
         conn = get_db_connection()
         cursor = conn.cursor()
-        
-        cursor.execute("SELECT user_id FROM notes WHERE id = %s", (id,))
+
+        # Lock order for note writes: the user's row, then the note
+        seq = touch_collection(cursor, current_user.id)
+        cursor.execute("SELECT user_id, category, tags FROM notes WHERE id = %s FOR UPDATE", (id,))
         check_note = cursor.fetchone()
         
         if not check_note or check_note[0] != current_user.id:
@@ -255,14 +268,23 @@ def edit_note(id):
              conn.close()
              abort(403)
              
-        # Sanitize HTML content
-        description = sanitize_html(description)
-        example = sanitize_html(example) if example else ""
+        # Sanitize HTML content once; pages serve the stored result
+        example = example or ""
+        description_html, example_html = render_note_html(description, example)
 
         cursor.execute(
-            "UPDATE notes SET command = %s, description = %s, category = %s, example = %s, tags = %s WHERE id = %s",
-            (command, description, category, example, tags, id)
+            """
+            UPDATE notes SET command = %s, description = %s, description_html = %s, category = %s,
+                example = %s, example_html = %s, tags = %s, search_text = %s, sanitizer_version = %s,
+                version = version + 1, change_seq = %s
+            WHERE id = %s
+            """,
+            (command, description, description_html, category, example, example_html, tags,
+             build_search_text(command, description_html, example_html, tags), SANITIZER_VERSION, seq, id)
         )
+        if tags != check_note[2]:
+            set_note_tags(cursor, id, current_user.id, tags)
+        apply_note_delta(cursor, current_user.id, old=(check_note[1], check_note[2]), new=(category, tags))
 
         conn.commit()
         cursor.close()
@@ -276,6 +298,20 @@ def health():
     return "OK", 200
 
 
+@main.route("/health/db")
+@admin_required
+def health_db():
+    """Connection pool stats for this worker (size pools against --workers/--threads); admins only"""
+    return jsonify(pool_stats())
+
+
+@main.route("/health/compression")
+@admin_required
+def health_compression():
+    """Bytes saved by response compression, per endpoint, in this worker; admins only"""
+    return jsonify(compression_stats.snapshot())
+
+
 @main.route("/category/add", methods=["POST"])
 @login_required
 def add_category():
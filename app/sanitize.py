@@ -0,0 +1,59 @@
+import re
+import threading
+import bleach
+
+# Sanitized note HTML.
+#
+# Notes keep what was submitted in ``description``/``example`` and the
+# sanitized rendering in ``description_html``/``example_html``, stamped with
+# the ``sanitizer_version`` that produced it. Sanitizing happens once per
+# write; pages and the API serve the stored HTML as is.
+#
+# Bump SANITIZER_VERSION whenever the allowlist below changes, then run
+# ``scripts/resanitize_notes.py`` to re-render the rows it made stale.
+
+SANITIZER_VERSION = 1
+
+# Allowed HTML tags and attributes for rich text content
+ALLOWED_TAGS = [
+    "p", "br", "strong", "em", "u", "ul", "ol", "li",
+    "code", "pre", "a", "h1", "h2", "h3", "h4", "h5", "h6"
+]
+ALLOWED_ATTRIBUTES = {
+    "a": ["href", "title", "target"],
+    "code": ["class"],
+    "pre": ["class"]
+}
+
+# The only characters bleach changes in text without markup: control
+# characters other than tab and newline, and the markup characters
+_NEEDS_CLEANING = re.compile(r"[\x00-\x08\x0b-\x1f&<>]")
+
+_local = threading.local()
+
+
+def _cleaner():
+    # A Cleaner builds its parser and filters once, but is not thread-safe:
+    # keep one per thread (gunicorn --threads, the backfill's pool workers)
+    cleaner = getattr(_local, "cleaner", None)
+    if cleaner is None:
+        cleaner = _local.cleaner = bleach.sanitizer.Cleaner(
+            tags=ALLOWED_TAGS,
+            attributes=ALLOWED_ATTRIBUTES,
+            strip=True
+        )
+    return cleaner
+
+
+def sanitize_html(html_content):
+    """Sanitize HTML content to prevent XSS attacks"""
+    if not html_content:
+        return ""
+    if not _NEEDS_CLEANING.search(html_content):
+        return html_content
+    return _cleaner().clean(html_content)
+
+
+def render_note_html(description, example):
+    """``(description_html, example_html)`` to store with a note's submitted text"""
+    return sanitize_html(description), sanitize_html(example)
@@ -0,0 +1,128 @@
+import re
+import html
+
+# Full-text search over notes.
+#
+# Every note carries a plain-text ``search_text`` column (command, description
+# and example with their HTML stripped, plus tags) behind a FULLTEXT index.
+# Search box queries are translated into InnoDB boolean-mode expressions:
+#
+#   docker compose        both terms (AND), prefix-matched
+#   docker OR podman      either term
+#   "compose up"          exact phrase
+#
+# Terms shorter than innodb_ft_min_token_size are not in the index, so those
+# groups fall back to a LIKE over the already user-filtered rows.
+
+MIN_TOKEN_LEN = 3  # innodb_ft_min_token_size default
+
+_QUERY_TOKEN = re.compile(r'"([^"]*)"|(\S+)')
+_TAG = re.compile(r'<[^>]*>')
+_WORD = re.compile(r'\w+')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def html_to_text(value):
+    """Plain text of stored (already sanitized) note HTML, for indexing only"""
+    if not value:
+        return ""
+    text = html.unescape(_TAG.sub(" ", value))
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def build_search_text(command, description, example, tags):
+    parts = [
+        command or "",
+        html_to_text(description),
+        html_to_text(example),
+        (tags or "").replace(",", " "),
+    ]
+    return " ".join(part for part in parts if part)
+
+
+def parse_query(query):
+    """Split a search query into AND-ed groups of OR-ed items.
+
+    Each item is ``(words, is_phrase)``. Words are reduced to the characters
+    the full-text parser indexes, so ``docker-compose`` becomes the phrase
+    ``docker compose``.
+    """
+    groups = []
+    pending_or = False
+    for phrase, word in _QUERY_TOKEN.findall(query or ""):
+        if word and word.upper() == "OR" and groups:
+            pending_or = True
+            continue
+        words = _WORD.findall(phrase if phrase else word)
+        if not words:
+            continue
+        item = (" ".join(words), bool(phrase) or len(words) > 1)
+        if pending_or:
+            groups[-1].append(item)
+        else:
+            groups.append([item])
+        pending_or = False
+    return groups
+
+
+def _like_escape(value):
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def search_clause(query, column="search_text"):
+    """Translate a search query into SQL for a notes query.
+
+    Returns ``(where_sql, where_params, order_sql, order_params)`` to be
+    AND-ed into the WHERE clause and put first in ORDER BY (relevance), or
+    ``None`` when the query has nothing searchable in it.
+    """
+    groups = parse_query(query)
+    if not groups:
+        return None
+
+    boolean_terms = []
+    where = []
+    where_params = []
+    for group in groups:
+        if all(is_phrase or len(words) >= MIN_TOKEN_LEN for words, is_phrase in group):
+            items = [f'"{words}"' if is_phrase else f"{words}*" for words, is_phrase in group]
+            boolean_terms.append("+" + items[0] if len(items) == 1 else "+(" + " ".join(items) + ")")
+        else:
+            where.append("(" + " OR ".join([f"{column} LIKE %s"] * len(group)) + ")")
+            where_params.extend(f"%{_like_escape(words)}%" for words, _ in group)
+
+    order_sql = ""
+    order_params = []
+    if boolean_terms:
+        expression = " ".join(boolean_terms)
+        match_sql = f"MATCH({column}) AGAINST (%s IN BOOLEAN MODE)"
+        where.insert(0, match_sql)
+        where_params.insert(0, expression)
+        order_sql = match_sql + " DESC"
+        order_params = [expression]
+
+    return " AND ".join(where), where_params, order_sql, order_params
+
+
+def backfill_search_text(conn, after_id, upto_id):
+    """Fill ``notes.search_text`` for notes with ``after_id < id <= upto_id`` written
+    before it existed (a MigrationRun.backfill batch). Returns the row count."""
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute(
+            """
+            SELECT id, command, description_html, example_html, tags FROM notes
+            WHERE id > %s AND id <= %s AND search_text IS NULL
+            """,
+            (after_id, upto_id)
+        )
+        rows = cursor.fetchall()
+        if rows:
+            cursor.executemany(
+                "UPDATE notes SET search_text = %s, updated_at = updated_at WHERE id = %s",
+                [(build_search_text(r["command"], r["description_html"], r["example_html"], r["tags"]), r["id"])
+                 for r in rows]
+            )
+    finally:
+        cursor.close()
+    return len(rows)
@@ -0,0 +1,121 @@
+from collections import Counter
+from app.tags import parse_tags
+
+# Per-user dashboard counters.
+#
+# ``user_note_stats`` holds one row per (user, kind, name) where kind is
+# 'category' or 'tag'. Every note write applies the difference between the
+# note's old and new facets, so rendering the stats row and the popular-tags
+# widget reads O(categories + 10) rows instead of scanning every note.
+# ``rebuild_note_stats`` recomputes the counters from ``notes`` and is used
+# both as the backfill and as the consistency checker.
+
+KIND_CATEGORY = "category"
+KIND_TAG = "tag"
+
+
+def note_facets(category, tags):
+    """Counter of the (kind, name) pairs a note contributes to its owner's stats"""
+    facets = Counter({(KIND_CATEGORY, category or "other"): 1})
+    facets.update((KIND_TAG, tag) for tag in parse_tags(tags))
+    return facets
+
+
+def note_delta(old=None, new=None):
+    """Counter change for a note write. ``old``/``new`` are ``(category, tags)``
+    before and after the write (None for a create or delete)."""
+    delta = Counter()
+    if new is not None:
+        delta.update(note_facets(*new))
+    if old is not None:
+        delta.subtract(note_facets(*old))
+    return delta
+
+
+def apply_note_delta(cursor, user_id, old=None, new=None):
+    """Adjust counters for a single note write. Runs in the caller's transaction."""
+    apply_stats_delta(cursor, user_id, note_delta(old, new))
+
+
+def apply_stats_delta(cursor, user_id, delta):
+    """Apply a (summed) ``note_delta`` to a user's counters in one statement"""
+    changes = [(user_id, kind, name, n) for (kind, name), n in delta.items() if n]
+    if not changes:
+        return
+    cursor.executemany(
+        """
+        INSERT INTO user_note_stats (user_id, kind, name, count) VALUES (%s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE count = count + VALUES(count)
+        """,
+        changes
+    )
+    if any(n < 0 for _, _, _, n in changes):
+        cursor.execute("DELETE FROM user_note_stats WHERE user_id = %s AND count <= 0", (user_id,))
+
+
+def get_note_stats(cursor, user_id, top_tags=10):
+    """Return ``(total_notes, category_counts, popular_tags)`` from the counters"""
+    cursor.execute(
+        "SELECT name, count FROM user_note_stats WHERE user_id = %s AND kind = %s AND count > 0 ORDER BY name",
+        (user_id, KIND_CATEGORY)
+    )
+    category_counts = {row[0]: row[1] for row in cursor.fetchall()}
+
+    cursor.execute(
+        """
+        SELECT name, count FROM user_note_stats
+        WHERE user_id = %s AND kind = %s AND count > 0
+        ORDER BY count DESC LIMIT %s
+        """,
+        (user_id, KIND_TAG, top_tags)
+    )
+    popular_tags = [(row[0], row[1]) for row in cursor.fetchall()]
+
+    return sum(category_counts.values()), category_counts, popular_tags
+
+
+def rebuild_note_stats(conn, user_ids=None, fix=True):
+    """Recompute counters from ``notes`` and compare them with the stored ones.
+
+    Checks every user with notes or counters unless ``user_ids`` is given.
+    With ``fix`` the stored counters of inconsistent users are replaced.
+    Returns the ids of the users whose counters were wrong.
+    """
+    cursor = conn.cursor()
+    try:
+        if user_ids is None:
+            cursor.execute("""
+                SELECT user_id FROM notes WHERE user_id IS NOT NULL
+                UNION SELECT user_id FROM user_note_stats
+            """)
+            user_ids = sorted(row[0] for row in cursor.fetchall())
+
+        mismatched = []
+        for user_id in user_ids:
+            # Lock the user's counters so concurrent note writes wait for us
+            cursor.execute(
+                "SELECT kind, name, count FROM user_note_stats WHERE user_id = %s FOR UPDATE",
+                (user_id,)
+            )
+            stored = Counter({(kind, name): count for kind, name, count in cursor.fetchall() if count > 0})
+
+            cursor.execute("SELECT category, tags FROM notes WHERE user_id = %s", (user_id,))
+            expected = Counter()
+            for category, tags in cursor.fetchall():
+                expected.update(note_facets(category, tags))
+
+            if stored != expected:
+                mismatched.append(user_id)
+                if fix:
+                    cursor.execute("DELETE FROM user_note_stats WHERE user_id = %s", (user_id,))
+                    cursor.executemany(
+                        "INSERT INTO user_note_stats (user_id, kind, name, count) VALUES (%s, %s, %s, %s)",
+                        [(user_id, kind, name, n) for (kind, name), n in expected.items()]
+                    )
+            if fix:
+                conn.commit()
+            else:
+                conn.rollback()
+    finally:
+        cursor.close()
+    return mismatched
@@ -0,0 +1,76 @@
+# Normalized note tags.
+#
+# ``notes.tags`` keeps the comma-separated string the forms and the API show,
+# while ``tags`` (one row per distinct name) and ``note_tags`` (one row per
+# note/tag pair, with the owner denormalized) back tag filtering:
+# ``note_tags (user_id, tag_id, note_id)`` answers "this user's notes with
+# tag X, newest first" from the index alone.
+
+MAX_TAG_LEN = 100
+
+
+def parse_tags(tags):
+    """Distinct tag names of a comma-separated string, in their original order"""
+    names = []
+    for tag in (tags or "").split(","):
+        tag = tag.strip()[:MAX_TAG_LEN]
+        if tag and tag not in names:
+            names.append(tag)
+    return names
+
+
+def set_note_tags(cursor, note_id, user_id, tags):
+    """Replace a note's ``note_tags`` rows. Runs in the caller's transaction."""
+    set_notes_tags(cursor, [(note_id, user_id, tags)])
+
+
+def set_notes_tags(cursor, notes):
+    """Replace the ``note_tags`` rows of many ``(note_id, user_id, tags)`` at once.
+
+    Costs a fixed handful of statements however many notes are given.
+    Runs in the caller's transaction.
+    """
+    if not notes:
+        return
+    note_ids = [note_id for note_id, _, _ in notes]
+    cursor.execute(
+        f"DELETE FROM note_tags WHERE note_id IN ({', '.join(['%s'] * len(note_ids))})",
+        tuple(note_ids)
+    )
+
+    parsed = [(note_id, user_id, parse_tags(tags)) for note_id, user_id, tags in notes]
+    names = sorted({name for _, _, note_names in parsed for name in note_names})
+    if not names:
+        return
+
+    cursor.executemany("INSERT IGNORE INTO tags (name) VALUES (%s)", [(name,) for name in names])
+    cursor.execute(
+        f"SELECT id, name FROM tags WHERE name IN ({', '.join(['%s'] * len(names))})",
+        tuple(names)
+    )
+    tag_ids = {name: tag_id for tag_id, name in cursor.fetchall()}
+    cursor.executemany(
+        "INSERT INTO note_tags (note_id, tag_id, user_id) VALUES (%s, %s, %s)",
+        [(note_id, tag_ids[name], user_id) for note_id, user_id, note_names in parsed for name in note_names]
+    )
+
+
+def backfill_note_tags(conn, after_id, upto_id):
+    """Fill ``note_tags`` for notes with ``after_id < id <= upto_id`` written before
+    it existed (a MigrationRun.backfill batch). Returns the note count."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            """
+            SELECT n.id, n.user_id, n.tags FROM notes n
+            WHERE n.id > %s AND n.id <= %s AND n.tags IS NOT NULL AND n.tags <> ''
+              AND NOT EXISTS (SELECT 1 FROM note_tags nt WHERE nt.note_id = n.id)
+            """,
+            (after_id, upto_id)
+        )
+        rows = cursor.fetchall()
+        if rows:
+            set_notes_tags(cursor, rows)
+    finally:
+        cursor.close()
+    return len(rows)
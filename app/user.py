@@ -1,17 +1,83 @@
+import os
+import re
+import time
+import hashlib
 from flask_login import UserMixin
+from app.cache import LRUCache
+from app.config import Config
 from app.db import get_db_connection
 from werkzeug.security import generate_password_hash, check_password_hash
 
+# Per-process cache of User objects keyed by id (Flask-Login user_loader).
+#
+# Every write to a user's profile, token or password ends with
+# User.invalidate, which bumps the mtime of the user's stamp file in
+# USER_STAMP_DIR. A cached User is only used while it carries the stamp it
+# was loaded under, so a change made through any session or worker is seen
+# by all workers on the host at once, for the cost of a stat() instead of a
+# query.
+user_cache = LRUCache(maxsize=Config.USER_CACHE_SIZE, ttl=Config.USER_CACHE_TTL)
+
+# Per-process cache of api_token_hash -> user id (None for unknown tokens)
+token_cache = LRUCache(maxsize=Config.API_TOKEN_CACHE_SIZE, ttl=Config.API_TOKEN_CACHE_TTL)
+
+# Tokens are issued as secrets.token_hex(16)
+API_TOKEN_RE = re.compile(r'[0-9a-f]{32}')
+
+_MISSING = object()
+
+
+def _stamp_path(user_id):
+    return os.path.join(Config.USER_STAMP_DIR, str(int(user_id)))
+
+
+def user_stamp(user_id):
+    """Time (ns) of the last change to a user's row, 0 if never changed"""
+    try:
+        return os.stat(_stamp_path(user_id)).st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+
+def bump_user_stamp(user_id):
+    os.makedirs(Config.USER_STAMP_DIR, exist_ok=True)
+    path = _stamp_path(user_id)
+    # Strictly increasing even if the clock steps back or two writes share a tick
+    stamp = max(time.time_ns(), user_stamp(user_id) + 1)
+    with open(path, "a"):
+        pass
+    os.utime(path, ns=(stamp, stamp))
+
+
+def hash_api_token(token):
+    """Fixed-length digest stored in users.api_token_hash (matches MySQL SHA2(token, 256))"""
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
 class User(UserMixin):
-    def __init__(self, id, username, email, password_hash, role='user', api_token=None, bio=None, profile_picture=None):
+    def __init__(self, id, username, email, password_hash, role='user', api_token_hash=None, bio=None, profile_picture=None):
         self.id = id
         self.username = username
         self.email = email
         self.password_hash = password_hash
         self.role = role
-        self.api_token = api_token
+        self.api_token_hash = api_token_hash
         self.bio = bio
         self.profile_picture = profile_picture
+        self.stamp = 0  # user_stamp() it was loaded under (user_cache)
+
+    @staticmethod
+    def _from_row(user_data):
+        return User(
+            id=user_data['id'],
+            username=user_data['username'],
+            email=user_data['email'],
+            password_hash=user_data['password_hash'],
+            role=user_data['role'],
+            api_token_hash=user_data.get('api_token_hash'),
+            bio=user_data.get('bio'),
+            profile_picture=user_data.get('profile_picture')
+        )
 
     @staticmethod
     def get(user_id):
@@ -21,20 +87,33 @@ class User(UserMixin):
         user_data = cursor.fetchone()
         cursor.close()
         conn.close()
-        
+
         if user_data:
-            return User(
-                id=user_data['id'],
-                username=user_data['username'],
-                email=user_data['email'],
-                password_hash=user_data['password_hash'],
-                role=user_data['role'],
-                api_token=user_data.get('api_token'),
-                bio=user_data.get('bio'),
-                profile_picture=user_data.get('profile_picture')
-            )
+            return User._from_row(user_data)
         return None
 
+    @staticmethod
+    def get_cached(user_id):
+        """User.get() behind the per-process user cache (used by the user_loader).
+
+        A hit costs no query: the cached copy is checked against the user's
+        stamp file, so it is never staler than the last User.invalidate.
+        """
+        stamp = user_stamp(user_id)  # read before the row so racing writes win
+        user = user_cache.get(user_id)
+        if user is None or user.stamp != stamp:
+            user = User.get(user_id)
+            if user:
+                user.stamp = stamp
+                user_cache.put(user_id, user)
+        return user
+
+    @staticmethod
+    def invalidate(user_id):
+        """Call after committing a change to a user's row: every worker reloads it"""
+        bump_user_stamp(user_id)
+        user_cache.invalidate(user_id)
+
     @staticmethod
     def get_by_email(email):
         conn = get_db_connection()
@@ -43,42 +122,66 @@ class User(UserMixin):
         user_data = cursor.fetchone()
         cursor.close()
         conn.close()
-        
+
         if user_data:
-            return User(
-                id=user_data['id'],
-                username=user_data['username'],
-                email=user_data['email'],
-                password_hash=user_data['password_hash'],
-                role=user_data['role'],
-                api_token=user_data.get('api_token'),
-                bio=user_data.get('bio'),
-                profile_picture=user_data.get('profile_picture')
-            )
+            return User._from_row(user_data)
         return None
 
     @staticmethod
     def get_by_token(token):
+        """Resolve an API token via its indexed digest.
+
+        Digests are cached: unknown ones so flooding requests with the same
+        bad token do not reach the database, known ones as their user id. A
+        hit is checked against the user from get_cached, which costs no query
+        and follows the user's stamp, so a regenerated token is revoked in
+        every worker at once. Malformed tokens are rejected without a lookup.
+        """
+        if not token or not API_TOKEN_RE.fullmatch(token):
+            return None
+        token_hash = hash_api_token(token)
+
+        user_id = token_cache.get(token_hash, _MISSING)
+        if user_id is _MISSING:
+            conn = get_db_connection()
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute("SELECT * FROM users WHERE api_token_hash = %s", (token_hash,))
+            user_data = cursor.fetchone()
+            cursor.close()
+            conn.close()
+
+            if not user_data:
+                token_cache.put(token_hash, None, ttl=Config.API_TOKEN_NEGATIVE_TTL)
+                return None
+            user = User._from_row(user_data)
+            token_cache.put(token_hash, user.id)
+            return user
+
+        if user_id is None:
+            return None
+        user = User.get_cached(user_id)
+        if not user or user.api_token_hash != token_hash:
+            token_cache.invalidate(token_hash)
+            return None
+        return user
+
+    @staticmethod
+    def set_api_token(user_id, old_token_hash, token):
+        """Store the digest of a freshly issued token and revoke the old one"""
         conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT * FROM users WHERE api_token = %s", (token,))
-        user_data = cursor.fetchone()
+        cursor = conn.cursor()
+        cursor.execute(
+            "UPDATE users SET api_token = NULL, api_token_hash = %s WHERE id = %s",
+            (hash_api_token(token), user_id)
+        )
+        conn.commit()
         cursor.close()
         conn.close()
-        
-        if user_data:
-            return User(
-                id=user_data['id'],
-                username=user_data['username'],
-                email=user_data['email'],
-                password_hash=user_data['password_hash'],
-                role=user_data['role'],
-                api_token=user_data.get('api_token'),
-                bio=user_data.get('bio'),
-                profile_picture=user_data.get('profile_picture')
-            )
-        return None
-    
+
+        if old_token_hash:
+            token_cache.invalidate(old_token_hash)
+        User.invalidate(user_id)
+
     @staticmethod
     def create(username, email, password):
         password_hash = generate_password_hash(password)
@@ -0,0 +1,20 @@
+# Loaded automatically by gunicorn from the working directory; the command
+# line (Dockerfile CMD) still sets workers, threads, bind and timeout.
+import os
+import shutil
+
+# Per-worker Prometheus sample files, merged by /metrics (app/metrics.py)
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/dnotes-metrics")
+
+
+def on_starting(server):
+    # Samples of a previous run would be added to this one's
+    path = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path, exist_ok=True)
+
+
+def child_exit(server, worker):
+    # Drop the live gauges of a dead worker; its counters and histograms stay
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
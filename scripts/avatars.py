@@ -0,0 +1,100 @@
+"""Profile picture maintenance.
+
+    python scripts/avatars.py convert            # re-encode pictures uploaded before the avatar pipeline
+    python scripts/avatars.py gc --dry-run       # list files no user references
+    python scripts/avatars.py gc --grace 3600    # delete them (if older than --grace seconds)
+
+``convert`` runs each legacy ``user_<id>.<ext>`` original through
+app/avatars.py and points the user at the new renditions; the originals are
+then left for ``gc``. Both are safe to re-run. Run ``gc`` from cron on the
+host (or container) that owns the uploads volume.
+"""
+import mysql.connector
+from mysql.connector import Error
+import argparse
+import os
+import sys
+
+# Add parent dir to path to import config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.config import Config
+from app.avatars import UPLOAD_FOLDER, AVATAR_PREFIX, InvalidImage, save_avatar, collect_garbage
+from app.public import bump_author_versions
+from app.user import User
+
+
+def get_db_connection():
+    try:
+        conn = mysql.connector.connect(
+            host=Config.DB_HOST,
+            user=Config.DB_USER,
+            password=Config.DB_PASSWORD,
+            database=Config.DB_NAME,
+            port=Config.DB_PORT
+        )
+        return conn
+    except Error as e:
+        print(f"Error connecting to DB: {e}")
+        sys.exit(1)
+
+
+def run_convert(conn):
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT id, profile_picture FROM users WHERE profile_picture IS NOT NULL AND profile_picture NOT LIKE %s",
+        (AVATAR_PREFIX + "%",)
+    )
+    legacy = cursor.fetchall()
+    converted = 0
+    for user_id, picture in legacy:
+        path = os.path.join(UPLOAD_FOLDER, picture)
+        try:
+            with open(path, "rb") as f:
+                key = save_avatar(f)
+        except FileNotFoundError:
+            print(f"User {user_id}: {picture} is missing, skipped")
+            continue
+        except InvalidImage as e:
+            print(f"User {user_id}: {picture} skipped ({e})")
+            continue
+        cursor.execute(
+            "UPDATE users SET profile_picture = %s WHERE id = %s AND profile_picture = %s",
+            (key, user_id, picture)
+        )
+        changed = cursor.rowcount
+        if changed:
+            # Shared pages embed the picture
+            bump_author_versions(cursor, user_id)
+            converted += 1
+        conn.commit()
+        if changed:
+            User.invalidate(user_id)
+    cursor.close()
+    print(f"Converted {converted} of {len(legacy)} legacy profile picture(s)")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Profile picture maintenance")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("convert", help="Re-encode pictures uploaded before the avatar pipeline")
+    gc = commands.add_parser("gc", help="Delete picture files no user references")
+    gc.add_argument("--grace", type=int, default=3600,
+                    help="Keep files modified within this many seconds (uploads in flight)")
+    gc.add_argument("--dry-run", action="store_true", help="List the files instead of deleting them")
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    try:
+        if args.command == "convert":
+            status = run_convert(conn)
+        else:
+            removed = collect_garbage(conn, grace=args.grace, dry_run=args.dry_run)
+            print(f"{removed} unreferenced file(s) {'found' if args.dry_run else 'removed'}")
+            status = 0
+    except Error as e:
+        print(f"Failed: {e}")
+        status = 1
+    finally:
+        conn.close()
+    sys.exit(status)
@@ -0,0 +1,99 @@
+"""Benchmark of POST /api/notes/batch against one POST /api/notes per note.
+
+    python scripts/bench_batch.py
+    python scripts/bench_batch.py --notes 2000 --tags 3
+
+Creates a throwaway user in the configured database (DB_* / .env), creates
+``--notes`` notes through the single-note endpoint and the same number again
+through the batch endpoint (chunks of API_BATCH_MAX), and prints the time
+and notes per second of each. The user and its notes are deleted afterwards;
+the ``bench*`` tag names stay in ``tags``, like those of any deleted note.
+Requests go through the Flask test client, so the numbers are the app and
+database cost without gunicorn or the network.
+"""
+import argparse
+import os
+import secrets
+import sys
+import time
+
+# Add parent dir to path to import config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app import create_app
+from app.config import Config
+from app.db import get_db_connection
+from app.user import User
+
+
+def note(n, tags):
+    return {
+        "command": f"kubectl rollout restart deployment/web-{n}",
+        "description": f"<p>Restart <b>web-{n}</b> after a config change</p>",
+        "category": "Kubernetes",
+        "example": f"kubectl -n prod rollout status deployment/web-{n}",
+        "tags": ", ".join(f"bench{(n + i) % 20}" for i in range(tags)),
+    }
+
+
+def create_bench_user():
+    name = f"bench-{secrets.token_hex(4)}"
+    if not User.create(name, f"{name}@bench.invalid", secrets.token_hex(16)):
+        sys.exit("Could not create the benchmark user")
+    user = User.get_by_email(f"{name}@bench.invalid")
+    token = secrets.token_hex(16)
+    User.set_api_token(user.id, None, token)
+    return user, token
+
+
+def drop_bench_user(user_id):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    for table in ("notes", "note_tombstones", "user_note_stats"):
+        cursor.execute(f"DELETE FROM {table} WHERE user_id = %s", (user_id,))
+    cursor.execute("DELETE FROM users WHERE id = %s", (user_id,))
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+
+def run_single(client, headers, notes):
+    started = time.perf_counter()
+    for n in notes:
+        response = client.post("/api/notes", json=n, headers=headers)
+        if response.status_code != 201:
+            sys.exit(f"POST /api/notes answered {response.status_code}: {response.get_data(as_text=True)}")
+    return time.perf_counter() - started
+
+
+def run_batch(client, headers, notes):
+    started = time.perf_counter()
+    for i in range(0, len(notes), Config.API_BATCH_MAX):
+        operations = [dict(n, op="create") for n in notes[i:i + Config.API_BATCH_MAX]]
+        response = client.post("/api/notes/batch", json={"operations": operations}, headers=headers)
+        body = response.get_json() or {}
+        if response.status_code != 200 or body.get("created") != len(operations):
+            sys.exit(f"POST /api/notes/batch answered {response.status_code}: {response.get_data(as_text=True)}")
+    return time.perf_counter() - started
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark batch note creation against single-note requests")
+    parser.add_argument("--notes", type=int, default=500, help="Notes created by each path")
+    parser.add_argument("--tags", type=int, default=2, help="Tags per note")
+    args = parser.parse_args()
+
+    client = create_app().test_client()
+    user, token = create_bench_user()
+    headers = {"X-API-Token": token}
+    try:
+        notes = [note(n, args.tags) for n in range(args.notes)]
+        single = run_single(client, headers, notes)
+        batch = run_batch(client, headers, notes)
+    finally:
+        drop_bench_user(user.id)
+
+    print(f"{args.notes} notes, {args.tags} tag(s) each, batches of up to {Config.API_BATCH_MAX}")
+    print(f"{'path':<22}{'seconds':>10}{'notes/s':>10}")
+    for name, elapsed in (("POST /api/notes", single), ("POST /api/notes/batch", batch)):
+        print(f"{name:<22}{elapsed:>10.2f}{args.notes / elapsed:>10.0f}")
+    print(f"batch is {single / batch:.1f}x the single-note path")
@@ -0,0 +1,136 @@
+"""Build fingerprinted, precompressed static assets.
+
+    python scripts/build_assets.py
+    python scripts/build_assets.py --check    # fail if static/dist is out of date
+
+Minifies ``static/css`` and ``static/js`` (rcssmin/rjsmin), copies
+``static/images``, and writes each file to ``static/dist`` under a name
+carrying a hash of its content (``css/app.3f9c0a1b2d4e.css``), next to
+``.gz`` and ``.br`` siblings for nginx's ``gzip_static``/``brotli_static``.
+``/static/...`` references to images inside the CSS are rewritten to the
+hashed names first, so a changed image also changes the CSS hash.
+``static/dist/manifest.json`` maps source names to built names; templates
+resolve them with ``asset_url()`` (app/assets.py).
+
+The output depends only on the sources, so re-running it is a no-op and
+files from earlier builds can be served alongside the new ones.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+import sys
+
+import brotli
+import rcssmin
+import rjsmin
+
+STATIC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "static")
+DIST = os.path.join(STATIC, "dist")
+MANIFEST = os.path.join(DIST, "manifest.json")
+
+# Built in this order: CSS may reference the images
+SOURCES = ("images", "css", "js")
+MINIFIERS = {
+    ".css": lambda text: rcssmin.cssmin(text),
+    ".js": lambda text: rjsmin.jsmin(text),
+}
+COMPRESSIBLE = {".css", ".js", ".svg"}
+# Skip compressed copies that would not be meaningfully smaller
+MIN_COMPRESS_SIZE = 256
+
+STATIC_REF = re.compile(r"/static/([\w./-]+)")
+
+
+def fingerprint(name, body):
+    root, ext = os.path.splitext(name)
+    return f"{root}.{hashlib.sha256(body).hexdigest()[:12]}{ext}"
+
+
+def build_file(name, manifest):
+    """``(built name, {dist path: bytes})`` for one source file"""
+    with open(os.path.join(STATIC, name), "rb") as f:
+        body = f.read()
+    ext = os.path.splitext(name)[1]
+    if ext in MINIFIERS:
+        text = body.decode("utf-8")
+        if ext == ".css":
+            text = STATIC_REF.sub(
+                lambda m: f"/static/dist/{manifest[m.group(1)]}" if m.group(1) in manifest else m.group(0),
+                text
+            )
+        body = MINIFIERS[ext](text).encode("utf-8")
+
+    built = fingerprint(name, body)
+    files = {built: body}
+    if ext in COMPRESSIBLE and len(body) >= MIN_COMPRESS_SIZE:
+        # mtime=0 keeps the .gz bytes reproducible
+        files[built + ".gz"] = gzip.compress(body, compresslevel=9, mtime=0)
+        files[built + ".br"] = brotli.compress(body, mode=brotli.MODE_TEXT)
+    return built, files
+
+
+def build():
+    """``(manifest, {dist path: bytes})`` for every source"""
+    manifest = {}
+    outputs = {}
+    for directory in SOURCES:
+        for root, _, names in sorted(os.walk(os.path.join(STATIC, directory))):
+            for filename in sorted(names):
+                name = os.path.relpath(os.path.join(root, filename), STATIC).replace(os.sep, "/")
+                built, files = build_file(name, manifest)
+                manifest[name] = built
+                outputs.update(files)
+    return manifest, outputs
+
+
+def write(manifest, outputs):
+    written = 0
+    for path, body in outputs.items():
+        target = os.path.join(DIST, path)
+        if os.path.exists(target):
+            continue
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, "wb") as f:
+            f.write(body)
+        written += 1
+    with open(MANIFEST, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+        f.write("\n")
+    return written
+
+
+def current_manifest():
+    try:
+        with open(MANIFEST) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build fingerprinted static assets into static/dist")
+    parser.add_argument("--check", action="store_true",
+                        help="Exit non-zero if static/dist is missing or out of date, without writing")
+    args = parser.parse_args()
+
+    manifest, outputs = build()
+    if args.check:
+        missing = [p for p in outputs if not os.path.exists(os.path.join(DIST, p))]
+        if current_manifest() != manifest or missing:
+            print("static/dist is out of date; run scripts/build_assets.py")
+            sys.exit(1)
+        print("static/dist is up to date")
+        sys.exit(0)
+
+    written = write(manifest, outputs)
+    for name, built in sorted(manifest.items()):
+        raw = os.path.getsize(os.path.join(STATIC, name))
+        size = len(outputs[built])
+        gz = outputs.get(built + ".gz")
+        br = outputs.get(built + ".br")
+        extra = f"  gz {len(gz):>7}  br {len(br):>7}" if gz else ""
+        print(f"{name:<28} {raw:>7} -> {size:>7}{extra}  {built}")
+    print(f"{written} file(s) written to static/dist")
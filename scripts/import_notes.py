@@ -0,0 +1,322 @@
+"""Bulk-import notes from NDJSON or shell history.
+
+    python scripts/import_notes.py --user alice@example.com runbooks.ndjson
+    python scripts/import_notes.py --user 3 --format history ~/.bash_history
+
+The input is read lazily, one line at a time. Commands already owned by the
+user, or seen earlier in the input, are skipped (a set of 64-bit command
+hashes). Descriptions are sanitized in a process pool. Rows are written as
+chunked multi-row INSERTs, one transaction per chunk. Memory use depends on
+the chunk size and the number of distinct commands, never on the file size.
+
+Progress is saved after every chunk to ``<input>.import-state.json``.
+``--resume`` continues from the last committed chunk.
+"""
+import mysql.connector
+from mysql.connector import Error
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+
+# Add parent dir to path to import config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.config import Config
+from app.sanitize import render_note_html, SANITIZER_VERSION
+from app.search import build_search_text
+from app.stats import note_delta, apply_stats_delta
+from app.tags import set_notes_tags
+from app.notes import touch_collection, inserted_note_ids
+
+HISTORY_DESCRIPTION = "Imported from shell history"
+
+
+def get_db_connection():
+    try:
+        conn = mysql.connector.connect(
+            host=Config.DB_HOST,
+            user=Config.DB_USER,
+            password=Config.DB_PASSWORD,
+            database=Config.DB_NAME,
+            port=Config.DB_PORT
+        )
+        return conn
+    except Error as e:
+        print(f"Error connecting to DB: {e}")
+        sys.exit(1)
+
+
+def parse_ndjson(lines):
+    """Yield ``(end_offset, note)`` for each JSON object line; others are reported and skipped"""
+    for offset, line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError:
+            item = None
+        if not isinstance(item, dict) or not item.get("command"):
+            print(f"Skipping invalid line ending at byte {offset}")
+            continue
+        yield offset, {
+            "command": str(item["command"]).strip()[:255],
+            "description": str(item.get("description") or item["command"]),
+            "category": str(item.get("category") or "Other").strip()[:50] or "Other",
+            "example": str(item.get("example") or ""),
+            "tags": str(item.get("tags") or ""),
+        }
+
+
+def parse_history(lines, category, tags):
+    """Yield ``(end_offset, note)`` per command of a bash or zsh history file.
+
+    Skips bash timestamp lines (``#1700000000``), strips zsh extended-history
+    prefixes (``: 1700000000:0;``) and joins backslash-continued lines.
+    """
+    pending = []
+    for offset, line in lines:
+        line = line.rstrip("\n")
+        if not pending:
+            if line.startswith("#") and line[1:].isdigit():
+                continue
+            if line.startswith(": ") and ";" in line:
+                line = line.split(";", 1)[1]
+        if line.endswith("\\"):
+            pending.append(line[:-1])
+            continue
+        command = " ".join(pending + [line]).strip()
+        pending = []
+        if command:
+            yield offset, {
+                "command": command[:255],
+                "description": HISTORY_DESCRIPTION,
+                "category": category,
+                "example": "",
+                "tags": tags,
+            }
+
+
+def read_lines(path, start):
+    """Yield ``(end_offset, line)`` from byte ``start`` onwards"""
+    with open(path, "rb") as f:
+        f.seek(start)
+        offset = start
+        for raw in f:
+            offset += len(raw)
+            yield offset, raw.decode("utf-8", errors="replace")
+
+
+def command_key(command):
+    return int.from_bytes(hashlib.blake2b(command.encode(), digest_size=8).digest(), "big")
+
+
+def load_existing_keys(conn, user_id):
+    """Hashes of the commands the user already has, streamed from the server"""
+    keys = set()
+    cursor = conn.cursor(buffered=False)
+    cursor.execute("SELECT command FROM notes WHERE user_id = %s", (user_id,))
+    for (command,) in cursor:
+        keys.add(command_key(command.strip()))
+    cursor.close()
+    return keys
+
+
+def dedupe(records, seen, stats):
+    for offset, note in records:
+        key = command_key(note["command"])
+        if key in seen:
+            stats["duplicates"] += 1
+            continue
+        seen.add(key)
+        yield offset, note
+
+
+def chunked(records, size):
+    """Lists of up to ``size`` records; the last offset of a chunk is where to resume after it"""
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def sanitize_chunk(chunk):
+    """Runs in a pool worker"""
+    for _, note in chunk:
+        note["description_html"], note["example_html"] = render_note_html(note["description"], note["example"])
+    return chunk
+
+
+def insert_chunk(conn, user_id, chunk):
+    cursor = conn.cursor()
+    try:
+        notes = [note for _, note in chunk]
+        seq = touch_collection(cursor, user_id)
+        cursor.executemany(
+            """
+            INSERT INTO notes (command, description, description_html, category, example, example_html, tags,
+                               user_id, search_text, sanitizer_version, change_seq)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            """,
+            [(n["command"], n["description"], n["description_html"], n["category"], n["example"], n["example_html"],
+              n["tags"], user_id, build_search_text(n["command"], n["description_html"], n["example_html"], n["tags"]),
+              SANITIZER_VERSION, seq)
+             for n in notes]
+        )
+        note_ids = inserted_note_ids(cursor, user_id, seq, len(notes))
+        set_notes_tags(cursor, [(note_id, user_id, n["tags"]) for note_id, n in zip(note_ids, notes) if n["tags"]])
+        delta = Counter()
+        for n in notes:
+            delta.update(note_delta(new=(n["category"], n["tags"])))
+        apply_stats_delta(cursor, user_id, delta)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def load_state(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def save_state(path, state):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+
+USER_LOOKUPS = ("id", "email", "username")
+
+
+def resolve_user(conn, user):
+    """Owner id for ``--user``: tried as an id (if numeric), then an email, then a username.
+
+    ``id:``, ``email:`` or ``username:`` restricts it to one lookup. Raises
+    ValueError when nothing matches, or when the lookups find different users
+    (user 3 and a user named "3").
+    """
+    kind, sep, value = user.partition(":")
+    if sep and kind in USER_LOOKUPS:
+        lookups = [kind]
+    else:
+        lookups = (["id"] if user.isdigit() else []) + ["email", "username"]
+        value = user
+    if lookups == ["id"] and not value.isdigit():
+        raise ValueError(f"Not a user id: {value}")
+
+    cursor = conn.cursor()
+    matches = {}  # user id -> lookup that found it, in lookup order
+    for column in lookups:
+        cursor.execute(f"SELECT id FROM users WHERE {column} = %s", (int(value) if column == "id" else value,))
+        row = cursor.fetchone()
+        if row:
+            matches.setdefault(row[0], column)
+    cursor.close()
+
+    if not matches:
+        raise ValueError(f"No such user: {user}")
+    if len(matches) > 1:
+        found = ", ".join(f"{column} of user {user_id}" for user_id, column in matches.items())
+        raise ValueError(f"--user {user} is ambiguous ({found}); prefix it with id:, email: or username:")
+    return next(iter(matches))
+
+
+def run_import(args):
+    conn = get_db_connection()
+    try:
+        user_id = resolve_user(conn, args.user)
+    except ValueError as e:
+        print(e)
+        return 1
+
+    state_path = args.state or args.input + ".import-state.json"
+    state = {"input": os.path.abspath(args.input), "user_id": user_id, "offset": 0, "imported": 0}
+    if args.resume:
+        saved = load_state(state_path)
+        if saved:
+            if saved.get("input") != state["input"] or saved.get("user_id") != user_id:
+                print(f"{state_path} belongs to another import; remove it or pass --state")
+                return 1
+            state = saved
+            print(f"Resuming at byte {state['offset']} ({state['imported']} notes already imported)")
+
+    print("Loading existing commands...")
+    seen = load_existing_keys(conn, user_id)
+    stats = Counter()
+
+    lines = read_lines(args.input, state["offset"])
+    if args.format == "history":
+        records = parse_history(lines, args.category, args.tags)
+    else:
+        records = parse_ndjson(lines)
+    chunks = chunked(dedupe(records, seen, stats), args.chunk_size)
+
+    started = time.monotonic()
+    total_size = os.path.getsize(args.input) or 1
+
+    def write(chunk):
+        insert_chunk(conn, user_id, chunk)
+        state["offset"] = chunk[-1][0]
+        state["imported"] += len(chunk)
+        save_state(state_path, state)
+        rate = state["imported"] / max(time.monotonic() - started, 1e-6)
+        print(f"{state['offset'] * 100 // total_size:3d}%  imported {state['imported']}  "
+              f"duplicates {stats['duplicates']}  ({rate:.0f} notes/s)", flush=True)
+
+    try:
+        if args.workers <= 1:
+            for chunk in chunks:
+                write(sanitize_chunk(chunk))
+        else:
+            # Keep a bounded number of chunks in flight so memory stays flat;
+            # results are written in input order, so the saved offset is exact
+            with ProcessPoolExecutor(max_workers=args.workers) as pool:
+                in_flight = deque()
+                for chunk in chunks:
+                    in_flight.append(pool.submit(sanitize_chunk, chunk))
+                    if len(in_flight) >= args.workers * 2:
+                        write(in_flight.popleft().result())
+                while in_flight:
+                    write(in_flight.popleft().result())
+    except Error as e:
+        print(f"Import failed: {e}. Re-run with --resume to continue.")
+        return 1
+    finally:
+        conn.close()
+
+    if os.path.exists(state_path):
+        os.remove(state_path)
+    print(f"Import completed: {state['imported']} notes imported, {stats['duplicates']} duplicates skipped ✅")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk-import notes into DNotes")
+    parser.add_argument("input", help="NDJSON file (one note object per line) or shell history file")
+    parser.add_argument("--user", required=True, help="Owner: user id, email or username (id:, email: or username: to pick one)")
+    parser.add_argument("--format", choices=("ndjson", "history"), default="ndjson")
+    parser.add_argument("--category", default="Linux", help="Category of imported history commands")
+    parser.add_argument("--tags", default="history", help="Tags of imported history commands")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="Notes per INSERT/transaction")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Sanitizer processes (1 sanitizes inline)")
+    parser.add_argument("--resume", action="store_true", help="Continue from the saved state file")
+    parser.add_argument("--state", help="State file (default: <input>.import-state.json)")
+    args = parser.parse_args()
+
+    sys.exit(run_import(args))
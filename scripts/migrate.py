@@ -1,11 +1,16 @@
 import mysql.connector
 from mysql.connector import Error
+import argparse
 import os
 import sys
 
 # Add parent dir to path to import config
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from app.config import Config
+from app.db import MANAGED_INDEXES, check_query_plans
+from app.migrations import MIGRATIONS, LATEST_VERSION, apply_migrations, estimate_migrations, schema_version
+from app.stats import rebuild_note_stats
+from app.sanitize import SANITIZER_VERSION
 
 def get_db_connection():
     try:
@@ -21,298 +26,122 @@ def get_db_connection():
         print(f"Error connecting to DB: {e}")
         sys.exit(1)
 
-def run_migration():
+def run_migration(batch_size=None, sleep=None):
     print("Starting database migration...")
     conn = get_db_connection()
-    cursor = conn.cursor()
-
     try:
-        # 1. Create Users Table
-        print("Migrating 'users' table...")
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                username VARCHAR(80) NOT NULL,
-                email VARCHAR(120) NOT NULL,
-                password_hash VARCHAR(255) NOT NULL,
-                role VARCHAR(20) DEFAULT 'user',
-                api_token VARCHAR(64),
-                bio VARCHAR(300),
-                profile_picture VARCHAR(255),
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-
-        # Add bio column if it doesn't exist
-        cursor.execute("""
-            SELECT count(*) FROM information_schema.COLUMNS 
-            WHERE (TABLE_SCHEMA = %s) AND (TABLE_NAME = 'users') AND (COLUMN_NAME = 'bio')
-        """, (Config.DB_NAME,))
-        
-        if cursor.fetchone()[0] == 0:
-            print("Adding bio column to users...")
-            cursor.execute("ALTER TABLE users ADD COLUMN bio VARCHAR(300)")
-
-        # Add profile_picture column if it doesn't exist
-        cursor.execute("""
-            SELECT count(*) FROM information_schema.COLUMNS 
-            WHERE (TABLE_SCHEMA = %s) AND (TABLE_NAME = 'users') AND (COLUMN_NAME = 'profile_picture')
-        """, (Config.DB_NAME,))
-        
-        if cursor.fetchone()[0] == 0:
-            print("Adding profile_picture column to users...")
-            cursor.execute("ALTER TABLE users ADD COLUMN profile_picture VARCHAR(255)")
-
-        # Add api_token column if it doesn't exist
-        cursor.execute("""
-            SELECT count(*) FROM information_schema.COLUMNS 
-            WHERE (TABLE_SCHEMA = %s) AND (TABLE_NAME = 'users') AND (COLUMN_NAME = 'api_token')
-        """, (Config.DB_NAME,))
-        if cursor.fetchone()[0] == 0:
-            print("Adding api_token column to users...")
-            cursor.execute("ALTER TABLE users ADD COLUMN api_token VARCHAR(64)")
-
-        # Add role column if it doesn't exist
-        cursor.execute("""
-            SELECT count(*) FROM information_schema.COLUMNS 
-            WHERE (TABLE_SCHEMA = %s) AND (TABLE_NAME = 'users') AND (COLUMN_NAME = 'role')
-        """, (Config.DB_NAME,))
-        if cursor.fetchone()[0] == 0:
-            print("Adding role column to users...")
-            cursor.execute("ALTER TABLE users ADD COLUMN role VARCHAR(20) DEFAULT 'user'")
-
-        # Add created_at column if it doesn't exist
-        cursor.execute("""
-            SELECT count(*) FROM information_schema.COLUMNS 
-            WHERE (TABLE_SCHEMA = %s) AND (TABLE_NAME = 'users') AND (COLUMN_NAME = 'created_at')
-        """, (Config.DB_NAME,))
-        if cursor.fetchone()[0] == 0:
-            print("Adding created_at column to users...")
-            cursor.execute("ALTER TABLE users ADD COLUMN created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP")
-
-        # Ensure unique indexes for email and username
-        cursor.execute("""
-            SELECT COUNT(*) FROM INFORMATION_SCHEMA.STATISTICS
-            WHERE TABLE_SCHEMA = %s AND TABLE_NAME = 'users' AND COLUMN_NAME = 'email' AND NON_UNIQUE = 0
-        """, (Config.DB_NAME,))
-        if cursor.fetchone()[0] == 0:
-            cursor.execute("CREATE UNIQUE INDEX ux_users_email ON users (email)")
-
-        cursor.execute("""
-            SELECT COUNT(*) FROM INFORMATION_SCHEMA.STATISTICS
-            WHERE TABLE_SCHEMA = %s AND TABLE_NAME = 'users' AND COLUMN_NAME = 'username' AND NON_UNIQUE = 0
-        """, (Config.DB_NAME,))
-        if cursor.fetchone()[0] == 0:
-            cursor.execute("CREATE UNIQUE INDEX ux_users_username ON users (username)")
-
-        # 2. Create Categories Table
-        print("Migrating 'categories' table...")
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS categories (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                name VARCHAR(80) NOT NULL,
-                color VARCHAR(20) DEFAULT '#3b82f6',
-                is_system BOOLEAN DEFAULT FALSE
-            )
-        """)
-
-        # Ensure category columns exist (non-destructive)
-        cursor.execute("""
-            SELECT count(*) FROM information_schema.COLUMNS 
-            WHERE (TABLE_SCHEMA = %s) AND (TABLE_NAME = 'categories') AND (COLUMN_NAME = 'color')
-        """, (Config.DB_NAME,))
-        if cursor.fetchone()[0] == 0:
-            print("Adding color column to categories...")
-            cursor.execute("ALTER TABLE categories ADD COLUMN color VARCHAR(20) DEFAULT '#3b82f6'")
-
-        cursor.execute("""
-            SELECT count(*) FROM information_schema.COLUMNS 
-            WHERE (TABLE_SCHEMA = %s) AND (TABLE_NAME = 'categories') AND (COLUMN_NAME = 'is_system')
-        """, (Config.DB_NAME,))
-        if cursor.fetchone()[0] == 0:
-            print("Adding is_system column to categories...")
-            cursor.execute("ALTER TABLE categories ADD COLUMN is_system BOOLEAN DEFAULT FALSE")
-
-        # 3. Insert Default Categories (Idempotent)
-        # 3. Cleanup Duplicate Categories & Add Unique Constraint
-        print("Checking for duplicate categories...")
-        # Find duplicates: name -> [list of sub-ids]
-        cursor.execute("SELECT id, name FROM categories")
-        rows = cursor.fetchall()
-        cat_map = {}
-        for c_id, c_name in rows:
-            lower_name = c_name.strip().lower()
-            if lower_name not in cat_map:
-                cat_map[lower_name] = []
-            cat_map[lower_name].append(c_id)
-
-        duplicates_found = False
-        for name, ids in cat_map.items():
-            if len(ids) > 1:
-                duplicates_found = True
-                ids.sort()
-                keep_id = ids[0]
-                remove_ids = ids[1:]
-                print(f"Found duplicate category '{name}' (IDs: {ids}). Keeping {keep_id}, removing {remove_ids}")
-                
-                # Update notes to use the kept category ID (if notes used IDs, but they use names currently?)
-                # Wait, schema says: category VARCHAR(50). 
-                # If notes uses names, updates aren't needed for notes table directly, just categories table cleanup.
-                # BUT, if we change to IDs later, this would be important. 
-                # Currently: category VARCHAR(50). So notes table relies on the string. 
-                # So deleting the duplicate row in categories table is safe for the notes table as long as the NAME stays.
-                
-                # Delete duplicates
-                format_strings = ','.join(['%s'] * len(remove_ids))
-                cursor.execute(f"DELETE FROM categories WHERE id IN ({format_strings})", tuple(remove_ids))
-
-        if duplicates_found:
-             print("Duplicate categories cleaned up.")
-
-        # Add UNIQUE constraint
-        cursor.execute("""
-            SELECT COUNT(*) FROM INFORMATION_SCHEMA.STATISTICS
-            WHERE TABLE_SCHEMA = %s AND TABLE_NAME = 'categories' AND COLUMN_NAME = 'name' AND NON_UNIQUE = 0
-        """, (Config.DB_NAME,))
-        if cursor.fetchone()[0] == 0:
-             print("Adding UNIQUE constraint to categories(name)...")
-             try:
-                 cursor.execute("CREATE UNIQUE INDEX ux_categories_name ON categories (name)")
-             except Error as e:
-                 print(f"Warning: Could not add unique index: {e}")
-
-        # 4. Insert Default Categories (Idempotent with proper checking)
-        cursor.execute("SELECT name FROM categories")
-        existing_category_names = {row[0].strip().lower() for row in cursor.fetchall() if row[0]}
-
-        default_cats = [
-            ("Docker", "#3b82f6"),
-            ("Kubernetes", "#6366f1"),
-            ("Linux", "#22c55e"),
-            ("CI/CD", "#f59e0b"),
-            ("AWS", "#f97316"),
-            ("Monitoring", "#a855f7"),
-            ("Other", "#64748b")
-        ]
-
-        for name, color in default_cats:
-            if name.lower() not in existing_category_names:
-                try:
-                    cursor.execute(
-                        "INSERT INTO categories (name, color, is_system) VALUES (%s, %s, TRUE)",
-                        (name, color)
-                    )
-                except Error as e:
-                    # Ignore duplicate entry errors if they happen due to race conditions
-                    if e.errno == 1062:  # ER_DUP_ENTRY
-                        pass
-                    else:
-                         raise
-
-        # 4. Update Notes Table (Add missing columns)
-        print("Migrating 'notes' table schema...")
-
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS notes (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                command VARCHAR(255) NOT NULL,
-                description TEXT NOT NULL,
-                category VARCHAR(50),
-                example TEXT,
-                tags VARCHAR(500),
-                user_id INT,
-                is_public BOOLEAN DEFAULT FALSE,
-                public_id VARCHAR(36),
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-
-        # Add user_id column if missing
-        cursor.execute("""
-            SELECT count(*) FROM information_schema.COLUMNS 
-            WHERE (TABLE_SCHEMA = %s) AND (TABLE_NAME = 'notes') AND (COLUMN_NAME = 'user_id')
-        """, (Config.DB_NAME,))
-        if cursor.fetchone()[0] == 0:
-            print("Adding user_id column to notes...")
-            cursor.execute("ALTER TABLE notes ADD COLUMN user_id INT")
-
-        # Add is_public column if missing
-        cursor.execute("""
-            SELECT count(*) FROM information_schema.COLUMNS 
-            WHERE (TABLE_SCHEMA = %s) AND (TABLE_NAME = 'notes') AND (COLUMN_NAME = 'is_public')
-        """, (Config.DB_NAME,))
-        if cursor.fetchone()[0] == 0:
-            print("Adding is_public column to notes...")
-            cursor.execute("ALTER TABLE notes ADD COLUMN is_public BOOLEAN DEFAULT FALSE")
+        applied = apply_migrations(conn, batch_size=batch_size, sleep=sleep)
+        if not applied:
+            print(f"Schema already at version {LATEST_VERSION}")
+
+        # Rendered HTML left behind by an older sanitizer allowlist
+        cursor = conn.cursor()
+        cursor.execute("SELECT count(*) FROM notes WHERE sanitizer_version < %s", (SANITIZER_VERSION,))
+        stale = cursor.fetchone()[0]
+        cursor.close()
+        if stale:
+            print(f"{stale} note(s) have HTML from an older sanitizer; run scripts/resanitize_notes.py")
 
-        # Add public_id column if missing
-        cursor.execute("""
-            SELECT count(*) FROM information_schema.COLUMNS 
-            WHERE (TABLE_SCHEMA = %s) AND (TABLE_NAME = 'notes') AND (COLUMN_NAME = 'public_id')
-        """, (Config.DB_NAME,))
-        if cursor.fetchone()[0] == 0:
-            print("Adding public_id column to notes...")
-            cursor.execute("ALTER TABLE notes ADD COLUMN public_id VARCHAR(36)")
+        print("Migration completed successfully! ✅")
+    except Error as e:
+        print(f"Migration failed: {e}")
+        return 1
+    finally:
+        conn.close()
+    return 0
 
-        # Add created_at column if missing
-        cursor.execute("""
-            SELECT count(*) FROM information_schema.COLUMNS 
-            WHERE (TABLE_SCHEMA = %s) AND (TABLE_NAME = 'notes') AND (COLUMN_NAME = 'created_at')
-        """, (Config.DB_NAME,))
-        if cursor.fetchone()[0] == 0:
-            print("Adding created_at column to notes...")
-            cursor.execute("ALTER TABLE notes ADD COLUMN created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP")
+def run_dry_run(batch_size=None, sleep=None):
+    """List what a migration would do, with row estimates for backfills. Writes nothing."""
+    conn = get_db_connection()
+    try:
+        pending = estimate_migrations(conn, batch_size=batch_size, sleep=sleep)
+    except Error as e:
+        print(f"Dry run failed: {e}")
+        return 1
+    finally:
+        conn.close()
 
-        # Add example column if missing
-        cursor.execute("""
-            SELECT count(*) FROM information_schema.COLUMNS 
-            WHERE (TABLE_SCHEMA = %s) AND (TABLE_NAME = 'notes') AND (COLUMN_NAME = 'example')
-        """, (Config.DB_NAME,))
-        if cursor.fetchone()[0] == 0:
-            print("Adding example column to notes...")
-            cursor.execute("ALTER TABLE notes ADD COLUMN example TEXT")
+    if not pending:
+        print(f"Schema already at version {LATEST_VERSION}")
+    return 0
 
-        # Add tags column if missing
-        cursor.execute("""
-            SELECT count(*) FROM information_schema.COLUMNS 
-            WHERE (TABLE_SCHEMA = %s) AND (TABLE_NAME = 'notes') AND (COLUMN_NAME = 'tags')
-        """, (Config.DB_NAME,))
-        if cursor.fetchone()[0] == 0:
-            print("Adding tags column to notes...")
-            cursor.execute("ALTER TABLE notes ADD COLUMN tags VARCHAR(500)")
+def run_status():
+    """List applied and pending migrations; exit non-zero if any is pending."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        applied = {}
+        if schema_version(cursor):
+            cursor.execute("SELECT version, applied_at, duration_ms FROM schema_migrations")
+            applied = {row[0]: row[1:] for row in cursor.fetchall()}
+    finally:
+        cursor.close()
+        conn.close()
 
-        # Add category column if missing
-        cursor.execute("""
-            SELECT count(*) FROM information_schema.COLUMNS 
-            WHERE (TABLE_SCHEMA = %s) AND (TABLE_NAME = 'notes') AND (COLUMN_NAME = 'category')
-        """, (Config.DB_NAME,))
-        if cursor.fetchone()[0] == 0:
-            print("Adding category column to notes...")
-            cursor.execute("ALTER TABLE notes ADD COLUMN category VARCHAR(50)")
+    for version, name, _ in MIGRATIONS:
+        if version in applied:
+            applied_at, duration_ms = applied[version]
+            print(f"{version:>4}  applied {applied_at} ({duration_ms} ms)  {name}")
+        else:
+            print(f"{version:>4}  pending  {name}")
+    return 0 if all(version in applied for version, _, _ in MIGRATIONS) else 1
 
-        # Ensure foreign key exists (best-effort)
-        cursor.execute("""
-            SELECT CONSTRAINT_NAME
-            FROM INFORMATION_SCHEMA.KEY_COLUMN_USAGE
-            WHERE TABLE_SCHEMA = %s AND TABLE_NAME = 'notes'
-              AND COLUMN_NAME = 'user_id' AND REFERENCED_TABLE_NAME = 'users'
-        """, (Config.DB_NAME,))
-        if cursor.fetchone() is None:
-            try:
-                cursor.execute("ALTER TABLE notes ADD CONSTRAINT fk_notes_users FOREIGN KEY (user_id) REFERENCES users(id)")
-            except Error:
-                # Ignore if constraint already exists with a different name or if data is inconsistent
-                pass
+def run_plan_check():
+    """EXPLAIN the hot note queries; exit non-zero if any regressed to a full scan."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        problems = check_query_plans(cursor)
+    finally:
+        cursor.close()
+        conn.close()
 
-        conn.commit()
-        print("Migration completed successfully! ✅")
+    if not problems:
+        print(f"Query plans OK (managed indexes: {', '.join(i[0] for i in MANAGED_INDEXES)})")
+        return 0
+    for label, plan in problems:
+        print(f"Query plan regression in '{label}': type={plan.get('type')} key={plan.get('key')} extra={plan.get('Extra')}")
+    return 1
 
-    except Error as e:
-        print(f"Migration failed: {e}")
-        conn.rollback()
+def run_stats_check(fix=False):
+    """Compare the dashboard counters with the notes; exit non-zero on drift unless fixed."""
+    conn = get_db_connection()
+    try:
+        mismatched = rebuild_note_stats(conn, fix=fix)
     finally:
-        cursor.close()
         conn.close()
 
+    if not mismatched:
+        print("Dashboard stats are consistent")
+        return 0
+    action = "Rebuilt" if fix else "Inconsistent"
+    print(f"{action} dashboard stats for {len(mismatched)} user(s): {', '.join(map(str, mismatched))}")
+    return 0 if fix else 1
+
 if __name__ == "__main__":
-    run_migration()
+    parser = argparse.ArgumentParser(description="DNotes schema migrations")
+    parser.add_argument("--status", action="store_true",
+                        help="List applied and pending migrations and fail if any is pending")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="List pending migrations with row estimates for backfills, without applying them")
+    parser.add_argument("--batch-size", type=int, default=None,
+                        help=f"Primary keys per backfill transaction (default {Config.MIGRATION_BATCH_SIZE})")
+    parser.add_argument("--sleep", type=float, default=None,
+                        help=f"Seconds to pause between backfill batches (default {Config.MIGRATION_BATCH_SLEEP})")
+    parser.add_argument("--check-plans", action="store_true",
+                        help="EXPLAIN the hot queries and fail if any does a full scan")
+    parser.add_argument("--check-stats", action="store_true",
+                        help="Compare the dashboard counters with the notes and fail on drift")
+    parser.add_argument("--rebuild-stats", action="store_true",
+                        help="Recompute the dashboard counters of users whose counts drifted")
+    args = parser.parse_args()
+
+    if args.status:
+        sys.exit(run_status())
+    if args.dry_run:
+        sys.exit(run_dry_run(args.batch_size, args.sleep))
+    if args.check_plans:
+        sys.exit(run_plan_check())
+    if args.check_stats or args.rebuild_stats:
+        sys.exit(run_stats_check(fix=args.rebuild_stats))
+    sys.exit(run_migration(args.batch_size, args.sleep))
@@ -0,0 +1,159 @@
+"""Re-render the stored HTML of notes sanitized by an older allowlist.
+
+    python scripts/resanitize_notes.py
+    python scripts/resanitize_notes.py --workers 4 --batch-size 200
+
+Only rows whose ``sanitizer_version`` is older than SANITIZER_VERSION are
+read, in id order, and sanitized from their submitted text in a process
+pool. Each batch is written in one transaction. Rows edited meanwhile were
+rendered by the current sanitizer already and are left alone. Notes whose
+HTML actually changed get a new version and change sequence, so public page
+caches and delta-sync clients pick up the new rendering. The job can be
+interrupted and re-run at any time.
+"""
+import mysql.connector
+from mysql.connector import Error
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import os
+import sys
+import time
+
+# Add parent dir to path to import config
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.config import Config
+from app.sanitize import render_note_html, SANITIZER_VERSION
+from app.search import build_search_text
+from app.notes import touch_collection
+
+
+def get_db_connection():
+    try:
+        conn = mysql.connector.connect(
+            host=Config.DB_HOST,
+            user=Config.DB_USER,
+            password=Config.DB_PASSWORD,
+            database=Config.DB_NAME,
+            port=Config.DB_PORT
+        )
+        return conn
+    except Error as e:
+        print(f"Error connecting to DB: {e}")
+        sys.exit(1)
+
+
+def stale_batches(conn, batch_size):
+    """Lists of stale rows, read lazily with a keyset on id"""
+    cursor = conn.cursor(dictionary=True)
+    last_id = 0
+    try:
+        while True:
+            cursor.execute(
+                """
+                SELECT id, user_id, command, description, example, tags, description_html, example_html
+                FROM notes WHERE id > %s AND sanitizer_version < %s
+                ORDER BY id LIMIT %s
+                """,
+                (last_id, SANITIZER_VERSION, batch_size)
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                return
+            last_id = rows[-1]["id"]
+            yield rows
+    finally:
+        cursor.close()
+
+
+def render_batch(rows):
+    """Runs in a pool worker"""
+    for row in rows:
+        html = render_note_html(row["description"], row["example"])
+        row["changed"] = html != (row["description_html"] or "", row["example_html"] or "")
+        row["description_html"], row["example_html"] = html
+    return rows
+
+
+def write_batch(conn, rows):
+    """Store a rendered batch. Returns the number of notes whose HTML changed."""
+    changed = [row for row in rows if row["changed"]]
+    unchanged = [row for row in rows if not row["changed"]]
+    cursor = conn.cursor()
+    try:
+        # Same lock order as every note write: the owners' rows, then the notes
+        seqs = {}
+        for user_id in sorted({row["user_id"] for row in changed if row["user_id"] is not None}):
+            seqs[user_id] = touch_collection(cursor, user_id)
+
+        if changed:
+            cursor.executemany(
+                """
+                UPDATE notes SET description_html = %s, example_html = %s, search_text = %s,
+                    sanitizer_version = %s, version = version + 1, change_seq = %s
+                WHERE id = %s AND sanitizer_version < %s
+                """,
+                [(row["description_html"], row["example_html"],
+                  build_search_text(row["command"], row["description_html"], row["example_html"], row["tags"]),
+                  SANITIZER_VERSION, seqs.get(row["user_id"], 0), row["id"], SANITIZER_VERSION)
+                 for row in changed]
+            )
+        if unchanged:
+            cursor.executemany(
+                "UPDATE notes SET sanitizer_version = %s, updated_at = updated_at WHERE id = %s AND sanitizer_version < %s",
+                [(SANITIZER_VERSION, row["id"], SANITIZER_VERSION) for row in unchanged]
+            )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    return len(changed)
+
+
+def run(args):
+    conn = get_db_connection()
+    batches = stale_batches(conn, args.batch_size)
+    totals = {"checked": 0, "changed": 0}
+    started = time.monotonic()
+
+    def write(rows):
+        totals["changed"] += write_batch(conn, rows)
+        totals["checked"] += len(rows)
+        rate = totals["checked"] / max(time.monotonic() - started, 1e-6)
+        print(f"checked {totals['checked']}  re-rendered {totals['changed']}  ({rate:.0f} notes/s)", flush=True)
+
+    try:
+        if args.workers <= 1:
+            for rows in batches:
+                write(render_batch(rows))
+        else:
+            # A bounded window of batches in flight, written in id order
+            with ProcessPoolExecutor(max_workers=args.workers) as pool:
+                in_flight = deque()
+                for rows in batches:
+                    in_flight.append(pool.submit(render_batch, rows))
+                    if len(in_flight) >= args.workers * 2:
+                        write(in_flight.popleft().result())
+                while in_flight:
+                    write(in_flight.popleft().result())
+    except Error as e:
+        print(f"Re-sanitizing failed: {e}. Re-run to continue.")
+        return 1
+    finally:
+        conn.close()
+
+    print(f"Sanitizer v{SANITIZER_VERSION}: {totals['checked']} note(s) checked, "
+          f"{totals['changed']} re-rendered ✅")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-sanitize notes rendered by an older sanitizer")
+    parser.add_argument("--batch-size", type=int, default=500, help="Notes per read/transaction")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Sanitizer processes (1 sanitizes inline)")
+    args = parser.parse_args()
+
+    sys.exit(run(args))
@@ -0,0 +1,86 @@
+"""Local SMTP stand-in that prints the mail it receives.
+
+    python scripts/smtp_sink.py --port 1025
+    python scripts/smtp_sink.py --port 1025 --fail-every 3   # 421 on every 3rd message
+
+Point the app at it with ``SMTP_HOST=localhost SMTP_PORT=1025
+SMTP_USE_TLS=false`` to try password reset mail without a real relay.
+Supports the plain SMTP dialogue smtplib uses (no STARTTLS or AUTH), keeps
+connections open across messages and logs each session, so reuse and
+retries of the background mail queue (app/mail.py) can be watched.
+"""
+import argparse
+import itertools
+import socketserver
+import time
+
+_messages = itertools.count(1)
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        peer = "%s:%s" % self.client_address
+        print(f"[{peer}] connected")
+        self.reply("220 smtp-sink ready")
+        sender, recipients = None, []
+        for raw in self.rfile:
+            line = raw.decode(errors="replace").rstrip("\r\n")
+            verb = line[:4].upper()
+            if verb in ("EHLO", "HELO"):
+                self.reply("250 smtp-sink")
+            elif verb == "MAIL":
+                sender, recipients = line[10:].strip(), []
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                recipients.append(line[8:].strip())
+                self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                body = []
+                for data in self.rfile:
+                    data = data.decode(errors="replace").rstrip("\r\n")
+                    if data == ".":
+                        break
+                    body.append(data[1:] if data.startswith("..") else data)
+                number = next(_messages)
+                if self.server.fail_every and number % self.server.fail_every == 0:
+                    print(f"[{peer}] message {number}: answering 421 (simulated failure)")
+                    self.reply("421 Try again later")
+                    break
+                print(f"[{peer}] message {number} from {sender} to {', '.join(recipients)}")
+                print("\n".join(body))
+                print("-" * 60)
+                self.reply("250 OK queued")
+            elif verb == "RSET":
+                sender, recipients = None, []
+                self.reply("250 OK")
+            elif verb == "NOOP":
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                break
+            else:
+                self.reply("502 Command not implemented")
+        print(f"[{peer}] closed")
+
+
+class SMTPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Print mail sent to a local SMTP port")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1025)
+    parser.add_argument("--fail-every", type=int, default=0,
+                        help="Answer 421 and hang up on every Nth message (0: never)")
+    args = parser.parse_args()
+
+    with SMTPServer((args.host, args.port), SMTPHandler) as server:
+        server.fail_every = args.fail_every
+        print(f"SMTP sink listening on {args.host}:{args.port} ({time.strftime('%H:%M:%S')})")
+        server.serve_forever()
@@ -119,9 +119,8 @@ if (searchInput) {
     const searchTerm = e.target.value.toLowerCase();
     
     if (document.getElementById("notesGrid")) {
-        // Dashboard: Filter
-        filterNotes(searchTerm, currentCategory);
-        updateNotesCount();
+        // Dashboard: server-side full-text search
+        searchNotes(this.value);
     } else {
         // Other Pages: Local Find
         performLocalFind(this.value);
@@ -191,8 +190,7 @@ if (searchClear) {
     if (searchWrapper) {
       searchWrapper.classList.remove("has-clear");
     }
-    filterNotes("", currentCategory);
-    updateNotesCount();
+    searchNotes("");
   });
 }
 
@@ -207,9 +205,7 @@ filterButtons.forEach((button) => {
     this.classList.add("active");
 
     currentCategory = this.getAttribute("data-category");
-    const searchTerm = searchInput ? searchInput.value.toLowerCase() : "";
-    filterNotes(searchTerm, currentCategory);
-    updateNotesCount();
+    loadNotes(true);
   });
 });
 
@@ -231,37 +227,121 @@ if (resetFiltersBtn) {
       searchClear.style.display = "none";
     }
 
-    filterNotes("", currentCategory);
-    updateNotesCount();
+    searchNotes("");
   });
 }
 
+// Clicking a tag filters on it exactly (server-side, via note_tags); typing
+// over the "#tag" in the search box turns it back into a text search
+let currentTag = null;
+
+function searchForTag(tagText) {
+  if (searchInput) {
+    currentTag = tagText;
+    tagText = "#" + tagText;
+    searchInput.value = tagText;
+    searchClear.style.display = "block";
+    searchNotes(tagText);
+  }
+}
+
 // Tag cloud click handler
 document.querySelectorAll(".tag-cloud-tag").forEach((tag) => {
   tag.addEventListener("click", function () {
-    const tagText = this.getAttribute("data-tag");
-    if (searchInput) {
-      searchInput.value = tagText;
-      searchClear.style.display = "block";
-      filterNotes(tagText.toLowerCase(), currentCategory);
-      updateNotesCount();
-    }
+    searchForTag(this.getAttribute("data-tag"));
   });
 });
 
-// Tag click in cards
-document.querySelectorAll(".tag").forEach((tag) => {
-  tag.addEventListener("click", function () {
-    const tagText = this.getAttribute("data-tag");
-    if (searchInput) {
-      searchInput.value = tagText;
-      searchClear.style.display = "block";
-      filterNotes(tagText.toLowerCase(), currentCategory);
-      updateNotesCount();
-    }
-  });
+// Tag click in cards (delegated: cards are replaced by server-side search)
+document.getElementById("notesGrid")?.addEventListener("click", function (e) {
+  const tag = e.target.closest(".tag");
+  if (tag) {
+    searchForTag(tag.getAttribute("data-tag"));
+  }
 });
 
+// Dashboard listing: cards are rendered server-side one page at a time
+// (keyset pagination). Search (full-text, ranked by relevance) and the
+// category filter are applied by the server; further pages load on demand.
+let searchTimer = null;
+let searchController = null;
+
+function searchNotes(term) {
+  clearTimeout(searchTimer);
+  searchTimer = setTimeout(() => loadNotes(true), 200);
+}
+
+function loadNotes(reset) {
+  const grid = document.getElementById("notesGrid");
+  if (!grid || !grid.dataset.searchUrl) return;
+  if (!reset && !grid.dataset.nextCursor) return;
+
+  if (searchController) {
+    if (!reset) return; // a page is already on its way
+    searchController.abort();
+  }
+  const controller = new AbortController();
+  searchController = controller;
+
+  let term = searchInput ? searchInput.value.trim() : "";
+  if (currentTag && term !== "#" + currentTag) currentTag = null;
+  if (currentTag) term = "";
+  const params = new URLSearchParams({ q: term });
+  if (currentTag) params.set("tag", currentTag);
+  if (currentCategory !== "all") params.set("category", currentCategory);
+  if (!reset) params.set("after", grid.dataset.nextCursor);
+
+  fetch(grid.dataset.searchUrl + "?" + params.toString(), {
+    signal: controller.signal,
+    headers: { "X-Requested-With": "fetch" },
+  })
+    .then((response) => {
+      if (!response.ok) return Promise.reject(response.status);
+      grid.dataset.nextCursor = response.headers.get("X-Next-Cursor") || "";
+      return response.text();
+    })
+    .then((html) => {
+      if (reset) {
+        grid.innerHTML = html;
+      } else {
+        grid.insertAdjacentHTML("beforeend", html);
+      }
+      // Keep the server's relevance order for search results
+      if (!term) sortNotes(currentSort);
+      updateNotesCount();
+      updateLoadMore();
+    })
+    .catch((err) => {
+      if (err && err.name === "AbortError") return;
+      // Fall back to filtering the cards already on the page
+      filterNotes((params.get("tag") || term).toLowerCase(), currentCategory);
+      updateNotesCount();
+    })
+    .finally(() => {
+      if (searchController === controller) searchController = null;
+    });
+}
+
+const loadMoreBtn = document.getElementById("loadMoreNotes");
+
+function updateLoadMore() {
+  const grid = document.getElementById("notesGrid");
+  if (loadMoreBtn && grid) {
+    loadMoreBtn.style.display = grid.dataset.nextCursor ? "" : "none";
+  }
+}
+
+if (loadMoreBtn) {
+  loadMoreBtn.addEventListener("click", () => loadNotes(false));
+
+  // Fetch the next page as the button scrolls into view
+  if ("IntersectionObserver" in window) {
+    new IntersectionObserver((entries) => {
+      if (entries.some((entry) => entry.isIntersecting)) loadNotes(false);
+    }, { rootMargin: "400px" }).observe(loadMoreBtn);
+  }
+}
+
 function filterNotes(searchTerm, category) {
   const cards = document.querySelectorAll(".feature-card");
 
@@ -500,9 +580,8 @@ document.addEventListener("DOMContentLoaded", function () {
   
   if (searchParam && searchInput) {
       searchInput.value = searchParam;
-      // Trigger filter if on dashboard
+      // Dashboard results were already searched server-side
       if (document.getElementById("notesGrid")) {
-          filterNotes(searchParam.toLowerCase(), currentCategory);
           // Show clear button
           if (searchClear) {
               searchClear.style.display = "block";